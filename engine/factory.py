@@ -95,7 +95,7 @@ class EngineFactory(IBus.Factory):
                     m17n_ime_name = match.group('name')
                     user_db_file = f'user-{m17n_ime_lang}-{m17n_ime_name}.db'
                 self.database = tabsqlitedb.TabSqliteDb(
-                    user_db_file=user_db_file)
+                    user_db_file=user_db_file, ngram_model=True)
                 self.database_dict[engine_name] = self.database
             if engine_name in self.enginedict:
                 engine = self.enginedict[engine_name]
@@ -132,4 +132,5 @@ class EngineFactory(IBus.Factory):
         for key, database in self.database_dict.items():
             LOGGER.info('Syncing %s %s', key, database)
             database.sync_usrdb()
+            database.set_use_threads(False)
         super().destroy()
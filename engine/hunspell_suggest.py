@@ -27,12 +27,27 @@ from typing import Optional
 from typing import Dict
 from typing import Tuple
 from typing import List
+from typing import Sequence
+from typing import Union
+from typing import overload
 from typing import Iterable
+from typing import Iterator
+from typing import Callable
+from typing import Set
 from typing import Any
 import os
 import sys
+import time
 import unicodedata
 import functools
+import itertools
+import collections
+import bisect
+import heapq
+import array
+import zlib
+import threading
+import concurrent.futures
 import logging
 import itb_util_core
 
@@ -69,6 +84,471 @@ except ImportError:
 # letter of a word until the candidate lookup table pops up.
 MAX_WORDS = 100
 
+# Maximum number of spellcheck results cached per dictionary.
+# Spellchecking the same candidates again and again while typing
+# is very common, the lookup table is redrawn on every keystroke.
+SPELLCHECK_CACHE_SIZE = 20_000
+
+# Ranges of the prefix index with at least this many words (the
+# ranges of short prefixes) keep their ranked completions,
+# see Dictionary.ranked_completions(). Ranking a smaller range
+# from scratch on every keystroke is fast enough:
+RANKED_COMPLETIONS_CACHE_MIN_RANGE = 1000
+
+def load_wordlist(name: str) -> Tuple[str, str, List[str], List[str], int]:
+    '''Load the word list of a dictionary
+
+    :param name: The name of the dictionary
+    :return: A tuple (dic_path, dictionary_encoding, words,
+             stripped_words, max_word_len), see
+             itb_util_core.get_hunspell_dictionary_wordlist_cached()
+
+    The word list, the accent stripped words and the maximum
+    word length are read from a cache in ~/.cache if possible.
+    '''
+    start_time = time.monotonic()
+    wordlist = itb_util_core.get_hunspell_dictionary_wordlist_cached(
+        name, keep=itb_util_core.ACCENT_LANGUAGES.get(name.split('_')[0]))
+    LOGGER.info('Word list of %s loaded in %.3f seconds.',
+                name, time.monotonic() - start_time)
+    return wordlist
+
+def edit_distance(string1: str, string2: str, max_distance: int) -> int:
+    '''Return the edit distance between two strings
+
+    The optimal string alignment distance is used, i.e. a
+    transposition of two adjacent characters counts as one edit.
+
+    :param string1: The first string
+    :param string2: The second string
+    :param max_distance: Stop computing when the distance is known
+                         to be bigger than this
+    :return: The distance or max_distance + 1 if the distance is
+             bigger than max_distance.
+
+    Examples:
+
+    >>> edit_distance('kissa', 'kisssa', 2)
+    1
+    >>> edit_distance('ksisa', 'kissa', 2)
+    1
+    >>> edit_distance('kissa', 'kissa', 2)
+    0
+    >>> edit_distance('abc', 'xyzabc', 2)
+    3
+    '''
+    if abs(len(string1) - len(string2)) > max_distance:
+        return max_distance + 1
+    # Common beginnings and endings do not change the distance,
+    # removing them first makes the rest much faster:
+    start = 0
+    length = min(len(string1), len(string2))
+    while start < length and string1[start] == string2[start]:
+        start += 1
+    end = 0
+    length -= start
+    while end < length and string1[-1 - end] == string2[-1 - end]:
+        end += 1
+    string1 = string1[start:len(string1) - end]
+    string2 = string2[start:len(string2) - end]
+    if not string1 or not string2:
+        return min(len(string1) + len(string2), max_distance + 1)
+    previous_previous_row: List[int] = []
+    previous_row = list(range(len(string2) + 1))
+    previous_char1 = ''
+    # Comparing directly instead of using min() is much faster here:
+    # pylint: disable=consider-using-min-builtin
+    for i, char1 in enumerate(string1, start=1):
+        row = [i]
+        previous_char2 = ''
+        row_minimum = i
+        for j, char2 in enumerate(string2, start=1):
+            cost = previous_row[j - 1] + (char1 != char2)
+            insertion = row[j - 1] + 1
+            if insertion < cost:
+                cost = insertion
+            deletion = previous_row[j] + 1
+            if deletion < cost:
+                cost = deletion
+            if (char1 == previous_char2
+                and previous_char1 == char2
+                and i > 1 and j > 1):
+                transposition = previous_previous_row[j - 2] + 1
+                if transposition < cost:
+                    cost = transposition
+            row.append(cost)
+            if cost < row_minimum:
+                row_minimum = cost
+            previous_char2 = char2
+        if row_minimum > max_distance:
+            return max_distance + 1
+        previous_previous_row = previous_row
+        previous_row = row
+        previous_char1 = char1
+    return min(previous_row[-1], max_distance + 1)
+
+class CorrectionIndex:
+    '''Finds spelling corrections quickly using precomputed deletes
+
+    This uses the symmetric delete approach of SymSpell: All strings
+    which can be produced by deleting up to max_distance characters
+    from the beginning (the first prefix_length characters) of a word
+    are stored in an index. To find corrections for an input, the same
+    kind of deletes are produced from the input and looked up in the
+    index. The candidates found are then checked by computing the
+    real edit distance.
+
+    To save memory, the index does not store the delete strings, only
+    a 32 bit hash of each delete string and the number of the word, in
+    two arrays sorted by the hash. Hash collisions can only add
+    candidates which are then rejected by the edit distance check.
+    '''
+    def __init__(
+            self,
+            words: Sequence[str],
+            max_distance: int = 2,
+            prefix_length: int = 7) -> None:
+        '''The index is empty until build() or set_index_arrays()
+        is called.
+
+        :param words: The words of the dictionary
+        :param max_distance: The maximum edit distance of corrections
+        :param prefix_length: The number of characters at the beginning
+                              of the words used to build the index
+        '''
+        self._words = words
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._hashes = array.array('I')
+        self._word_numbers = array.array('I')
+
+    def parameters(self) -> Dict[str, Any]:
+        '''Returns the parameters which determine the contents of the
+        index, a cached index is only valid if these are the same.
+        '''
+        return {'correction_index_version': 1,
+                'max_distance': self.max_distance,
+                'prefix_length': self.prefix_length,
+                'word_count': len(self._words)}
+
+    def _deletes(self, string: str) -> Set[str]:
+        '''Returns the strings produced by deleting up to
+        self.max_distance characters from the beginning of string
+
+        :param string: The (casefolded) string to produce deletes for
+        :return: The set of deletes, including the unchanged beginning
+                 of string
+        '''
+        string = string[:self.prefix_length]
+        deletes = {string}
+        edge = {string}
+        for _distance in range(self.max_distance):
+            edge = {
+                delete[:i] + delete[i + 1:]
+                for delete in edge
+                for i in range(len(delete))}
+            deletes |= edge
+        return deletes
+
+    @staticmethod
+    def _hash(string: str) -> int:
+        '''Returns a hash of a string which is stable across processes'''
+        return zlib.crc32(string.encode('UTF-8'))
+
+    def build(self) -> None:
+        '''Build the index from the words'''
+        start_time = time.monotonic()
+        entries = array.array('Q')
+        for number, word in enumerate(self._words):
+            for delete in self._deletes(word.casefold()):
+                entries.append(self._hash(delete) << 32 | number)
+        sorted_entries = sorted(entries)
+        del entries
+        self._hashes = array.array(
+            'I', (entry >> 32 for entry in sorted_entries))
+        self._word_numbers = array.array(
+            'I', (entry & 0xFFFFFFFF for entry in sorted_entries))
+        LOGGER.info(
+            'Correction index with %s entries for %s words '
+            'built in %.3f seconds.',
+            len(self._hashes), len(self._words),
+            time.monotonic() - start_time)
+
+    def index_arrays(self) -> Tuple['array.array[int]', 'array.array[int]']:
+        '''Returns the arrays of hashes and word numbers'''
+        return (self._hashes, self._word_numbers)
+
+    def set_index_arrays(
+            self,
+            hashes: 'array.array[int]',
+            word_numbers: 'array.array[int]') -> None:
+        '''Use arrays of hashes and word numbers built before
+
+        :param hashes: The hashes of the deletes, sorted
+        :param word_numbers: The numbers of the words for each hash
+        '''
+        self._hashes = hashes
+        self._word_numbers = word_numbers
+
+    def corrections(self, word: str, max_results: int = 10) -> List[str]:
+        '''Returns corrections for a word
+
+        :param word: The possibly misspelled word
+        :param max_results: The maximum number of corrections to return
+        :return: The words of the dictionary within the maximum edit
+                 distance from word (ignoring case), the closest first.
+
+        Examples:
+
+        >>> index = CorrectionIndex(['kissa', 'kissat', 'koira', 'talo'])
+        >>> index.build()
+        >>> index.corrections('ksisa')
+        ['kissa', 'koira', 'kissat']
+        >>> index.corrections('Koria')
+        ['koira']
+        >>> index.corrections('xyz')
+        []
+        '''
+        query = word.casefold()
+        candidates: Set[int] = set()
+        for delete in self._deletes(query):
+            key = self._hash(delete)
+            start = bisect.bisect_left(self._hashes, key)
+            end = bisect.bisect_right(self._hashes, key, start)
+            candidates.update(self._word_numbers[start:end])
+        results: List[Tuple[int, int, str]] = []
+        for number in candidates:
+            candidate = self._words[number]
+            distance = edit_distance(
+                query, candidate.casefold(), self.max_distance)
+            if distance <= self.max_distance:
+                results.append(
+                    (distance, abs(len(candidate) - len(word)), candidate))
+        return [candidate for (_distance, _length_difference, candidate)
+                in sorted(results)[:max_results]]
+
+class CompactWordList(Sequence[str]):
+    '''A read only list of words stored in one contiguous UTF-8 buffer
+
+    A Python list of str objects needs about 50-80 bytes of overhead
+    per word (the str object header plus the pointer in the list).
+    For dictionaries with hundreds of thousands of words this adds up
+    to tens of megabytes. Here the words are stored as one bytes
+    object, each word terminated by a newline, plus an array with the
+    offsets of the words, i.e. about 5 bytes of overhead per word.
+    Words are decoded when they are accessed, a slice of consecutive
+    words is decoded at once.
+
+    Examples:
+
+    >>> words = CompactWordList(['kissa', 'pää', '', 'talo'])
+    >>> len(words)
+    4
+    >>> words[1]
+    'pää'
+    >>> words[-1]
+    'talo'
+    >>> words[1:3]
+    ['pää', '']
+    >>> words[3:1]
+    []
+    >>> words[::2]
+    ['kissa', '']
+    >>> list(words)
+    ['kissa', 'pää', '', 'talo']
+    '''
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        '''
+        :param words: The words to store, they must not contain newlines
+        '''
+        encoded_words = [word.encode('UTF-8') + b'\n' for word in words]
+        self._offsets: 'array.array[int]' = array.array('I', [0])
+        self._offsets.extend(
+            itertools.accumulate(len(word) for word in encoded_words))
+        self._buffer = b''.join(encoded_words)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        offsets = self._offsets
+        if isinstance(index, slice):
+            (start, stop, step) = index.indices(len(offsets) - 1)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            if start >= stop:
+                return []
+            return self._buffer[
+                offsets[start]:offsets[stop] - 1].decode('UTF-8').split('\n')
+        if index < 0:
+            index += len(offsets) - 1
+            if index < 0:
+                raise IndexError('CompactWordList index out of range')
+        # Raises IndexError if index is too big:
+        return self._buffer[
+            offsets[index]:offsets[index + 1] - 1].decode('UTF-8')
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self[:])
+
+class CompactWordPairs(Sequence[Tuple[str, str]]):
+    '''A read only list of (word, stripped word) tuples
+
+    Most words of a dictionary do not change when the accents are
+    stripped, therefore the stripped words are stored only where they
+    differ from the words, together with the sorted positions of these
+    words.
+
+    Examples:
+
+    >>> words = CompactWordList(['kissa', 'café', 'pää'])
+    >>> pairs = CompactWordPairs(words, ['kissa', 'cafe', 'pää'])
+    >>> list(pairs)
+    [('kissa', 'kissa'), ('café', 'cafe'), ('pää', 'pää')]
+    >>> pairs[1]
+    ('café', 'cafe')
+    >>> pairs.stripped(2)
+    'pää'
+    '''
+    def __init__(
+            self,
+            words: Sequence[str],
+            stripped_words: Iterable[str]) -> None:
+        self._words = words
+        self._positions: 'array.array[int]' = array.array('I')
+        differing_words: List[str] = []
+        for position, (word, stripped) in enumerate(
+                zip(words, stripped_words)):
+            if stripped != word:
+                self._positions.append(position)
+                differing_words.append(stripped)
+        self._stripped_words = CompactWordList(differing_words)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def stripped(self, index: int) -> str:
+        '''Returns the stripped word at a position
+
+        :param index: The position of the word
+        '''
+        if index < 0:
+            index += len(self)
+        position = bisect.bisect_left(self._positions, index)
+        if (position < len(self._positions)
+            and self._positions[position] == index):
+            return self._stripped_words[position]
+        return self._words[index]
+
+    @overload
+    def __getitem__(self, index: int) -> Tuple[str, str]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Tuple[str, str]]: ...
+
+    def __getitem__(
+            self,
+            index: Union[int, slice]) -> Union[
+                Tuple[str, str], List[Tuple[str, str]]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return (self._words[index], self.stripped(index))
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        differing = zip(self._positions, self._stripped_words)
+        (position, stripped) = next(differing, (-1, ''))
+        for index, word in enumerate(self._words):
+            if index == position:
+                yield (word, stripped)
+                (position, stripped) = next(differing, (-1, ''))
+            else:
+                yield (word, word)
+
+class PermutedWordList(Sequence[str]):
+    '''A read only view of a word list in a different order
+
+    Used for the prefix index of dictionaries with compact storage,
+    see Dictionary.set_compact_storage(). Instead of a second list
+    of words in sorted order, only the order is stored.
+
+    Examples:
+
+    >>> words = CompactWordList(['talo', 'kissa', 'auto'])
+    >>> view = PermutedWordList(words.__getitem__, array.array('I', [2, 1, 0]))
+    >>> list(view)
+    ['auto', 'kissa', 'talo']
+    >>> view[1:]
+    ['kissa', 'talo']
+    '''
+    def __init__(
+            self,
+            get_word: Callable[[int], str],
+            order: 'array.array[int]') -> None:
+        '''
+        :param get_word: Function returning the word at a position
+                         of the original word list
+        :param order: The positions in the original word list in
+                      the order of this view
+        '''
+        self._get_word = get_word
+        self._order = order
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self._get_word(position) for position in self._order[index]]
+        return self._get_word(self._order[index])
+
+    def __iter__(self) -> Iterator[str]:
+        return map(self._get_word, self._order)
+
+def memory_usage(*objects: Any) -> int:
+    '''Estimate the memory used by objects in bytes
+
+    Follows the items of lists and tuples and the attributes of the
+    compact word list classes. Objects referenced several times are
+    counted only once. Functions are not followed.
+
+    :param objects: The objects to measure
+
+    Examples:
+
+    >>> words = ['kissa' + str(number) for number in range(1000)]
+    >>> memory_usage(words, words) == memory_usage(words)
+    True
+    >>> memory_usage(CompactWordList(words)) < memory_usage(words) / 4
+    True
+    '''
+    seen: Set[int] = set()
+    total = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or callable(obj):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(
+                obj, (CompactWordList, CompactWordPairs, PermutedWordList)):
+            stack.extend(vars(obj).values())
+    return total
+
 # pylint: disable=attribute-defined-outside-init
 class Dictionary():
     '''A class to hold a hunspell dictionary'''
@@ -80,17 +560,45 @@ class Dictionary():
     #
     # openSUSE Leap 15.4 still has only Python 3.6.
     _instances: Dict[Tuple[Any, str], Any] = {}
-
-    def __new__(cls: Any, name: str = 'en_US') -> Any:
-        '''Caching instances of this class and reuse previously created instances'''
+    # Whether dictionaries loaded from now on store their words
+    # compactly, see set_compact_storage():
+    compact_storage = False
+
+    def __new__(
+            cls: Any,
+            name: str = 'en_US',
+            wordlist: Optional[Tuple[str, str, List[str], List[str], int]] = None
+    ) -> Any:
+        '''Caching instances of this class and reuse previously created instances
+
+        :param name: The name of the dictionary
+        :param wordlist: The word list of the dictionary if it has already
+                         been loaded, see load_dictionary()
+        '''
         key = (cls, name)
         if key not in cls._instances:
             instance = super().__new__(cls)
-            cls._instances[key] = instance
-            instance._initialize(name=name)
+            instance._initialize(name=name, wordlist=wordlist)
+            # Dictionaries may be loaded in a thread (see
+            # Hunspell.init_dictionaries()), store the instance only
+            # after it has been completely initialized to make sure
+            # other threads never see a partially loaded dictionary:
+            cls._instances.setdefault(key, instance)
         return cls._instances[key]
 
-    def _initialize(self, name: str = 'en_US') -> None:
+    @classmethod
+    def is_loaded(cls: Any, name: str) -> bool:
+        '''Checks whether the dictionary “name” has already been loaded
+
+        If it has been loaded, Dictionary(name) returns immediately.
+        '''
+        return (cls, name) in cls._instances
+
+    def _initialize(
+            self,
+            name: str = 'en_US',
+            wordlist: Optional[
+                Tuple[str, str, List[str], List[str], int]] = None) -> None:
         '''Initialize a Dictionary'''
         if DEBUG_LEVEL > 1:
             LOGGER.debug('name=%s', name)
@@ -98,87 +606,497 @@ class Dictionary():
         self.language = self.name.split('_')[0]
         self.dic_path = ''
         self.encoding = 'UTF-8'
-        self.words: List[str]= []
-        self.word_pairs: List[Tuple[str, str]] = []
+        self.words: Sequence[str] = []
+        self.word_pairs: Sequence[Tuple[str, str]] = []
+        self._compact = False
+        # Sorted prefix index, see _build_prefix_index():
+        self._prefix_keys: Sequence[str] = []
+        self._prefix_words: Union[List[str], CompactWordList] = []
+        # Word frequencies aligned with the prefix index and the
+        # positions in the prefix index of the words with a known
+        # frequency, most frequent first, see _load_word_frequencies():
+        self._prefix_frequencies: 'array.array[int]' = array.array('I')
+        self._frequency_order: 'array.array[int]' = array.array('I')
+        # Positions of the ranked completions of big ranges of the
+        # prefix index, keyed by (start, end, limit),
+        # see ranked_completions():
+        self._ranked_positions_cache: Dict[
+            Tuple[int, int, int], 'array.array[int]'] = {}
         self.max_word_len = 0 # maximum length of words in this dictionary
         self.enchant_dict = None
         self.pyhunspell_object = None
         self.voikko: Optional['_libvoikko.Voikko'] = None
+        # Only used if enabled, see load_correction_index():
+        self.correction_index: Optional[CorrectionIndex] = None
+        self._correction_index_lock = threading.Lock()
+        # LRU cache for spellcheck(), see spellcheck_cache_info().
+        # spellcheck() is also called in the thread computing the
+        # spelling suggestions, see Hunspell.suggest(), so the cache
+        # is used only while holding the lock:
+        self._spellcheck_cache: 'collections.OrderedDict[str, bool]' = (
+            collections.OrderedDict())
+        self._spellcheck_cache_lock = threading.Lock()
+        self._spellcheck_cache_hits = 0
+        self._spellcheck_cache_misses = 0
+        # enchant, pyhunspell and voikko objects should not be used
+        # by several threads at the same time, spelling suggestions
+        # may be computed in a thread, see Hunspell.suggest():
+        self._backend_lock = threading.Lock()
+        # The spelling suggestions can be very slow. They use their
+        # own enchant, pyhunspell or voikko object, opened when first
+        # needed, so that spellcheck() never waits for them,
+        # see spellcheck_suggest():
+        self._suggest_backend: Optional[Tuple[Any, Any, Any]] = None
+        self._suggest_backend_lock = threading.Lock()
         if self.name != 'None':
-            self.load_dictionary()
-
-    def load_dictionary(self) -> None:
+            start_time = time.monotonic()
+            self.load_dictionary(wordlist=wordlist)
+            LOGGER.info('Dictionary %s loaded in %.3f seconds.',
+                        self.name, time.monotonic() - start_time)
+
+    def load_dictionary(
+            self,
+            wordlist: Optional[
+                Tuple[str, str, List[str], List[str], int]] = None) -> None:
         '''Load a hunspell dictionary and instantiate a
         enchant.Dict() or a hunspell.Hunspell() object.
 
+        :param wordlist: The word list of the dictionary as returned by
+                         load_wordlist() if it has already been loaded,
+                         for example in another process. If None, it
+                         is loaded here.
         '''
         if DEBUG_LEVEL > 0:
             LOGGER.debug('load_dictionary() ...\n')
+        if wordlist is None:
+            wordlist = load_wordlist(self.name)
+        # Results from a previously loaded version of the dictionary
+        # may be wrong now:
+        self.spellcheck_cache_clear()
+        rebuild_correction_index = self.correction_index is not None
+        self.correction_index = None
         (self.dic_path,
          self.encoding,
-         self.words) = itb_util_core.get_hunspell_dictionary_wordlist(self.name)
+         words,
+         stripped_words,
+         self.max_word_len) = wordlist
+        self._set_words(words, stripped_words, type(self).compact_storage)
         if self.words:
-            if self.language in itb_util_core.ACCENT_LANGUAGES:
-                self.word_pairs = [
-                    (x, itb_util_core.remove_accents(
-                        x, keep=itb_util_core.ACCENT_LANGUAGES[self.language]))
-                    for x in self.words
-                ]
-            for word in self.words:
-                self.max_word_len = max(self.max_word_len, len(word))
             if DEBUG_LEVEL > 1:
                 LOGGER.debug(
                     'max_word_len = %s\n', self.max_word_len)
-            if self.name.split('_')[0] == 'fi':
-                self.enchant_dict = None
-                self.pyhunspell_object = None
-                self.voikko = None
-                if libvoikko is None:
-                    LOGGER.warning(
-                        'Language is “fi” but “import libvoikko” failed.')
-                    return
-                try:
-                    self.voikko = libvoikko.Voikko('fi')
-                except (libvoikko.VoikkoException,) as error:
-                    LOGGER.warning('Init of voikko failed: %s: %s',
-                                   error.__class__.__name__, error)
-                    self.voikko = None
-                return
-            if enchant is not None:
-                broker = enchant.Broker()
-                broker.set_ordering(self.name, 'hunspell,nuspell,aspell,voikko')
-                try:
-                    self.enchant_dict = broker.request_dict(self.name)
-                    if DEBUG_LEVEL > 1 and self.enchant_dict is not None:
-                        LOGGER.debug(
-                            '%s: %r', self.name, self.enchant_dict.provider)
-                except enchant.errors.DictNotFoundError as error:
-                    LOGGER.exception(
-                        'Error initializing enchant for %s: %s: %s',
-                        self.name, error.__class__.__name__, error)
-                    self.enchant_dict = None
-                except Exception as error: # pylint: disable=broad-except
-                    LOGGER.exception(
-                        'Unexpected error initializing enchant for %s: %s: %s',
-                        self.name, error.__class__.__name__, error)
-                    self.enchant_dict = None
-            elif hunspell is not None and self.dic_path:
-                aff_path = self.dic_path.replace('.dic', '.aff')
-                try:
-                    self.pyhunspell_object = (
-                        hunspell.HunSpell( # pylint: disable=used-before-assignment
-                            self.dic_path, aff_path))
-                except hunspell.HunSpellError as error:
-                    LOGGER.debug(
-                        'Error initializing hunspell for %s: %s: %s',
-                        self.name, error.__class__.__name__, error)
-                    self.pyhunspell_object = None
-                except Exception as error: # pylint: disable=broad-except
-                    LOGGER.debug(
-                        'Unexpected error initializing hunspell for '
-                        '%s: %s: %s',
-                        self.name, error.__class__.__name__, error)
-                    self.pyhunspell_object = None
+            self._load_word_frequencies()
+            if rebuild_correction_index:
+                self.load_correction_index()
+            (self.enchant_dict,
+             self.pyhunspell_object,
+             self.voikko) = self._open_backend()
+            with self._suggest_backend_lock:
+                self._suggest_backend = None
+
+    def _open_backend(self) -> Tuple[Any, Any, Optional['_libvoikko.Voikko']]:
+        '''Open an enchant.Dict(), a hunspell.HunSpell() or a
+        libvoikko.Voikko() object for this dictionary
+
+        :return: A tuple (enchant_dict, pyhunspell_object, voikko),
+                 at most one of them is not None.
+        '''
+        if self.language == 'fi':
+            if libvoikko is None:
+                LOGGER.warning(
+                    'Language is “fi” but “import libvoikko” failed.')
+                return (None, None, None)
+            try:
+                return (None, None, libvoikko.Voikko('fi'))
+            except (libvoikko.VoikkoException,) as error:
+                LOGGER.warning('Init of voikko failed: %s: %s',
+                               error.__class__.__name__, error)
+            return (None, None, None)
+        if enchant is not None:
+            broker = enchant.Broker()
+            broker.set_ordering(self.name, 'hunspell,nuspell,aspell,voikko')
+            try:
+                enchant_dict = broker.request_dict(self.name)
+                if DEBUG_LEVEL > 1 and enchant_dict is not None:
+                    LOGGER.debug('%s: %r', self.name, enchant_dict.provider)
+                return (enchant_dict, None, None)
+            except enchant.errors.DictNotFoundError as error:
+                LOGGER.exception(
+                    'Error initializing enchant for %s: %s: %s',
+                    self.name, error.__class__.__name__, error)
+            except Exception as error: # pylint: disable=broad-except
+                LOGGER.exception(
+                    'Unexpected error initializing enchant for %s: %s: %s',
+                    self.name, error.__class__.__name__, error)
+            return (None, None, None)
+        if hunspell is not None and self.dic_path:
+            aff_path = self.dic_path.replace('.dic', '.aff')
+            try:
+                return (
+                    None,
+                    hunspell.HunSpell( # pylint: disable=used-before-assignment
+                        self.dic_path, aff_path),
+                    None)
+            except hunspell.HunSpellError as error:
+                LOGGER.debug(
+                    'Error initializing hunspell for %s: %s: %s',
+                    self.name, error.__class__.__name__, error)
+            except Exception as error: # pylint: disable=broad-except
+                LOGGER.debug(
+                    'Unexpected error initializing hunspell for '
+                    '%s: %s: %s',
+                    self.name, error.__class__.__name__, error)
+        return (None, None, None)
+
+    def _set_words(
+            self,
+            words: List[str],
+            stripped_words: List[str],
+            compact: bool) -> None:
+        '''Store the words of the dictionary and build the prefix index
+
+        :param words: The words of the dictionary
+        :param stripped_words: The words with the accents stripped,
+                               only used for languages in
+                               ACCENT_LANGUAGES
+        :param compact: Whether to store the words compactly,
+                        see set_compact_storage()
+        '''
+        if not (words and self.language in itb_util_core.ACCENT_LANGUAGES):
+            stripped_words = []
+        self._ranked_positions_cache = {}
+        self._compact = compact
+        if compact:
+            self._set_compact_words(words, stripped_words)
+            return
+        self.word_pairs = list(zip(words, stripped_words))
+        self.words = words
+        self._build_prefix_index()
+
+    def _set_compact_words(
+            self,
+            words: List[str],
+            stripped_words: List[str]) -> None:
+        '''Store the words compactly, see set_compact_storage()
+
+        The words are stored in a CompactWordList in the order of the
+        prefix index, then the completions of a prefix are a
+        contiguous part of the buffer which is decoded at once.
+        self.words is a view in the original order of the words
+        because the word numbers in the correction index refer
+        to that order.
+
+        :param words: The words of the dictionary
+        :param stripped_words: The words with the accents stripped or
+                               an empty list if accents are not
+                               ignored for this language
+        '''
+        keys = [word.casefold() for word in stripped_words or words]
+        order = array.array(
+            'I', sorted(range(len(words)),
+                        key=lambda number: (keys[number], words[number])))
+        del keys
+        inverse_order = array.array('I', bytes(order.itemsize * len(order)))
+        for position, number in enumerate(order):
+            inverse_order[number] = position
+        prefix_words = CompactWordList(words[number] for number in order)
+        compact_words = PermutedWordList(
+            prefix_words.__getitem__, inverse_order)
+        if stripped_words:
+            word_pairs = CompactWordPairs(compact_words, stripped_words)
+            prefix_keys = PermutedWordList(
+                lambda number: word_pairs.stripped(number).casefold(), order)
+            self.word_pairs = word_pairs
+        else:
+            prefix_keys = PermutedWordList(
+                lambda number: compact_words[number].casefold(), order)
+            self.word_pairs = []
+        self.words = compact_words
+        self._prefix_keys = prefix_keys
+        self._prefix_words = prefix_words
+
+    def set_compact_storage(self, compact: bool) -> None:
+        '''Convert the stored words to or from compact storage
+
+        With compact storage, the words are kept in a CompactWordList,
+        the accent stripped words only where they differ from the
+        words (see CompactWordPairs), and the prefix index stores only
+        the sorted order of the words. This needs much less memory
+        but accessing words is slower because they are decoded from
+        UTF-8 on each access. The prefix search and the completions
+        are the same in both modes.
+
+        :param compact: Whether to use compact storage
+        '''
+        if compact == self._compact:
+            return
+        start_time = time.monotonic()
+        memory_before = self.memory_usage()
+        words = list(self.words)
+        # Share the str objects of the words which do not change
+        # when stripping the accents, like the word lists loaded
+        # by itb_util_core.get_hunspell_dictionary_wordlist_cached():
+        stripped_words = [word if stripped == word else stripped
+                          for word, (_word, stripped)
+                          in zip(words, self.word_pairs)]
+        self._set_words(words, stripped_words, compact)
+        with self._correction_index_lock:
+            if self.correction_index is not None:
+                # The word numbers in the index do not change, only
+                # the words need to be replaced by the new storage:
+                correction_index = CorrectionIndex(
+                    self.words,
+                    max_distance=self.correction_index.max_distance,
+                    prefix_length=self.correction_index.prefix_length)
+                correction_index.set_index_arrays(
+                    *self.correction_index.index_arrays())
+                self.correction_index = correction_index
+        LOGGER.info('%s: compact storage %s in %.3f seconds, '
+                    'memory %s bytes -> %s bytes',
+                    self.name, compact, time.monotonic() - start_time,
+                    memory_before, self.memory_usage())
+
+    def memory_usage(self) -> int:
+        '''Returns an estimate of the memory used for the words and
+        the prefix index of this dictionary in bytes
+        '''
+        return memory_usage(self.words, self.word_pairs,
+                            self._prefix_keys, self._prefix_words)
+
+    def load_correction_index(self) -> None:
+        '''Load the correction index for this dictionary from the cache
+        or build it if there is no valid cached index
+
+        The correction index is optional, it is only used for the
+        dictionaries chosen with Hunspell.set_correction_index_names().
+        '''
+        with self._correction_index_lock:
+            self._load_correction_index()
+
+    def _load_correction_index(self) -> None:
+        '''Load or build the correction index, see load_correction_index()
+        '''
+        if self.correction_index is not None or not self.words:
+            return
+        start_time = time.monotonic()
+        keep = itb_util_core.ACCENT_LANGUAGES.get(self.language)
+        correction_index = CorrectionIndex(self.words)
+        index = None
+        if self.dic_path:
+            index = itb_util_core.read_correction_index_cache(
+                self.dic_path, keep, correction_index.parameters())
+        if index is not None:
+            correction_index.set_index_arrays(*index)
+        else:
+            correction_index.build()
+            if self.dic_path:
+                itb_util_core.write_correction_index_cache(
+                    self.dic_path, keep, correction_index.parameters(),
+                    *correction_index.index_arrays())
+        self.correction_index = correction_index
+        LOGGER.info('Correction index for %s loaded in %.3f seconds.',
+                    self.name, time.monotonic() - start_time)
+
+    def _build_prefix_index(self) -> None:
+        '''Build a sorted index to find the completions of a prefix
+
+        Scanning all words of a dictionary and checking
+        casefold().startswith() for each of them on each keystroke is
+        slow for big dictionaries like de_DE or cs_CZ which have
+        hundreds of thousands of words. Instead, sort the casefolded
+        keys (accent insensitive for languages in ACCENT_LANGUAGES)
+        once when loading the dictionary. Then all words starting with
+        a prefix form a contiguous range in the index which can be
+        found with bisect.
+        '''
+        if self.word_pairs:
+            pairs = [(stripped.casefold(), word)
+                     for word, stripped in self.word_pairs]
+        else:
+            pairs = [(word.casefold(), word) for word in self.words]
+        pairs.sort()
+        self._prefix_keys = [key for key, _word in pairs]
+        self._prefix_words = [word for _key, word in pairs]
+
+    def _load_word_frequencies(self) -> None:
+        '''Load the word frequencies for the words in the prefix index
+
+        Word frequency files are optional, see
+        itb_util_core.find_word_frequency_file(). If there is one
+        for this dictionary, the completions are ranked by frequency,
+        see ranked_completions().
+        '''
+        self._prefix_frequencies = array.array('I')
+        self._frequency_order = array.array('I')
+        self._ranked_positions_cache = {}
+        path = itb_util_core.find_word_frequency_file(self.name)
+        if not path:
+            return
+        frequencies = itb_util_core.read_word_frequencies(path)
+        if not frequencies:
+            return
+        self._prefix_frequencies = array.array(
+            'I', (min(frequencies.get(word.casefold(), 0), 0xFFFFFFFF)
+                  for word in self._prefix_words))
+        prefix_frequencies = self._prefix_frequencies
+        self._frequency_order = array.array(
+            'I', sorted((position
+                         for position, frequency
+                         in enumerate(prefix_frequencies) if frequency),
+                        key=lambda position: -prefix_frequencies[position]))
+        LOGGER.info('%s: frequencies for %s of %s words from %s',
+                    self.name, len(self._frequency_order),
+                    len(self._prefix_words), path)
+
+    def has_word_frequencies(self) -> bool:
+        '''Returns whether word frequencies are available for this
+        dictionary
+        '''
+        return bool(self._frequency_order)
+
+    def prefix_range(
+            self,
+            query: str,
+            low: int = 0,
+            high: Optional[int] = None) -> Tuple[int, int]:
+        '''Return the range of the prefix index where the keys start
+        with query
+
+        :param query: The casefolded (and for languages in
+                      ACCENT_LANGUAGES accent stripped) prefix to
+                      search for
+        :param low: Lower bound of the range of the index to search
+        :param high: Upper bound of the range of the index to search,
+                     None means up to the end of the index
+        :return: A tuple (start, end) such that
+                 self._prefix_keys[start:end] are exactly the keys
+                 in the searched range starting with query.
+        '''
+        if high is None:
+            high = len(self._prefix_keys)
+        start = bisect.bisect_left(self._prefix_keys, query, low, high)
+        if not query:
+            return (start, high)
+        last_char = ord(query[-1])
+        if last_char >= sys.maxunicode:
+            # There is no successor of the last character, do a
+            # linear search for the end of the range:
+            end = start
+            while end < high and self._prefix_keys[end].startswith(query):
+                end += 1
+            return (start, end)
+        # All keys starting with query are smaller than the query
+        # with its last character incremented by one:
+        end = bisect.bisect_left(
+            self._prefix_keys, query[:-1] + chr(last_char + 1), start, high)
+        return (start, end)
+
+    def completions(self, query: str) -> List[str]:
+        '''Return the words from the dictionary starting with query
+
+        :param query: The casefolded (and for languages in
+                      ACCENT_LANGUAGES accent stripped) prefix to
+                      search for
+        :return: List of words in the order of the prefix index
+
+        Examples:
+
+        >>> d = Dictionary('fi_FI')
+        >>> d.completions('kissam')
+        ['kissamaiseksi']
+
+        >>> d = Dictionary('None')
+        >>> d.completions('kissa')
+        []
+        '''
+        (start, end) = self.prefix_range(query)
+        return self.prefix_index_words(start, end)
+
+    def prefix_index_words(self, start: int, end: int) -> List[str]:
+        '''Return the words in a range of the prefix index
+
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        '''
+        return self._prefix_words[start:end]
+
+    def ranked_completions(
+            self,
+            start: int,
+            end: int,
+            limit: int = MAX_WORDS) -> List[Tuple[str, int]]:
+        '''Return the most frequent words in a range of the prefix index
+
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of words to return if word
+                      frequencies are available
+        :return: List of (word, frequency) tuples, the most frequent
+                 words first. If there are not enough words with
+                 known frequencies in the range, the shortest of the
+                 other words are added with frequency 0. If there are
+                 no word frequencies for this dictionary, all words
+                 in the range are returned with frequency 0.
+        '''
+        if not self._frequency_order:
+            return [(word, 0) for word in self._prefix_words[start:end]]
+        frequencies = self._prefix_frequencies
+        if end - start < RANKED_COMPLETIONS_CACHE_MIN_RANGE:
+            positions = self._ranked_positions(start, end, limit)
+        else:
+            # Big range (short prefix): Ranking it is slow, but
+            # there are only few such ranges and the same short
+            # prefixes are typed again and again:
+            key = (start, end, limit)
+            positions = self._ranked_positions_cache.get(key)
+            if positions is None:
+                positions = self._ranked_positions(start, end, limit)
+                self._ranked_positions_cache[key] = positions
+        return [(self._prefix_words[position], frequencies[position])
+                for position in positions]
+
+    def _ranked_positions(
+            self,
+            start: int,
+            end: int,
+            limit: int) -> 'array.array[int]':
+        '''Rank the words in a range of the prefix index
+
+        :param start: Start of the range (inclusive)
+        :param end: End of the range (exclusive)
+        :param limit: Maximum number of positions to return
+        :return: The positions in the prefix index of the most frequent
+                 words in the range, the most frequent first, followed
+                 by the positions of the shortest words without known
+                 frequency if there are not enough words with known
+                 frequencies, see ranked_completions().
+        '''
+        frequencies = self._prefix_frequencies
+        positions = array.array('I')
+        if (end - start) * (end - start) > len(self._prefix_words) * limit:
+            # Big range (short prefix): Walking through all words
+            # ordered by frequency finds enough words in the range
+            # early:
+            for position in self._frequency_order:
+                if start <= position < end:
+                    positions.append(position)
+                    if len(positions) >= limit:
+                        break
+        else:
+            positions.extend(heapq.nsmallest(
+                limit,
+                (position for position in range(start, end)
+                 if frequencies[position]),
+                key=lambda position: (-frequencies[position], position)))
+        if len(positions) < limit:
+            prefix_words = self._prefix_words
+            positions.extend(heapq.nsmallest(
+                limit - len(positions),
+                (position for position in range(start, end)
+                 if not frequencies[position]),
+                key=lambda position: (len(prefix_words[position]),
+                                      prefix_words[position])))
+        return positions
 
     def spellcheck_enchant(self, word: str) -> bool:
         '''
@@ -241,14 +1159,78 @@ class Dictionary():
         >>> d.spellcheck('winxer')
         False
         '''
-        if self.enchant_dict:
-            return self.spellcheck_enchant(word)
-        if self.pyhunspell_object:
-            return self.spellcheck_pyhunspell(word)
-        if self.voikko:
-            return bool(self.voikko.spell(word))
+        with self._spellcheck_cache_lock:
+            cached = self._spellcheck_cache.get(word)
+            if cached is not None:
+                self._spellcheck_cache_hits += 1
+                self._spellcheck_cache.move_to_end(word)
+                return cached
+            self._spellcheck_cache_misses += 1
+        result = self._spellcheck_uncached(word)
+        with self._spellcheck_cache_lock:
+            self._spellcheck_cache[word] = result
+            if len(self._spellcheck_cache) > SPELLCHECK_CACHE_SIZE:
+                self._spellcheck_cache.popitem(last=False)
+        return result
+
+    def _spellcheck_uncached(self, word: str) -> bool:
+        '''
+        Spellcheck a word without using the cache of spellcheck()
+
+        :param word: The word to spellcheck
+        :return: True if spelling is correct, False if not or unknown
+        '''
+        with self._backend_lock:
+            if self.enchant_dict:
+                return self.spellcheck_enchant(word)
+            if self.pyhunspell_object:
+                return self.spellcheck_pyhunspell(word)
+            if self.voikko:
+                return bool(self.voikko.spell(word))
         return False
 
+    def spellcheck_many(self, words: Iterable[str]) -> Dict[str, bool]:
+        '''
+        Spellcheck several words in one call
+
+        Uses the same cache as spellcheck(), words which occur several
+        times in the input are checked only once.
+
+        :param words: The words to spellcheck
+        :return: A dictionary mapping each of the words to True if
+                 the spelling is correct, False if not or unknown
+
+        >>> d = Dictionary('en_US')
+        >>> d.spellcheck_many(['winter', 'winxer', 'winter'])
+        {'winter': True, 'winxer': False}
+        '''
+        results: Dict[str, bool] = {}
+        for word in words:
+            if word not in results:
+                results[word] = self.spellcheck(word)
+        return results
+
+    def spellcheck_cache_clear(self) -> None:
+        '''Clear the cache of spellcheck() and reset its statistics'''
+        with self._spellcheck_cache_lock:
+            self._spellcheck_cache.clear()
+            self._spellcheck_cache_hits = 0
+            self._spellcheck_cache_misses = 0
+
+    def spellcheck_cache_info(self) -> Dict[str, int]:
+        '''
+        Returns statistics about the cache of spellcheck()
+
+        :return: A dictionary with the number of cache hits and misses,
+                 the current number of entries and the maximum number
+                 of entries.
+        '''
+        with self._spellcheck_cache_lock:
+            return {'hits': self._spellcheck_cache_hits,
+                    'misses': self._spellcheck_cache_misses,
+                    'size': len(self._spellcheck_cache),
+                    'maxsize': SPELLCHECK_CACHE_SIZE}
+
     def has_spellchecking(self) -> bool:
         '''
         Returns wether this dictionary supports spellchecking or not
@@ -273,14 +1255,19 @@ class Dictionary():
             return True
         return False
 
-    def spellcheck_suggest_enchant(self, word: str) -> List[str]:
+    def spellcheck_suggest_enchant(
+            self, word: str, enchant_dict: Any = None) -> List[str]:
         '''
         Return spellchecking suggestions for word using enchant
 
         :param word: The word to return spellchecking suggestions for
+        :param enchant_dict: The enchant object to use,
+                             if None self.enchant_dict is used
         :return: List of spellchecking suggestions, possibly empty.
         '''
-        if not word or not self.enchant_dict:
+        if enchant_dict is None:
+            enchant_dict = self.enchant_dict
+        if not word or not enchant_dict:
             return []
         # enchant does the right thing for all languages, including
         # Korean, if the input is NFC. It takes Unicode strings and
@@ -290,42 +1277,54 @@ class Dictionary():
             unicodedata.normalize(
                 itb_util_core.NORMALIZATION_FORM_INTERNAL, x)
             for x in
-            self.enchant_dict.suggest(unicodedata.normalize('NFC', word))
+            enchant_dict.suggest(unicodedata.normalize('NFC', word))
             ]
 
-    def spellcheck_suggest_pyhunspell(self, word: str) -> List[str]:
+    def spellcheck_suggest_pyhunspell(
+            self, word: str, pyhunspell_object: Any = None) -> List[str]:
         '''
         Return spellchecking suggestions for word using pyhunspell
 
         :param word: The word to return spellchecking suggestions for
+        :param pyhunspell_object: The pyhunspell object to use, if None
+                                  self.pyhunspell_object is used
         :return: List of spellchecking suggestions, possibly empty.
         '''
-        if not word or not self.pyhunspell_object:
+        if pyhunspell_object is None:
+            pyhunspell_object = self.pyhunspell_object
+        if not word or not pyhunspell_object:
             return []
         # pyhunspell needs its input passed in dictionary encoding.
         return [
             unicodedata.normalize(
                 itb_util_core.NORMALIZATION_FORM_INTERNAL, x)
             for x in
-            self.pyhunspell_object.suggest(
+            pyhunspell_object.suggest(
                 unicodedata.normalize('NFC', word).encode(
                     self.encoding, 'replace'))
             ]
 
-    def spellcheck_suggest_voikko(self, word: str) -> List[str]:
+    def spellcheck_suggest_voikko(
+            self,
+            word: str,
+            voikko: Optional['_libvoikko.Voikko'] = None) -> List[str]:
         '''
         Return spellchecking suggestions for word using voikko
 
         :param word: The word to return spellchecking suggestions for
+        :param voikko: The voikko object to use,
+                       if None self.voikko is used
         :return: List of spellchecking suggestions, possibly empty.
         '''
-        if not word or not self.voikko:
+        if voikko is None:
+            voikko = self.voikko
+        if not word or not voikko:
             return []
         return [
             unicodedata.normalize(
                 itb_util_core.NORMALIZATION_FORM_INTERNAL, x)
             for x in
-            self.voikko.suggest(unicodedata.normalize('NFC', word))
+            voikko.suggest(unicodedata.normalize('NFC', word))
             ]
 
     # Don’t use @lru_cache(maxsize=None) here, that has a high risk of
@@ -368,15 +1367,64 @@ class Dictionary():
         []
 
         '''
-        if self.enchant_dict:
-            return self.spellcheck_suggest_enchant(word)
-        if self.pyhunspell_object:
-            return self.spellcheck_suggest_pyhunspell(word)
-        if self.voikko:
-            return self.spellcheck_suggest_voikko(word)
+        if not self.has_spellchecking():
+            return []
+        with self._suggest_backend_lock:
+            if self._suggest_backend is None:
+                self._suggest_backend = self._open_backend()
+            (enchant_dict, pyhunspell_object, voikko) = self._suggest_backend
+            if enchant_dict:
+                return self.spellcheck_suggest_enchant(word, enchant_dict)
+            if pyhunspell_object:
+                return self.spellcheck_suggest_pyhunspell(
+                    word, pyhunspell_object)
+            if voikko:
+                return self.spellcheck_suggest_voikko(word, voikko)
         return []
 # pylint: enable=attribute-defined-outside-init
 
+def load_dictionaries(dictionary_names: Iterable[str]) -> Iterator[Dictionary]:
+    '''Load several dictionaries concurrently
+
+    :param dictionary_names: The names of the dictionaries to load
+    :return: An iterator yielding the dictionaries in the order they
+             finished loading
+
+    Dictionaries are loaded in a pool of threads. No processes are
+    used, this is called in the engine which has other threads
+    running and forking a multithreaded process can deadlock the
+    child process.
+    '''
+    names = [name for name in dict.fromkeys(dictionary_names)
+             if not Dictionary.is_loaded(name)]
+    if len(names) <= 1:
+        for name in names:
+            yield Dictionary(name=name)
+        return
+    start_time = time.monotonic()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(names)) as thread_pool:
+            for future in concurrent.futures.as_completed(
+                    [thread_pool.submit(Dictionary, name=name)
+                     for name in names]):
+                yield future.result()
+    finally:
+        LOGGER.info('Dictionaries %s loaded in %.3f seconds.',
+                    names, time.monotonic() - start_time)
+
+def _future_succeeded(future: 'concurrent.futures.Future[bool]') -> bool:
+    '''Check whether a future has finished and returned True
+
+    :param future: The future to check
+    :return: True if the future is done, has not been cancelled,
+             has not raised an exception and its result is True.
+    '''
+    return (future.done()
+            and not future.cancelled()
+            and future.exception() is None
+            and future.result())
+
 class Hunspell:
     '''A class to suggest completions or corrections
     using a list of Hunspell dictionaries
@@ -396,12 +1444,187 @@ class Hunspell:
             else:
                 LOGGER.debug('Hunspell.__init__(dictionary_names=())\n')
         self._suggest_cache: Dict[str, List[Tuple[str, int]]] = {}
+        # Query and range of the prefix index found for that query in
+        # the previous completion lookup, for each dictionary name,
+        # see _completions():
+        self._previous_prefix_ranges: Dict[str, Tuple[str, int, int]] = {}
         self._dictionary_names: List[str] = list(dictionary_names)
         self._dictionaries: List[Dictionary] = []
+        # For loading dictionaries in a thread, see init_dictionaries():
+        self._dictionaries_lock = threading.Lock()
+        self._loading_generation = 0
+        self._names_loading: Set[str] = set()
+        self._dictionaries_loaded_callback: Optional[
+            Callable[[], None]] = None
+        # Incremented whenever the dictionaries or their correction
+        # indexes change, i.e. whenever results of _suggest() computed
+        # before may be wrong. It is part of the key of the cache of
+        # _suggest(), so a result computed with the old dictionaries
+        # in one thread while another thread replaces them is never
+        # returned for the new dictionaries:
+        self._dictionaries_generation = 0
+        # Dictionaries which use a correction index,
+        # see set_correction_index_names():
+        self._correction_index_names: Set[str] = set()
+        # For computing spelling suggestions in a thread,
+        # see set_suggest_deadline():
+        self._suggest_deadline: Optional[float] = None
+        self._suggest_executor: Optional[
+            concurrent.futures.ThreadPoolExecutor] = None
+        self._suggest_lock = threading.Lock()
+        self._suggest_generation = 0
+        # The jobs are keyed by (input_phrase, dictionaries_generation),
+        # a job computed with other dictionaries cannot be reused:
+        self._suggest_jobs: Dict[
+            Tuple[str, int], 'concurrent.futures.Future[bool]'] = {}
+        self._suggest_incomplete: Set[str] = set()
+        self._suggestions_ready_callback: Optional[
+            Callable[[str], None]] = None
         self.init_dictionaries()
 
-    def init_dictionaries(self) -> None:
+    def set_dictionaries_loaded_callback(
+            self, callback: Optional[Callable[[], None]]) -> None:
+        '''Set a function to call when a dictionary has been loaded
+        in the background
+
+        :param callback: The function to call. It is called from the
+                         thread loading the dictionaries, i.e. it
+                         should use GLib.idle_add() if it wants to
+                         update something in the main loop.
+        '''
+        self._dictionaries_loaded_callback = callback
+
+    def set_suggest_deadline(self, deadline: Optional[float]) -> None:
+        '''Set how long suggest() waits for spelling suggestions
+
+        Completions from the dictionaries are always returned
+        immediately. Spelling suggestions from enchant, pyhunspell or
+        voikko can be slow though. If a deadline is set, they are
+        computed in a thread and if they are not ready within the
+        deadline, suggest() returns without them. When they become
+        ready later, the callback set with
+        set_suggestions_ready_callback() is called.
+
+        :param deadline: The maximum time in seconds suggest() waits
+                         for spelling suggestions. None means
+                         spelling suggestions are computed
+                         synchronously without using a thread.
+        '''
+        if deadline is not None:
+            deadline = max(0.0, deadline)
+        self._suggest_deadline = deadline
+        if deadline is None:
+            self.cancel_suggestions()
+
+    def set_suggestions_ready_callback(
+            self, callback: Optional[Callable[[str], None]]) -> None:
+        '''Set a function to call when spelling suggestions which
+        were not ready within the deadline have become ready
+
+        :param callback: The function to call. It gets the input
+                         phrase passed to suggest() as a parameter
+                         and it is called from the thread computing
+                         the spelling suggestions, i.e. it should
+                         use GLib.idle_add() if it wants to update
+                         something in the main loop.
+        '''
+        self._suggestions_ready_callback = callback
+
+    def cancel_suggestions(self) -> None:
+        '''Drop the spelling suggestion jobs which are not finished yet
+
+        Should be called when the input has changed and the spelling
+        suggestions still being computed are not needed anymore.
+        '''
+        with self._suggest_lock:
+            self._suggest_generation += 1
+            for key, future in list(self._suggest_jobs.items()):
+                if not future.done():
+                    future.cancel()
+                    del self._suggest_jobs[key]
+            if len(self._suggest_jobs) > 1000:
+                # Finished results are in the cache of _suggest()
+                # anyway, a new job for the same input would return
+                # immediately:
+                self._suggest_jobs = {}
+            self._suggest_incomplete = set()
+
+    def _spelling_suggestions_job(
+            self,
+            input_phrase: str,
+            generation: int,
+            dictionaries_generation: int) -> bool:
+        '''Compute the spelling suggestions for suggest() in a thread
+
+        :param input_phrase: The input phrase in the internal
+                             normalization form
+        :param generation: The value of self._suggest_generation
+                           when the job was submitted. If it has
+                           changed, the job has been cancelled.
+        :param dictionaries_generation: The value of
+                                        self._dictionaries_generation
+                                        when the job was submitted
+        :return: True if the complete result of suggest() is now
+                 in the cache, False if the job has been cancelled
+                 or the dictionaries have changed.
+        '''
+        for dictionary in self._dictionaries:
+            if generation != self._suggest_generation:
+                return False
+            # This is the slow part, the results are cached:
+            dictionary.spellcheck_suggest(input_phrase)
+        if (generation != self._suggest_generation
+            or dictionaries_generation != self._dictionaries_generation):
+            return False
+        # If the dictionaries are replaced while this runs, the
+        # result is cached for the old generation only and never
+        # returned by suggest():
+        self._suggest(input_phrase, dictionaries_generation)
+        return True
+
+    def _spelling_suggestions_done(
+            self,
+            input_phrase: str,
+            future: 'concurrent.futures.Future[bool]') -> None:
+        '''Called when a spelling suggestion job has finished
+
+        :param input_phrase: The input phrase of the job
+        :param future: The future of the job
+        '''
+        if not _future_succeeded(future):
+            return
+        with self._suggest_lock:
+            if input_phrase not in self._suggest_incomplete:
+                # suggest() got the result in time or the
+                # input has changed in the mean time
+                return
+            self._suggest_incomplete.discard(input_phrase)
+        if self._suggestions_ready_callback is not None:
+            try:
+                self._suggestions_ready_callback(input_phrase)
+            except Exception as error: # pylint: disable=broad-except
+                LOGGER.exception(
+                    'Unexpected error in suggestions ready '
+                    'callback: %s: %s',
+                    error.__class__.__name__, error)
+
+    def is_loading(self) -> bool:
+        '''Returns whether dictionaries are still being loaded in
+        the background
+
+        While this is True, suggest() and spellcheck() return
+        results only from the dictionaries already loaded.
+        '''
+        return bool(self._names_loading)
+
+    def init_dictionaries(self, background: bool = False) -> None:
         '''Initialize the hunspell dictionaries
+
+        :param background: If False, load all dictionaries before
+                           returning. If True, use only the
+                           dictionaries already loaded and load
+                           the missing ones in a thread, adding
+                           them one by one when they become ready.
         '''
         if DEBUG_LEVEL > 1:
             if self._dictionary_names:
@@ -411,10 +1634,176 @@ class Hunspell:
             else:
                 LOGGER.debug(
                     'Hunspell.init_dictionaries() dictionary_names=()\n')
-        self.suggest.cache_clear()
-        self._dictionaries = []
-        for dictionary_name in self._dictionary_names:
-            self._dictionaries.append(Dictionary(name=dictionary_name))
+        # Spelling suggestion jobs still running use the old
+        # dictionaries:
+        self.cancel_suggestions()
+        self._suggest.cache_clear()
+        self._previous_prefix_ranges = {}
+        if not background:
+            for _dictionary in load_dictionaries(self._dictionary_names):
+                pass
+        with self._dictionaries_lock:
+            # Let a thread possibly still loading dictionaries for an
+            # older list of dictionary names know that its results
+            # are not wanted anymore:
+            self._loading_generation += 1
+            self._names_loading = set()
+            if background:
+                self._names_loading = {
+                    name for name in self._dictionary_names
+                    if not Dictionary.is_loaded(name)}
+            self._dictionaries = [
+                Dictionary(name=name) for name in self._dictionary_names
+                if name not in self._names_loading]
+            self._dictionaries_generation += 1
+        for dictionary in self._dictionaries:
+            # May have been loaded before compact storage was changed:
+            dictionary.set_compact_storage(Dictionary.compact_storage)
+        self._load_correction_indexes(background=background)
+        if not self._names_loading:
+            return
+        LOGGER.info('Loading dictionaries %s in the background.',
+                    self._names_loading)
+        loading_thread = threading.Thread(
+            daemon=True,
+            target=self._load_dictionaries_thread_function,
+            args=([name for name in self._dictionary_names
+                   if name in self._names_loading],
+                  self._loading_generation))
+        loading_thread.start()
+
+    def _load_dictionaries_thread_function(
+            self, dictionary_names: List[str], generation: int) -> None:
+        '''Thread to load dictionaries in the background
+
+        :param dictionary_names: The names of the dictionaries to load
+        :param generation: The value of self._loading_generation when
+                           the thread was started. If it has changed,
+                           the list of dictionaries has been changed
+                           in the mean time and the results of this
+                           thread are not needed anymore.
+        '''
+        for dictionary in load_dictionaries(dictionary_names):
+            name = dictionary.name
+            if generation != self._loading_generation:
+                return
+            dictionary.set_compact_storage(Dictionary.compact_storage)
+            with self._dictionaries_lock:
+                if generation != self._loading_generation:
+                    return
+                self._names_loading.discard(name)
+                # Replace the list instead of changing it in place,
+                # the main thread may be iterating over the old list:
+                self._dictionaries = [
+                    Dictionary(name=dictionary_name)
+                    for dictionary_name in self._dictionary_names
+                    if dictionary_name not in self._names_loading]
+                self._dictionaries_generation += 1
+            LOGGER.info('Dictionary %s loaded in the background.', name)
+            self._notify_dictionaries_loaded()
+            if name in self._correction_index_names:
+                dictionary.load_correction_index()
+                self._notify_dictionaries_loaded()
+
+    def _notify_dictionaries_loaded(self) -> None:
+        '''Called from a thread when a dictionary or a correction index
+        has been loaded in the background
+        '''
+        # Results cached while the dictionary or the correction index
+        # was missing are incomplete. A result for the previous
+        # generation which the main thread may be computing right now
+        # is never returned again, clearing the cache only frees the
+        # memory:
+        with self._dictionaries_lock:
+            self._dictionaries_generation += 1
+        self._suggest.cache_clear()
+        if self._dictionaries_loaded_callback is not None:
+            try:
+                self._dictionaries_loaded_callback()
+            except Exception as error: # pylint: disable=broad-except
+                LOGGER.exception(
+                    'Unexpected error in dictionaries loaded '
+                    'callback: %s: %s',
+                    error.__class__.__name__, error)
+
+    def set_compact_storage(self, compact: bool) -> None:
+        '''Choose whether the dictionaries store their words compactly
+
+        Converts the dictionaries already loaded, dictionaries loaded
+        later use the same storage. See Dictionary.set_compact_storage().
+
+        :param compact: Whether to use compact storage
+        '''
+        Dictionary.compact_storage = compact
+        for dictionary in self._dictionaries:
+            dictionary.set_compact_storage(compact)
+
+    def get_correction_index_names(self) -> List[str]:
+        '''Returns the names of the dictionaries using a correction index'''
+        return sorted(self._correction_index_names)
+
+    def set_correction_index_names(
+            self,
+            dictionary_names: Iterable[str],
+            background: bool = False) -> None:
+        '''Choose the dictionaries which use a correction index
+
+        A correction index (see CorrectionIndex) finds spelling
+        corrections very fast. It is used in addition to the
+        spelling suggestions from enchant, pyhunspell or voikko,
+        or instead of them if these are not available. Building
+        the index takes some time and memory, therefore it is
+        optional. Once built, it is cached on disk next to the
+        word list cache.
+
+        :param dictionary_names: The names of the dictionaries
+                                 which should use a correction index
+        :param background: If True, load or build the correction
+                           indexes in a thread
+        '''
+        self._correction_index_names = set(dictionary_names)
+        with self._dictionaries_lock:
+            self._dictionaries_generation += 1
+        self._suggest.cache_clear()
+        self._load_correction_indexes(background=background)
+
+    def _load_correction_indexes(self, background: bool = False) -> None:
+        '''Load the correction indexes which are needed but missing
+
+        Dictionaries still being loaded in the background are skipped,
+        the thread loading them loads their correction indexes as well.
+
+        :param background: If True, load the correction indexes
+                           in a thread
+        '''
+        dictionaries = [
+            dictionary for dictionary in self._dictionaries
+            if dictionary.name in self._correction_index_names
+            and dictionary.correction_index is None]
+        if not dictionaries:
+            return
+        if not background:
+            for dictionary in dictionaries:
+                dictionary.load_correction_index()
+            return
+        loading_thread = threading.Thread(
+            daemon=True,
+            target=self._load_correction_indexes_thread_function,
+            args=(dictionaries,))
+        loading_thread.start()
+
+    def _load_correction_indexes_thread_function(
+            self, dictionaries: List[Dictionary]) -> None:
+        '''Thread to load correction indexes in the background
+
+        :param dictionaries: The dictionaries to load the correction
+                             indexes for
+        '''
+        for dictionary in dictionaries:
+            if dictionary.name not in self._correction_index_names:
+                continue
+            dictionary.load_correction_index()
+            self._notify_dictionaries_loaded()
 
     def get_dictionary_names(self) -> List[str]:
         '''Returns a copy of the list of dictionary names.
@@ -423,33 +1812,51 @@ class Hunspell:
         the private member variable directly.'''
         return list(self._dictionary_names[:])
 
-    def set_dictionary_names(self, dictionary_names: List[str]) -> None:
+    def set_dictionary_names(
+            self,
+            dictionary_names: List[str],
+            background: bool = False) -> None:
         '''Sets the list of dictionary names.
 
         If the new list of dictionary names differs from the existing
         one, re-initialize the dictionaries.
+
+        :param dictionary_names: The new list of dictionary names
+        :param background: Whether to load dictionaries which have
+                           not been loaded yet in a thread,
+                           see init_dictionaries().
         '''
         if dictionary_names != self._dictionary_names:
             if set(dictionary_names) != set(self._dictionary_names):
                 # Some dictionaries are really different, reinitialize:
                 self._dictionary_names = dictionary_names
-                self.init_dictionaries()
+                self.init_dictionaries(background=background)
             else:
                 # Only the order of dictionaries has changed.
                 # Reinitializing wastes time, just reorder the
                 # dictionaries:
-                self._dictionary_names = dictionary_names
-                dictionaries_new = []
-                for name in dictionary_names:
-                    for dictionary in self._dictionaries:
-                        if dictionary.name == name:
-                            dictionaries_new.append(dictionary)
-                self._dictionaries = dictionaries_new
+                with self._dictionaries_lock:
+                    self._dictionary_names = dictionary_names
+                    dictionaries_new = []
+                    for name in dictionary_names:
+                        for dictionary in self._dictionaries:
+                            if dictionary.name == name:
+                                dictionaries_new.append(dictionary)
+                    self._dictionaries = dictionaries_new
+                    self._dictionaries_generation += 1
         if DEBUG_LEVEL > 1:
             LOGGER.debug('set_dictionary_names(%s):\n', dictionary_names)
             for dictionary in self._dictionaries:
                 LOGGER.debug('%s\n', dictionary.name)
 
+    def has_word_frequencies(self) -> bool:
+        '''Returns whether word frequencies are available for at least
+        one of the dictionaries, i.e. whether the order of the
+        completions returned by suggest() is by word frequency.
+        '''
+        return any(dictionary.has_word_frequencies()
+                   for dictionary in self._dictionaries)
+
     def spellcheck(self, input_phrase: str) -> bool:
         '''
         Checks if a string is likely to be spelled correctly checking
@@ -534,6 +1941,36 @@ class Hunspell:
                 match_list.append(dictionary.name)
         return match_list
 
+    def spellcheck_match_list_many(
+            self, input_phrases: Iterable[str]) -> Dict[str, List[str]]:
+        '''
+        Like spellcheck_match_list() but for several phrases at once
+
+        Each dictionary checks all the phrases in one call, this is
+        used to annotate all candidates of the lookup table at once.
+
+        :param input_phrases: The words to be spellchecked
+        :return: A dictionary mapping each of the input phrases to
+                 the list of names of the dictionaries which accept
+                 it as a valid word.
+
+        Examples:
+
+        >>> h = Hunspell(['en_US', 'None', 'it_IT', 'fr_FR'])
+        >>> h.spellcheck_match_list_many(['arrive', 'arrivé', ' '])
+        {'arrive': ['en_US', 'fr_FR'], 'arrivé': ['fr_FR'], ' ': []}
+        '''
+        match_lists: Dict[str, List[str]] = {
+            phrase: [] for phrase in input_phrases}
+        phrases = [phrase for phrase in match_lists if phrase.strip()]
+        if not phrases:
+            return match_lists
+        for dictionary in self._dictionaries:
+            for phrase, correct in dictionary.spellcheck_many(phrases).items():
+                if correct:
+                    match_lists[phrase].append(dictionary.name)
+        return match_lists
+
     def spellcheck_single_dictionary(self, words: Iterable[str] = ()) -> List[str]:
         '''
         Checks whether there is at least one dictionary where all words
@@ -601,20 +2038,36 @@ class Hunspell:
                 dictionary_names.append(dictionary.name)
         return sorted(dictionary_names)
 
-    # Don’t use @lru_cache(maxsize=None) here, that has a high risk of
-    # memory leaks.  It caches forever — and it keeps strong
-    # references to all function arguments and results. If the method
-    # is on a class instance (self), and the cache calls involving
-    # self, then self gets kept alive — even if no other code
-    # references it! That is a high risk of memory leaks when
-    # instantiated class objects go out of scope.  With a bounded
-    # cache, Python will evict the oldest cache entries automatically
-    # when the cache grows beyond 500,000 entries. That is much safer
-    # The self reference can still stay around as long as there are
-    # still entries in the cache for that instance. But if all entries
-    # referring to a self are evicted, then self can be garbage
-    # collected properly.
-    @functools.lru_cache(maxsize=500_000)
+    def _completions(
+            self,
+            dictionary: Dictionary,
+            query: str) -> List[Tuple[str, int]]:
+        '''Return the completions of query from a dictionary
+
+        :param dictionary: The dictionary to search
+        :param query: The casefolded (and for languages in
+                      ACCENT_LANGUAGES accent stripped) prefix to
+                      search for
+        :return: List of (word, frequency) tuples,
+                 see Dictionary.ranked_completions()
+
+        While the user types “c”, “co”, “com”, “comp”, …, each query
+        extends the previous one. The words matching the new query
+        are then a subset of the words matching the previous query,
+        i.e. only the range of the prefix index found for the previous
+        query needs to be searched. If the query does not extend the
+        previous query (backspace, cursor movement, new word, …), the
+        whole prefix index is searched.
+        '''
+        low = 0
+        high: Optional[int] = None
+        previous = self._previous_prefix_ranges.get(dictionary.name)
+        if previous is not None and query.startswith(previous[0]):
+            (_previous_query, low, high) = previous
+        (start, end) = dictionary.prefix_range(query, low, high)
+        self._previous_prefix_ranges[dictionary.name] = (query, start, end)
+        return dictionary.ranked_completions(start, end)
+
     def suggest(self, input_phrase: str) -> List[Tuple[str, int]]:
         # pylint: disable=line-too-long
         '''Return completions or corrections for the input phrase
@@ -627,6 +2080,10 @@ class Hunspell:
                        the beginning of <word> (accent insensitive match)
                    negative number: This is a spell checking correction
 
+        If a deadline has been set with set_suggest_deadline(), the
+        spell checking corrections are missing from the result if
+        they could not be computed in time.
+
         Examples:
 
         (Attention, the return values are in internal
@@ -711,8 +2168,82 @@ class Hunspell:
         # make sure input_phrase is in the internal normalization form (NFD):
         input_phrase = unicodedata.normalize(
             itb_util_core.NORMALIZATION_FORM_INTERNAL, input_phrase)
+        dictionaries_generation = self._dictionaries_generation
+        if self._suggest_deadline is None or len(input_phrase) < 4:
+            return self._suggest(input_phrase, dictionaries_generation)
+        with self._suggest_lock:
+            future = self._suggest_jobs.get(
+                (input_phrase, dictionaries_generation))
+            if (future is None
+                or (future.done() and not _future_succeeded(future))):
+                if self._suggest_executor is None:
+                    self._suggest_executor = (
+                        concurrent.futures.ThreadPoolExecutor(
+                            max_workers=1,
+                            thread_name_prefix='itb-spelling-suggestions'))
+                future = self._suggest_executor.submit(
+                    self._spelling_suggestions_job,
+                    input_phrase, self._suggest_generation,
+                    dictionaries_generation)
+                self._suggest_jobs[
+                    (input_phrase, dictionaries_generation)] = future
+        try:
+            future.result(timeout=self._suggest_deadline)
+        except (concurrent.futures.TimeoutError,
+                concurrent.futures.CancelledError):
+            pass
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error computing spelling suggestions: %s: %s',
+                error.__class__.__name__, error)
+        with self._suggest_lock:
+            if _future_succeeded(future):
+                return self._suggest(input_phrase, dictionaries_generation)
+            self._suggest_incomplete.add(input_phrase)
+        if DEBUG_LEVEL > 1:
+            LOGGER.debug(
+                'Spelling suggestions for “%s” not ready within %s seconds',
+                input_phrase, self._suggest_deadline)
+        future.add_done_callback(
+            functools.partial(self._spelling_suggestions_done, input_phrase))
+        return self._suggest(
+            input_phrase, dictionaries_generation, spelling_suggestions=False)
 
+    # Don’t use @lru_cache(maxsize=None) here, that has a high risk of
+    # memory leaks.  It caches forever — and it keeps strong
+    # references to all function arguments and results. If the method
+    # is on a class instance (self), and the cache calls involving
+    # self, then self gets kept alive — even if no other code
+    # references it! That is a high risk of memory leaks when
+    # instantiated class objects go out of scope.  With a bounded
+    # cache, Python will evict the oldest cache entries automatically
+    # when the cache grows beyond 500,000 entries. That is much safer
+    # The self reference can still stay around as long as there are
+    # still entries in the cache for that instance. But if all entries
+    # referring to a self are evicted, then self can be garbage
+    # collected properly.
+    @functools.lru_cache(maxsize=500_000)
+    def _suggest(
+            self,
+            input_phrase: str,
+            dictionaries_generation: int,
+            spelling_suggestions: bool = True) -> List[Tuple[str, int]]:
+        '''Return completions or corrections for the input phrase
+
+        :param input_phrase: A string to find completions or corrections
+                             for in the internal normalization form
+        :param dictionaries_generation: The value of
+                                        self._dictionaries_generation
+                                        read before calling this. Only
+                                        used as part of the cache key.
+        :param spelling_suggestions: Whether to include the spelling
+                                     suggestions from enchant, pyhunspell
+                                     or voikko
+        :return: See suggest()
+        '''
         suggested_words: Dict[str, Dict[str, int]] = {}
+        # Word frequencies of the completions, if known:
+        frequencies: Dict[str, int] = {}
         for dictionary in self._dictionaries:
             name = dictionary.name
             suggested_words[name] = {}
@@ -727,14 +2258,13 @@ class Hunspell:
                 if len(input_phrase) <= dictionary.max_word_len:
                     if dictionary.word_pairs:
                         query = input_phrase_no_accents.casefold()
-                        for word, stripped in dictionary.word_pairs:
-                            if stripped.casefold().startswith(query):
-                                suggested_words[name][word] = 0
                     else:
                         query = input_phrase.casefold()
-                        for word in dictionary.words:
-                            if word.casefold().startswith(query):
-                                suggested_words[name][word] = 0
+                    for word, frequency in self._completions(
+                            dictionary, query):
+                        suggested_words[name][word] = 0
+                        if frequency > frequencies.get(word, 0):
+                            frequencies[word] = frequency
                 if len(input_phrase) >= 4:
                     if dictionary.spellcheck(input_phrase):
                         # This is a valid word in this dictionary.
@@ -747,6 +2277,10 @@ class Hunspell:
                         # thinks it is a correct word, it must be
                         # counted as a match of course:
                         suggested_words[name][input_phrase] = 0
+                if len(input_phrase) < 4:
+                    continue
+                extra_suggestions: Iterable[str] = ()
+                if spelling_suggestions:
                     # Add suffixes:
                     # See: https://github.com/mike-fabian/ibus-typing-booster/issues/799
                     suffixed_suggestions = {
@@ -762,24 +2296,35 @@ class Hunspell:
                         for x in
                         dictionary.spellcheck_suggest(input_phrase)
                     )
-                    for index, suggestion in enumerate(extra_suggestions):
-                        if suggestion not in suggested_words[name]:
-                            if (dictionary.word_pairs
-                                and
-                                itb_util_core.remove_accents(
-                                    suggestion,
-                                    keep=itb_util_core.ACCENT_LANGUAGES[
-                                        dictionary.language])
-                                == input_phrase_no_accents):
-                                suggested_words[name][suggestion] = 0
-                            else:
-                                suggested_words[name][suggestion] = -(index + 1)
+                if (dictionary.correction_index is not None
+                    and name in self._correction_index_names):
+                    # The correction index is fast enough to be used
+                    # even when the other spelling suggestions are
+                    # skipped. Its corrections are already in the
+                    # internal normalization form:
+                    extra_suggestions = itertools.chain(
+                        extra_suggestions,
+                        dictionary.correction_index.corrections(
+                            input_phrase))
+                for index, suggestion in enumerate(extra_suggestions):
+                    if suggestion not in suggested_words[name]:
+                        if (dictionary.word_pairs
+                            and
+                            itb_util_core.remove_accents(
+                                suggestion,
+                                keep=itb_util_core.ACCENT_LANGUAGES[
+                                    dictionary.language])
+                            == input_phrase_no_accents):
+                            suggested_words[name][suggestion] = 0
+                        else:
+                            suggested_words[name][suggestion] = -(index + 1)
         suggested_words_total = itb_util_core.merge_dicts_max(
             *suggested_words.values())
         sorted_suggestions = sorted(
             suggested_words_total.items(),
             key=lambda x: (
                 - x[1],    # 0: in dictionary, negative: spellcheck
+                - frequencies.get(x[0], 0), # word frequency descending
                 len(x[0]), # length of word ascending
                 x[0],      # alphabetical
             ))[0:MAX_WORDS]
@@ -787,6 +2332,103 @@ class Hunspell:
 
 BENCHMARK = True
 
+def benchmark_incremental_completion(
+        dictionary_name: str = 'de_DE',
+        words: Iterable[str] = (
+            'Geschwindigkeitsübertretungsverfahren',
+            'Donaudampfschifffahrtsgesellschaft',
+            'Rechtsschutzversicherungsgesellschaften',
+            'Kraftfahrzeughaftpflichtversicherung',
+            'Grundstücksverkehrsgenehmigungszuständigkeit',
+        ),
+        repeat: int = 200) -> None:
+    '''Benchmark the incremental narrowing of the prefix index
+
+    Types the words character by character and logs the average time
+    of the completion lookup for each keystroke, once searching the
+    whole prefix index for each keystroke and once narrowing the
+    range found for the previous keystroke.
+
+    :param dictionary_name: The dictionary to use
+    :param words: The words to type
+    :param repeat: How often to type each word
+    '''
+    hunspell_object = Hunspell([dictionary_name])
+    if not hunspell_object._dictionaries: # pylint: disable=protected-access
+        return
+    dictionary = hunspell_object._dictionaries[0] # pylint: disable=protected-access
+    if not dictionary.words:
+        LOGGER.info('Benchmark skipped, %s not found.', dictionary_name)
+        return
+    keep = itb_util_core.ACCENT_LANGUAGES.get(dictionary.language)
+    for word in words:
+        word = unicodedata.normalize(
+            itb_util_core.NORMALIZATION_FORM_INTERNAL, word)
+        if keep is not None:
+            word = itb_util_core.remove_accents(word, keep=keep)
+        queries = [word[:length].casefold()
+                   for length in range(1, len(word) + 1)]
+        times_full = [0.0] * len(queries)
+        times_incremental = [0.0] * len(queries)
+        for _ in range(repeat):
+            for index, query in enumerate(queries):
+                hunspell_object._previous_prefix_ranges = {} # pylint: disable=protected-access
+                start_time = time.perf_counter()
+                hunspell_object._completions(dictionary, query) # pylint: disable=protected-access
+                times_full[index] += time.perf_counter() - start_time
+            hunspell_object._previous_prefix_ranges = {} # pylint: disable=protected-access
+            for index, query in enumerate(queries):
+                start_time = time.perf_counter()
+                hunspell_object._completions(dictionary, query) # pylint: disable=protected-access
+                times_incremental[index] += time.perf_counter() - start_time
+        LOGGER.info('Typing “%s” with %s:', word, dictionary_name)
+        for index, query in enumerate(queries):
+            time_full = times_full[index] / repeat * 1e6
+            time_incremental = times_incremental[index] / repeat * 1e6
+            LOGGER.info(
+                '%-45s full: %8.2f µs incremental: %8.2f µs speedup: %5.2f',
+                query, time_full, time_incremental,
+                time_full / time_incremental if time_incremental else 0.0)
+        LOGGER.info(
+            'Total per word: full: %.2f µs incremental: %.2f µs',
+            sum(times_full) / repeat * 1e6,
+            sum(times_incremental) / repeat * 1e6)
+
+def benchmark_compact_storage(
+        dictionary_name: str = 'de_DE',
+        queries: Iterable[str] = ('g', 'ge', 'ges', 'gesch', 'geschwindigkeit'),
+        repeat: int = 100) -> None:
+    '''Compare the memory use and the speed of the completions
+    of a dictionary with and without compact storage
+
+    :param dictionary_name: The dictionary to use
+    :param queries: The casefolded and accent stripped prefixes
+                    to complete
+    :param repeat: How often to complete each query
+    '''
+    dictionary = Dictionary(dictionary_name)
+    if not dictionary.words:
+        LOGGER.info('Benchmark skipped, %s not found.', dictionary_name)
+        return
+    compact_storage = Dictionary.compact_storage
+    for compact in (False, True):
+        dictionary.set_compact_storage(compact)
+        total_time = 0.0
+        for query in queries:
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                (start, end) = dictionary.prefix_range(query)
+                dictionary.ranked_completions(start, end)
+            total_time += time.perf_counter() - start_time
+        LOGGER.info(
+            '%s compact storage %s: %s words, %s bytes (%.1f bytes per word), '
+            'completions: %.2f µs per query',
+            dictionary_name, compact, len(dictionary.words),
+            dictionary.memory_usage(),
+            dictionary.memory_usage() / len(dictionary.words),
+            total_time / repeat / len(tuple(queries)) * 1e6)
+    dictionary.set_compact_storage(compact_storage)
+
 def main() -> None:
     '''
     Used for testing and profiling.
@@ -820,9 +2462,14 @@ def main() -> None:
         stats.sort_stats('cumulative')
         stats.print_stats('hunspell', 25)
         stats.print_stats('enchant', 25)
+        benchmark_incremental_completion()
+        benchmark_compact_storage()
 
     LOGGER.info('itb_util_core.remove_accents() cache info: %s',
                 itb_util_core.remove_accents.cache_info())
+    for dictionary in Dictionary._instances.values(): # pylint: disable=protected-access
+        LOGGER.info('Dictionary %s spellcheck() cache info: %s',
+                    dictionary.name, dictionary.spellcheck_cache_info())
 
     sys.exit(failed)
 
@@ -156,6 +156,10 @@ OFF_THE_RECORD_MODE_SYMBOL = '🕵'
 
 IBUS_VERSION = (IBus.MAJOR_VERSION, IBus.MINOR_VERSION, IBus.MICRO_VERSION)
 
+# Write the phrases learned from user input to the user database
+# when there has been no commit for this long:
+DATABASE_FLUSH_DELAY_MILLISECONDS = 3000
+
 def log_glib_callback_exception(
         func: Callable[..., Any],
         args: Tuple[Any, ...],
@@ -697,6 +701,7 @@ class TypingBoosterEngine(IBus.Engine):
             break_on_hyphens=True)
 
         self._timeout_source_id: int = 0
+        self._database_flush_source_id: int = 0
         self._candidates_delay_milliseconds: int = self._settings_dict[
             'candidatesdelaymilliseconds']['user']
         self._candidates_delay_milliseconds = max(
@@ -939,8 +944,42 @@ class TypingBoosterEngine(IBus.Engine):
             self._gsettings.set_value(
                 'dictionary',
                 GLib.Variant.new_string(','.join(self._dictionary_names)))
+        self.database.hunspell_obj.set_dictionaries_loaded_callback(
+            self._on_dictionaries_loaded)
+        self._compact_dictionaries: bool = self._settings_dict[
+            'compactdictionaries']['user']
+        self.database.hunspell_obj.set_compact_storage(
+            self._compact_dictionaries)
+        # Load big dictionaries in a thread to avoid blocking the
+        # main loop. But not in unit tests, these need all
+        # dictionaries immediately:
         self.database.hunspell_obj.set_dictionary_names(
-            self._dictionary_names[:])
+            self._dictionary_names[:], background=not self._unit_test)
+        self._correction_index_dictionaries: List[str] = [
+            name.strip() for name in self._settings_dict[
+                'correctionindexdictionaries']['user'].split(',')
+            if name.strip()]
+        self.database.hunspell_obj.set_correction_index_names(
+            self._correction_index_dictionaries,
+            background=not self._unit_test)
+        self._spellcheck_suggest_deadline_milliseconds: int = (
+            self._settings_dict[
+                'spellchecksuggestdeadlinemilliseconds']['user'])
+        self.database.hunspell_obj.set_suggestions_ready_callback(
+            self._on_spelling_suggestions_ready)
+        # Write to and reload from the database in threads to avoid
+        # blocking the main loop. Unit tests use the main thread
+        # to get reproducible results:
+        self.database.set_results_ready_callback(
+            self._on_database_results_ready)
+        self.database.set_use_threads(not self._unit_test)
+        # Get the user database into the page cache before the first
+        # key is typed:
+        self.database.prewarm_database()
+        self._set_hunspell_suggest_deadline()
+        # The transliterated strings for which the candidates were
+        # last updated, see _update_candidates():
+        self._transliterated_strings_previous_update: Dict[str, str] = {}
         self._dictionary_flags: Dict[str, str] = itb_util_core.get_flags(
             self._dictionary_names)
 
@@ -1261,6 +1300,12 @@ class TypingBoosterEngine(IBus.Engine):
             'dictionary': {
                 'set': self.set_dictionary_names,
                 'get': self.get_dictionary_names},
+            'correctionindexdictionaries': {
+                'set': self.set_correction_index_dictionaries,
+                'get': self.get_correction_index_dictionaries},
+            'compactdictionaries': {
+                'set': self.set_compact_dictionaries,
+                'get': self.get_compact_dictionaries},
             'dictionaryinstalltimestamp': {
                 'set': self._reload_dictionaries},
             'inputmethodchangetimestamp': {
@@ -1349,6 +1394,9 @@ class TypingBoosterEngine(IBus.Engine):
             'candidatesdelaymilliseconds': {
                 'set': self.set_candidates_delay_milliseconds,
                 'get': self.get_candidates_delay_milliseconds},
+            'spellchecksuggestdeadlinemilliseconds': {
+                'set': self.set_spellcheck_suggest_deadline_milliseconds,
+                'get': self.get_spellcheck_suggest_deadline_milliseconds},
             'ibuseventsleepseconds': {
                 'set': self.set_ibus_event_sleep_seconds,
                 'get': self.get_ibus_event_sleep_seconds},
@@ -1740,15 +1788,48 @@ class TypingBoosterEngine(IBus.Engine):
                     self._typed_compose_sequence))
         return caret
 
+    def _spellcheck_candidates(
+            self,
+            candidates: List[itb_util_core.PredictionCandidate]
+    ) -> Dict[str, List[str]]:
+        '''Spellcheck all candidates in one call
+
+        :param candidates: The candidates which are about to be added
+                           to the lookup table
+        :return: A dictionary mapping the phrases of the candidates
+                 normalized like in _append_candidate_to_lookup_table()
+                 to the names of the dictionaries which accept them.
+        '''
+        if (self._m17n_trans_parts.candidates
+            or self._typed_compose_sequence):
+            return {}
+        phrases = []
+        for cand in candidates:
+            if cand.comment:
+                continue
+            phrase = itb_util_core.normalize_nfc_and_composition_exclusions(
+                cand.phrase)
+            if len(phrase) >= 3 and not itb_util_core.is_invisible(phrase):
+                phrases.append(phrase)
+        return self.database.hunspell_obj.spellcheck_match_list_many(phrases)
+
     def _append_candidate_to_lookup_table(
             self, phrase: str = '',
             user_freq: float = 0.0,
             comment: str = '',
             from_user_db: bool = False,
-            spell_checking: bool = False) -> None:
-        '''append candidate to lookup_table'''
+            spell_checking: bool = False,
+            dictionary_matches: Optional[List[str]] = None) -> None:
+        '''append candidate to lookup_table
+
+        :param dictionary_matches: The names of the dictionaries which
+                                   accept the phrase as a valid word
+                                   if already known, for example from
+                                   _spellcheck_candidates(). If None,
+                                   the phrase is spellchecked here if
+                                   necessary.
+        '''
         phrase = itb_util_core.normalize_nfc_and_composition_exclusions(phrase)
-        dictionary_matches: List[str] = []
         if phrase and itb_util_core.is_invisible(phrase):
             if len(phrase) == 1:
                 if comment == '':
@@ -1758,12 +1839,16 @@ class TypingBoosterEngine(IBus.Engine):
                     comment = f'U+{ord(phrase):04X} ' + itb_util_core.unicode_name(
                         phrase).lower()
             phrase = repr(phrase)
+            dictionary_matches = []
         elif (len(phrase) >= 3
             and not comment
             and not self._m17n_trans_parts.candidates
             and not self._typed_compose_sequence):
-            dictionary_matches = (
-                self.database.hunspell_obj.spellcheck_match_list(phrase))
+            if dictionary_matches is None:
+                dictionary_matches = (
+                    self.database.hunspell_obj.spellcheck_match_list(phrase))
+        else:
+            dictionary_matches = []
         # Embed “phrase” and “comment” separately with “Explicit
         # Directional Embeddings” (RLE, LRE, PDF).
         #
@@ -1915,6 +2000,13 @@ class TypingBoosterEngine(IBus.Engine):
         phrase_frequencies: Dict[str, float] = {}
         phrase_candidates: List[itb_util_core.PredictionCandidate] = []
         self._lookup_table.enabled_by_min_char_complete = False
+        if (self._transliterated_strings
+            != self._transliterated_strings_previous_update):
+            # Spelling suggestions still being computed for the
+            # previous input are not needed anymore:
+            self.database.hunspell_obj.cancel_suggestions()
+            self._transliterated_strings_previous_update = dict(
+                self._transliterated_strings)
         if self._word_predictions or self._temporary_word_predictions:
             for ime in self._current_imes:
                 if self._transliterated_strings[ime]:
@@ -2133,13 +2225,17 @@ class TypingBoosterEngine(IBus.Engine):
                         comment='',
                         from_user_db=cand.user_freq > 0,
                         spell_checking=cand.user_freq < 0))
+        dictionary_matches = self._spellcheck_candidates(self._candidates)
         for cand in self._candidates:
             self._append_candidate_to_lookup_table(
                 phrase=cand.phrase,
                 user_freq=cand.user_freq,
                 comment=cand.comment,
                 from_user_db=cand.from_user_db,
-                spell_checking=cand.spell_checking)
+                spell_checking=cand.spell_checking,
+                dictionary_matches=dictionary_matches.get(
+                    itb_util_core.normalize_nfc_and_composition_exclusions(
+                        cand.phrase)))
         self._candidates_case_mode_orig = self._candidates.copy()
         if self._current_case_mode != 'orig':
             self._case_mode_change(mode=self._current_case_mode)
@@ -2466,7 +2562,8 @@ class TypingBoosterEngine(IBus.Engine):
         if dictionary_names == self._dictionary_names: # nothing to do
             return
         self._dictionary_names = dictionary_names
-        self.database.hunspell_obj.set_dictionary_names(dictionary_names)
+        self.database.hunspell_obj.set_dictionary_names(
+            dictionary_names, background=not self._unit_test)
         self._dictionary_flags = itb_util_core.get_flags(self._dictionary_names)
         self._update_dictionary_menu_dicts()
         self._init_or_update_property_menu_dictionary(
@@ -2487,12 +2584,157 @@ class TypingBoosterEngine(IBus.Engine):
                 'dictionary',
                 GLib.Variant.new_string(','.join(dictionary_names)))
 
+    def _on_dictionaries_loaded(self) -> None:
+        '''Called from the thread loading dictionaries in the
+        background when a dictionary has been loaded.
+        '''
+        GLib.idle_add(self._update_ui_after_dictionaries_loaded)
+
+    def _update_ui_after_dictionaries_loaded(self) -> bool:
+        '''Update the candidates with the newly loaded dictionaries
+
+        :return: *Must* always return False to avoid that this callback
+                 called by GLib.idle_add() runs again.
+        '''
+        if self._debug_level > 1:
+            LOGGER.debug('Dictionary loaded in the background.')
+        if not self.is_empty():
+            self._update_ui()
+        return False
+
+    def _on_spelling_suggestions_ready(self, input_phrase: str) -> None:
+        '''Called from the thread computing spelling suggestions when
+        suggestions which were not ready within the deadline have
+        become ready.
+
+        :param input_phrase: The input the suggestions are for
+        '''
+        GLib.idle_add(
+            self._update_ui_after_spelling_suggestions_ready, input_phrase)
+
+    def _update_ui_after_spelling_suggestions_ready(
+            self, input_phrase: str) -> bool:
+        '''Update the candidates to add the spelling suggestions
+
+        :param input_phrase: The input the suggestions are for
+        :return: *Must* always return False to avoid that this callback
+                 called by GLib.idle_add() runs again.
+        '''
+        if self._debug_level > 1:
+            LOGGER.debug('Spelling suggestions ready for “%s”', input_phrase)
+        if self.is_empty():
+            return False
+        if self._lookup_table.is_cursor_visible():
+            # The user is already selecting candidates, do not
+            # change the lookup table under the cursor:
+            return False
+        self._update_ui()
+        return False
+
+    def _on_database_results_ready(self) -> None:
+        '''Called from the database reader thread when it has
+        finished reading something, for example when it has reloaded
+        the n-gram model.
+        '''
+        GLib.idle_add(self._collect_database_results)
+
+    def _collect_database_results(self) -> bool:
+        '''Use the results of the database reader thread
+
+        :return: *Must* always return False to avoid that this callback
+                 called by GLib.idle_add() runs again.
+        '''
+        self.database.collect_background_results()
+        return False
+
+    def _set_hunspell_suggest_deadline(self) -> None:
+        '''Pass the deadline for spelling suggestions to the
+        Hunspell object.
+
+        Unit tests compute spelling suggestions synchronously
+        to get reproducible results.
+        '''
+        if self._unit_test:
+            self.database.hunspell_obj.set_suggest_deadline(None)
+            return
+        self.database.hunspell_obj.set_suggest_deadline(
+            self._spellcheck_suggest_deadline_milliseconds / 1000)
+
     def get_dictionary_names(self) -> List[str]:
         '''Get current list of dictionary names'''
         # It is important to return a copy, we do not want to change
         # the private member variable directly.
         return self._dictionary_names[:]
 
+    def set_correction_index_dictionaries(
+            self,
+            dictionary_names: Union[str, List[str], Any],
+            update_gsettings: bool = True) -> None:
+        '''Set the dictionaries which use a correction index for
+        fast spelling corrections
+
+        :param dictionary_names: List of names of dictionaries.
+                                 If a single string is used, it should
+                                 contain the names of the dictionaries
+                                 separated by commas.
+        :param update_gsettings: Whether to write the change to Gsettings.
+                                 Set this to False if this method is
+                                 called because the Gsettings key changed
+                                 to avoid endless loops when the Gsettings
+                                 key is changed twice in a short time.
+        '''
+        LOGGER.debug(
+            '(%s, update_gsettings = %s)', dictionary_names, update_gsettings)
+        if isinstance(dictionary_names, str):
+            dictionary_names = [
+                name.strip() for name in dictionary_names.split(',')
+                if name.strip()]
+        if dictionary_names == self._correction_index_dictionaries:
+            return
+        self._correction_index_dictionaries = dictionary_names
+        self.database.hunspell_obj.set_correction_index_names(
+            dictionary_names, background=not self._unit_test)
+        if not self.is_empty():
+            self._update_ui()
+        if update_gsettings:
+            self._gsettings.set_value(
+                'correctionindexdictionaries',
+                GLib.Variant.new_string(','.join(dictionary_names)))
+
+    def get_correction_index_dictionaries(self) -> List[str]:
+        '''Get the names of the dictionaries using a correction index'''
+        return self._correction_index_dictionaries[:]
+
+    def set_compact_dictionaries(
+            self,
+            mode: Union[bool, Any],
+            update_gsettings: bool = True) -> None:
+        '''Sets whether the dictionaries store their words compactly
+
+        :param mode: Whether to use compact storage for the words of
+                     the dictionaries. Needs much less memory but
+                     the completions are a bit slower.
+        :param update_gsettings: Whether to write the change to Gsettings.
+                                 Set this to False if this method is
+                                 called because the Gsettings key changed
+                                 to avoid endless loops when the Gsettings
+                                 key is changed twice in a short time.
+        '''
+        LOGGER.debug(
+            '(%s, update_gsettings = %s)', mode, update_gsettings)
+        if mode == self._compact_dictionaries:
+            return
+        self._compact_dictionaries = mode
+        self.database.hunspell_obj.set_compact_storage(mode)
+        if update_gsettings:
+            self._gsettings.set_value(
+                'compactdictionaries',
+                GLib.Variant.new_boolean(mode))
+
+    def get_compact_dictionaries(self) -> bool:
+        '''Returns whether the dictionaries store their words compactly'''
+        return self._compact_dictionaries
+
     def set_autosettings(
             self,
             autosettings: Union[List[Tuple[str, str, str]], Any],
@@ -3412,6 +3654,11 @@ class TypingBoosterEngine(IBus.Engine):
                 preedit_ime = self.get_current_imes()[0]
                 if preedit_ime != 'NoIME':
                     aux_string += f' {preedit_ime} '
+        if (self._label_busy and self._label_busy_string.strip()
+            and self.database.hunspell_obj.is_loading()):
+            # Dictionaries are still being loaded in the background,
+            # the candidates may not be complete yet:
+            aux_string = f'{self._label_busy_string.strip()} {aux_string}'
         # Colours do not work at the moment in the auxiliary text!
         # Needs fix in ibus.
         attrs = IBus.AttrList()
@@ -3694,13 +3941,17 @@ class TypingBoosterEngine(IBus.Engine):
                 from_user_db=True,
                 spell_checking=False)
             for cand in phrase_candidates]
+        dictionary_matches = self._spellcheck_candidates(self._candidates)
         for cand in self._candidates:
             self._append_candidate_to_lookup_table(
                 phrase=cand.phrase,
                 user_freq=cand.user_freq,
                 comment=cand.comment,
                 from_user_db=cand.from_user_db,
-                spell_checking=cand.spell_checking)
+                spell_checking=cand.spell_checking,
+                dictionary_matches=dictionary_matches.get(
+                    itb_util_core.normalize_nfc_and_composition_exclusions(
+                        cand.phrase)))
         self._candidates_case_mode_orig = self._candidates.copy()
         if self._current_case_mode != 'orig':
             self._case_mode_change(mode=self._current_case_mode)
@@ -4382,6 +4633,7 @@ class TypingBoosterEngine(IBus.Engine):
             phrase=commit_phrase,
             p_phrase=self.get_p_phrase(),
             pp_phrase=self.get_pp_phrase())
+        self._schedule_database_flush()
         if (stripped_commit_phrase
             and self.get_p_phrase()
             and self.get_pp_phrase()
@@ -4421,6 +4673,7 @@ class TypingBoosterEngine(IBus.Engine):
                 phrase=self.get_p_phrase() + ' ' + stripped_commit_phrase,
                 p_phrase=self.get_pp_phrase(),
                 pp_phrase=self.get_ppp_phrase())
+            self._schedule_database_flush()
         # push context after recording in the database is finished:
         if push_context:
             self.push_context(stripped_commit_phrase)
@@ -6868,6 +7121,36 @@ class TypingBoosterEngine(IBus.Engine):
         '''Returns the current value of the candidates delay in milliseconds'''
         return self._candidates_delay_milliseconds
 
+    def set_spellcheck_suggest_deadline_milliseconds(
+            self,
+            milliseconds: Union[int, Any],
+            update_gsettings: bool = True) -> None:
+        '''Sets how long to wait for spelling suggestions in milliseconds
+
+        :param milliseconds:     How long to wait for spelling suggestions
+                                 before showing the candidates without them
+        :param update_gsettings: Whether to write the change to Gsettings.
+                                 Set this to False if this method is
+                                 called because the Gsettings key changed
+                                 to avoid endless loops when the Gsettings
+                                 key is changed twice in a short time.
+        '''
+        LOGGER.debug(
+            '(%s, update_gsettings = %s)', milliseconds, update_gsettings)
+        if milliseconds == self._spellcheck_suggest_deadline_milliseconds:
+            return
+        self._spellcheck_suggest_deadline_milliseconds = milliseconds
+        self._set_hunspell_suggest_deadline()
+        if update_gsettings:
+            self._gsettings.set_value(
+                'spellchecksuggestdeadlinemilliseconds',
+                GLib.Variant.new_uint32(
+                    self._spellcheck_suggest_deadline_milliseconds))
+
+    def get_spellcheck_suggest_deadline_milliseconds(self) -> int:
+        '''Returns how long to wait for spelling suggestions in milliseconds'''
+        return self._spellcheck_suggest_deadline_milliseconds
+
     def set_ibus_event_sleep_seconds(
             self,
             seconds: Union[float, Any],
@@ -11256,8 +11539,33 @@ class TypingBoosterEngine(IBus.Engine):
             phrase=stripped_commit_phrase,
             p_phrase=self.get_p_phrase(),
             pp_phrase=self.get_pp_phrase())
+        self._schedule_database_flush()
         self.push_context(stripped_commit_phrase)
 
+    def _schedule_database_flush(self) -> None:
+        '''Write the phrases learned from user input to the database
+        when there has been no commit for a while
+
+        The timer is restarted on every commit, so the database is
+        written only once when the user pauses typing.
+        '''
+        if self._database_flush_source_id:
+            GLib.source_remove(self._database_flush_source_id)
+            self._database_flush_source_id = 0
+        if not self.database.has_pending_phrases():
+            return
+        self._database_flush_source_id = GLib.timeout_add(
+            DATABASE_FLUSH_DELAY_MILLISECONDS, self._flush_database)
+
+    def _flush_database(self) -> bool:
+        '''Write the phrases learned from user input to the database
+
+        :return: False, always, to remove the timeout source
+        '''
+        self._database_flush_source_id = 0
+        self.database.flush_pending_phrases(background=True)
+        return False
+
     def do_focus_out(self) -> None: # pylint: disable=arguments-differ
         '''
         Called for ibus < 1.5.27 when a window loses focus while
@@ -11292,6 +11600,10 @@ class TypingBoosterEngine(IBus.Engine):
         # been recorded in the user database yet. Do it now:
         if not self.is_empty():
             self._record_in_database_and_push_context()
+        if self._database_flush_source_id:
+            GLib.source_remove(self._database_flush_source_id)
+            self._database_flush_source_id = 0
+        self.database.flush_pending_phrases(background=True)
         self.clear_context()
         self._clear_input_and_update_ui()
         self._revert_autosettings()
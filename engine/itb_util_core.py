@@ -43,6 +43,10 @@ from enum import IntFlag
 import os
 import functools
 import collections
+import json
+import hashlib
+import array
+import gzip
 import unicodedata
 import locale
 import logging
@@ -4087,6 +4091,69 @@ def find_hunspell_dictionary(language: str) -> Tuple[str, str]:
         'No file %s.dic found in %s', language, dirnames)
     return ('', '')
 
+def find_word_frequency_file(language: str) -> str:
+    '''
+    Find the word frequency file for a language
+
+    Word frequency files are searched in the same directories as
+    the hunspell dictionaries and are named like the dictionaries,
+    with the extension “.freq” or “.freq.gz” instead of “.dic”,
+    for example “de_DE.freq” or “de.freq.gz”.
+
+    :param language: The language to find the word frequency file for
+    :return: The full path of the file found or '' if there is none.
+    '''
+    dirnames: List[str] = hunspell_dirnames()
+    for lang in expand_languages([language]):
+        if lang.startswith('en') and not language.startswith('en'):
+            continue
+        for dirname in dirnames:
+            for extension in ('.freq', '.freq.gz'):
+                path = os.path.join(dirname, lang + extension)
+                if os.path.isfile(path):
+                    return path
+    return ''
+
+def read_word_frequencies(path: str) -> Dict[str, int]:
+    '''
+    Read a word frequency file
+
+    Each line of the file contains a word and its count in some
+    corpus separated by white space, for example “house 12345”.
+    Empty lines and lines starting with “#” are ignored. The file
+    must be encoded in UTF-8, it may be compressed with gzip.
+
+    :param path: The full path of the word frequency file
+    :return: A dictionary mapping the casefolded words in the
+             internal normalization form to their counts. If a
+             casefolded word occurs more than once, the biggest
+             count is used.
+    '''
+    frequencies: Dict[str, int] = {}
+    try:
+        open_function: Any = gzip.open if path.endswith('.gz') else open
+        with open_function(path, 'rt', encoding='UTF-8') as frequency_file:
+            for line in frequency_file:
+                fields = line.split()
+                if len(fields) < 2 or fields[0].startswith('#'):
+                    continue
+                try:
+                    count = int(fields[-1])
+                except ValueError:
+                    continue
+                word = unicodedata.normalize(
+                    NORMALIZATION_FORM_INTERNAL, ' '.join(fields[:-1])
+                ).casefold()
+                if count > frequencies.get(word, 0):
+                    frequencies[word] = count
+    except (OSError, UnicodeDecodeError) as error:
+        LOGGER.warning('Error reading word frequency file %s: %s: %s',
+                       path, error.__class__.__name__, error)
+        return {}
+    LOGGER.info('%s words read from word frequency file %s.',
+                len(frequencies), path)
+    return frequencies
+
 def get_hunspell_dictionary_wordlist(
         language: str) -> Tuple[str, str, List[str]]:
     '''
@@ -4223,6 +4290,294 @@ def get_hunspell_dictionary_wordlist(
     ]
     return (dic_path, dictionary_encoding, word_list)
 
+# Increase this when the format of the word list cache files changes:
+WORDLIST_CACHE_VERSION = 1
+
+def _wordlist_cache_path(dic_path: str, keep: Optional[str]) -> str:
+    '''Return the path of the cache file for a .dic file
+
+    :param dic_path: Full path of the .dic file
+    :param keep: The characters to keep when removing accents,
+                 None if accents are not removed at all.
+    '''
+    key = f'{dic_path}\0{keep}'.encode('UTF-8', errors='replace')
+    digest = hashlib.sha256(key).hexdigest()[:16]
+    return os.path.join(
+        xdg_save_cache_path('ibus-typing-booster'),
+        f'{os.path.basename(dic_path)}-{digest}.wordlist')
+
+def _wordlist_cache_file_info(dic_path: str) -> Dict[str, Any]:
+    '''Return the information used to check whether a word list cache
+    file is still valid for a .dic file.
+    '''
+    aff_path = dic_path.replace('.dic', '.aff')
+    dic_stat = os.stat(dic_path)
+    info: Dict[str, Any] = {
+        'version': WORDLIST_CACHE_VERSION,
+        'normalization': NORMALIZATION_FORM_INTERNAL,
+        'unidata_version': unicodedata.unidata_version,
+        'dic_path': dic_path,
+        'dic_mtime': dic_stat.st_mtime_ns,
+        'dic_size': dic_stat.st_size,
+        'aff_mtime': None,
+        'aff_size': None,
+    }
+    if os.path.isfile(aff_path):
+        aff_stat = os.stat(aff_path)
+        info['aff_mtime'] = aff_stat.st_mtime_ns
+        info['aff_size'] = aff_stat.st_size
+    return info
+
+def read_wordlist_cache(
+        dic_path: str,
+        keep: Optional[str]) -> Optional[Tuple[str, List[str], List[str], int]]:
+    '''Read a word list from the cache if the cache is valid
+
+    :param dic_path: Full path of the .dic file
+    :param keep: The characters to keep when removing accents,
+                 None if accents are not removed at all.
+    :return: None if there is no valid cache for dic_path. Else a tuple
+             (dictionary_encoding, word_list, stripped_word_list,
+             max_word_len). stripped_word_list is empty if keep is None.
+
+    The cache file is read with a single bulk read. Its first line
+    contains a JSON header with the information to check its validity,
+    then follow the words, one per line, and, if keep is not None, the
+    accent stripped forms of the words, one per line. An empty line
+    for an accent stripped form means that it is identical to the word.
+    '''
+    try:
+        cache_path = _wordlist_cache_path(dic_path, keep)
+    except OSError as error:
+        # For example if ~/.cache is not writable:
+        LOGGER.warning('Cannot use the word list cache for %s: %s: %s',
+                       dic_path, error.__class__.__name__, error)
+        return None
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        info = _wordlist_cache_file_info(dic_path)
+        with open(cache_path, 'rb') as cache_file:
+            data = cache_file.read().decode('UTF-8')
+        (header, _newline, body) = data.partition('\n')
+        meta = json.loads(header)
+        for key, value in info.items():
+            if meta.get(key) != value:
+                LOGGER.info('Word list cache %s is outdated.', cache_path)
+                return None
+        if meta.get('keep') != keep:
+            return None
+        count = meta['count']
+        lines = body.split('\n')
+        if len(lines) != (count if keep is None else 2 * count):
+            LOGGER.warning('Word list cache %s is broken.', cache_path)
+            return None
+        word_list = lines[:count]
+        stripped_word_list: List[str] = []
+        if keep is not None:
+            stripped_word_list = [
+                stripped if stripped else word
+                for word, stripped in zip(word_list, lines[count:])]
+        LOGGER.info('Word list for %s loaded from cache %s.',
+                    dic_path, cache_path)
+        return (meta['encoding'], word_list, stripped_word_list,
+                meta['max_word_len'])
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        LOGGER.warning('Error reading word list cache %s: %s: %s',
+                       cache_path, error.__class__.__name__, error)
+    return None
+
+def write_wordlist_cache(
+        dic_path: str,
+        keep: Optional[str],
+        dictionary_encoding: str,
+        word_list: List[str],
+        stripped_word_list: List[str],
+        max_word_len: int) -> bool:
+    '''Write a word list to the cache
+
+    See read_wordlist_cache() for the format of the cache file.
+
+    :return: True on success, False on failure.
+    '''
+    try:
+        cache_path = _wordlist_cache_path(dic_path, keep)
+    except OSError as error:
+        LOGGER.warning('Cannot use the word list cache for %s: %s: %s',
+                       dic_path, error.__class__.__name__, error)
+        return False
+    try:
+        meta = _wordlist_cache_file_info(dic_path)
+        meta.update({
+            'keep': keep,
+            'encoding': dictionary_encoding,
+            'count': len(word_list),
+            'max_word_len': max_word_len,
+        })
+        parts = [json.dumps(meta, ensure_ascii=True), '\n'.join(word_list)]
+        if keep is not None:
+            parts.append('\n'.join(
+                stripped if stripped != word else ''
+                for word, stripped in zip(word_list, stripped_word_list)))
+        # Write to a temporary file and rename it to make sure that
+        # no partially written cache file is ever read:
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as cache_file:
+            cache_file.write('\n'.join(parts).encode('UTF-8'))
+        os.replace(tmp_path, cache_path)
+        LOGGER.info('Word list for %s written to cache %s.',
+                    dic_path, cache_path)
+        return True
+    except (OSError, ValueError, UnicodeError) as error:
+        LOGGER.warning('Error writing word list cache %s: %s: %s',
+                       cache_path, error.__class__.__name__, error)
+    return False
+
+def read_correction_index_cache(
+        dic_path: str,
+        keep: Optional[str],
+        parameters: Dict[str, Any]) -> Optional[Tuple['array.array[int]',
+                                                      'array.array[int]']]:
+    '''Read a correction index for the word list of a .dic file
+    from the cache
+
+    The correction index is stored next to the word list cache, the
+    word numbers in the correction index are the positions of the
+    words in the cached word list.
+
+    :param dic_path: Full path of the .dic file
+    :param keep: The characters to keep when removing accents,
+                 as used for the word list cache.
+    :param parameters: The parameters the correction index has been
+                       built with, a cached index built with different
+                       parameters is not used.
+    :return: None if there is no valid cache. Else a tuple of two
+             arrays (keys, word_numbers) of the same length.
+
+    The first line of the cache file is a JSON header, the two arrays
+    follow as raw machine values.
+    '''
+    try:
+        cache_path = _wordlist_cache_path(dic_path, keep)[:-len('.wordlist')]
+    except OSError as error:
+        LOGGER.warning('Cannot use the correction index cache for %s: %s: %s',
+                       dic_path, error.__class__.__name__, error)
+        return None
+    cache_path += '.corrections'
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        info = _wordlist_cache_file_info(dic_path)
+        info.update(parameters)
+        with open(cache_path, 'rb') as cache_file:
+            meta = json.loads(cache_file.readline().decode('UTF-8'))
+            for key, value in info.items():
+                if meta.get(key) != value:
+                    LOGGER.info(
+                        'Correction index cache %s is outdated.', cache_path)
+                    return None
+            keys = array.array('I')
+            word_numbers = array.array('I')
+            if (meta.get('byteorder') != sys.byteorder
+                or meta.get('itemsize') != keys.itemsize):
+                return None
+            keys.fromfile(cache_file, meta['count'])
+            word_numbers.fromfile(cache_file, meta['count'])
+        LOGGER.info('Correction index for %s loaded from cache %s.',
+                    dic_path, cache_path)
+        return (keys, word_numbers)
+    except (OSError, EOFError, ValueError, KeyError, TypeError) as error:
+        LOGGER.warning('Error reading correction index cache %s: %s: %s',
+                       cache_path, error.__class__.__name__, error)
+    return None
+
+def write_correction_index_cache(
+        dic_path: str,
+        keep: Optional[str],
+        parameters: Dict[str, Any],
+        keys: 'array.array[int]',
+        word_numbers: 'array.array[int]') -> bool:
+    '''Write a correction index to the cache
+
+    See read_correction_index_cache() for the parameters and the
+    format of the cache file.
+
+    :return: True on success, False on failure.
+    '''
+    try:
+        cache_path = _wordlist_cache_path(dic_path, keep)[:-len('.wordlist')]
+    except OSError as error:
+        LOGGER.warning('Cannot use the correction index cache for %s: %s: %s',
+                       dic_path, error.__class__.__name__, error)
+        return False
+    cache_path += '.corrections'
+    try:
+        meta = _wordlist_cache_file_info(dic_path)
+        meta.update(parameters)
+        meta.update({
+            'byteorder': sys.byteorder,
+            'itemsize': keys.itemsize,
+            'count': len(keys),
+        })
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as cache_file:
+            cache_file.write(
+                json.dumps(meta, ensure_ascii=True).encode('UTF-8') + b'\n')
+            keys.tofile(cache_file)
+            word_numbers.tofile(cache_file)
+        os.replace(tmp_path, cache_path)
+        LOGGER.info('Correction index for %s written to cache %s.',
+                    dic_path, cache_path)
+        return True
+    except (OSError, ValueError) as error:
+        LOGGER.warning('Error writing correction index cache %s: %s: %s',
+                       cache_path, error.__class__.__name__, error)
+    return False
+
+def get_hunspell_dictionary_wordlist_cached(
+        language: str,
+        keep: Optional[str] = None
+) -> Tuple[str, str, List[str], List[str], int]:
+    '''
+    Like get_hunspell_dictionary_wordlist() but use a cache
+    in ~/.cache/ibus-typing-booster/ to avoid reading, decoding and
+    normalizing the .dic file again each time.
+
+    :param language: The language of the dictionary to open
+    :param keep: The characters to keep when removing accents,
+                 None if accents should not be removed at all.
+
+    The returned Tuple looks  like this:
+
+        (dic_path, dictionary_encoding, wordlist, stripped_wordlist,
+         max_word_len)
+
+    where stripped_wordlist contains the words of wordlist with
+    accents removed (keeping the characters in keep), or is empty
+    if keep is None. max_word_len is the maximum length of the
+    words in wordlist.
+    '''
+    (dic_path, _aff_path) = find_hunspell_dictionary(language)
+    if not dic_path:
+        return ('', '', [], [], 0)
+    cached = read_wordlist_cache(dic_path, keep)
+    if cached is not None:
+        return (dic_path,) + cached
+    (dic_path,
+     dictionary_encoding,
+     word_list) = get_hunspell_dictionary_wordlist(language)
+    if not word_list:
+        return ('', '', [], [], 0)
+    stripped_word_list: List[str] = []
+    if keep is not None:
+        stripped_word_list = [
+            remove_accents(word, keep=keep) for word in word_list]
+    max_word_len = max(len(word) for word in word_list)
+    write_wordlist_cache(dic_path, keep, dictionary_encoding,
+                         word_list, stripped_word_list, max_word_len)
+    return (dic_path, dictionary_encoding, word_list, stripped_word_list,
+            max_word_len)
+
 @dataclass(frozen=True)
 class PredictionCandidate:
     '''
@@ -4259,11 +4614,18 @@ class PredictionCandidate:
 def best_candidates(
         phrase_frequencies: Dict[str, float],
         title: bool = False,
-        max_candidates: int = 20) -> List[PredictionCandidate]:
+        max_candidates: int = 20,
+        ranks: Optional[Dict[str, int]] = None) -> List[PredictionCandidate]:
     '''Sorts the phrase_frequencies dictionary and returns the best
     candidates.
 
     Should *not* change the phrase_frequencies dictionary!
+
+    :param ranks: Optional ranks of phrases (smaller is better) to
+                  order phrases with the same frequency, for example
+                  the order of the dictionary completions by their
+                  frequency in a corpus. Phrases without a rank come
+                  after the ranked ones.
     '''
     if not phrase_frequencies:
         return []
@@ -4272,12 +4634,19 @@ def best_candidates(
     phrase_frequencies_normalized = {
         normalize_nfc_and_composition_exclusions(phrase): freq
         for phrase, freq in phrase_frequencies.items()}
+    ranks_normalized: Dict[str, int] = {}
+    if ranks:
+        ranks_normalized = {
+            normalize_nfc_and_composition_exclusions(phrase): rank
+            for phrase, rank in ranks.items()}
+    no_rank = len(ranks_normalized)
     candidates = [
         PredictionCandidate(phrase=phrase, user_freq=freq)
         for phrase, freq in
         sorted(phrase_frequencies_normalized.items(),
                         key=lambda x: (
                             -1*x[1],   # user_freq descending
+                            ranks_normalized.get(x[0], no_rank),
                             len(x[0]), # len(phrase) ascending
                             x[0]       # phrase alphabetical
                         ))[:max_candidates]]
@@ -5785,6 +6154,20 @@ class M17nDbInfo:
     def __str__(self) -> str:
         return repr(self._imes)
 
+def xdg_save_cache_path(*resource: str) -> str:
+    '''
+    Like xdg_save_data_path() but for files in $XDG_CACHE_HOME,
+    i.e. usually in ~/.cache
+    '''
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    resource_joined = os.path.join(*resource)
+    assert not resource_joined.startswith('/')
+    path = os.path.join(xdg_cache_home, resource_joined)
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+    return path
+
 def xdg_save_data_path(*resource: str) -> str:
     '''
     Compatibility function for systems which do not have pyxdg.
@@ -0,0 +1,107 @@
+# vim:et sts=4 sw=4
+#
+# ibus-typing-booster - A completion input method for IBus
+#
+# Copyright (c) 2026 Mike FABIAN <mfabian@redhat.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>
+'''
+Utility to train the prediction of Typing Booster from text files
+
+Only the n-grams found in the text files are added to the user
+database, so this can be used to feed training data continuously,
+for example from a cron job:
+
+    python3 learn_from_files.py --only-new ~/Mail/sent
+
+A running Typing Booster engine does not need to be restarted. It
+notices that the user database has been changed by a different
+connection and then reloads its in-memory data.
+'''
+
+from typing import Any
+import sys
+import logging
+import argparse
+
+import tabsqlitedb
+
+LOGGER = logging.getLogger('ibus-typing-booster')
+
+def parse_args() -> Any:
+    '''
+    Parse the command line arguments.
+    '''
+    parser = argparse.ArgumentParser(
+        description='Tool to train the prediction of Typing Booster '
+        'from text files')
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        metavar='PATH',
+        help=('UTF-8 encoded text files (gzip compressed if the name '
+              'ends with ".gz") or directories which are searched '
+              'recursively.'))
+    parser.add_argument(
+        '-f', '--file',
+        dest='file',
+        type=str,
+        action='store',
+        default='user.db',
+        help=('The database file to train. A file name without a '
+              'directory is looked up in ~/.local/share/ibus-typing-booster/, '
+              'default: "%(default)s"'))
+    parser.add_argument(
+        '-n', '--only-new',
+        dest='only_new',
+        action='store_true',
+        default=False,
+        help=('Skip files which have already been read and have not '
+              'changed since. '
+              'default: %(default)s'))
+    parser.add_argument(
+        '-j', '--processes',
+        dest='processes',
+        type=int,
+        action='store',
+        default=None,
+        help=('The number of processes used to read the files, '
+              'default: the number of CPUs'))
+    parser.add_argument(
+        '-v', '--verbose',
+        dest='verbose',
+        action='store_true',
+        default=False,
+        help=('Print more verbose information. '
+              'default: %(default)s'))
+    return parser.parse_args()
+
+def main() -> None:
+    '''
+    Read training data from the files given on the command line
+    '''
+    args = parse_args()
+    log_handler = logging.StreamHandler(stream=sys.stderr)
+    log_handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s: %(message)s'))
+    LOGGER.setLevel(logging.INFO if args.verbose else logging.WARNING)
+    LOGGER.addHandler(log_handler)
+    database = tabsqlitedb.TabSqliteDb(user_db_file=args.file)
+    success = database.read_training_data_from_files(
+        args.paths, processes=args.processes, only_new=args.only_new)
+    database.database.close()
+    sys.exit(0 if success else 1)
+
+if __name__ == '__main__':
+    main()
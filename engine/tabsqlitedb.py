@@ -24,28 +24,829 @@ from typing import List
 from typing import Tuple
 from typing import Optional
 from typing import Any
-from typing import TextIO
 from typing import Iterator
+from typing import Iterable
+from typing import Callable
+from typing import TypeVar
+from typing import cast
 import os
+import io
+import bisect
+import collections
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+import site
+import sys
 import unicodedata
 from contextlib import contextmanager
 import sqlite3
+import threading
 import time
-import re
 import gzip
 import logging
 import itb_util_core
+import itb_version
 import hunspell_suggest
 
 LOGGER = logging.getLogger('ibus-typing-booster')
 
 DEBUG_LEVEL = int(0)
 
-USER_DATABASE_VERSION = '0.65'
+USER_DATABASE_VERSION = '0.68'
+
+# Older database versions which can be migrated to USER_DATABASE_VERSION
+# without losing data. Version 0.65 had no unique index on the n-gram
+# key (input_phrase, phrase, p_phrase, pp_phrase), versions 0.65 and
+# 0.66 stored the n-grams with full texts in a phrases table, versions
+# up to 0.67 stored the user defined shortcuts as n-grams with
+# user_freq >= itb_util_core.SHORTCUT_USER_FREQ:
+MIGRATABLE_USER_DATABASE_VERSIONS = ('0.65', '0.66', '0.67')
+
+# The n-grams of the user database. Each distinct text used as
+# phrase, p_phrase or pp_phrase is stored only once in the vocab
+# table and the ngrams table refers to it by its integer id. The
+# same context words occur in a lot of rows, so this makes the
+# database and its indexes much smaller and bigram and trigram
+# lookups compare integers instead of texts. The input phrases are
+# not interned because prefix queries need them ordered as texts.
+# “{schema}” is replaced by a schema prefix like “user_db.”:
+_NGRAM_TABLES_SQL = '''
+CREATE TABLE IF NOT EXISTS {schema}vocab
+(id INTEGER PRIMARY KEY,
+text TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS {schema}ngrams
+(id INTEGER PRIMARY KEY,
+input_phrase TEXT,
+phrase_id INTEGER,
+p_phrase_id INTEGER,
+pp_phrase_id INTEGER,
+user_freq INTEGER,
+timestamp REAL);
+'''
+
+# A view with the columns of the phrases table of older versions to
+# read complete rows, also used by tools like tabstatistics.py. The
+# triggers allow simple writes to the view, TabSqliteDb itself writes
+# to the ngrams table:
+_PHRASES_VIEW_SQL = '''
+CREATE VIEW IF NOT EXISTS {schema}phrases AS
+SELECT ngrams.id AS id, input_phrase,
+phrase.text AS phrase, p_phrase.text AS p_phrase,
+pp_phrase.text AS pp_phrase, user_freq, timestamp
+FROM ngrams
+JOIN vocab AS phrase ON phrase.id = ngrams.phrase_id
+JOIN vocab AS p_phrase ON p_phrase.id = ngrams.p_phrase_id
+JOIN vocab AS pp_phrase ON pp_phrase.id = ngrams.pp_phrase_id;
+CREATE TRIGGER IF NOT EXISTS {schema}phrases_insert
+INSTEAD OF INSERT ON phrases
+BEGIN
+INSERT OR IGNORE INTO vocab (text) VALUES
+(NEW.phrase), (coalesce(NEW.p_phrase, '')), (coalesce(NEW.pp_phrase, ''));
+INSERT INTO ngrams
+(id, input_phrase, phrase_id, p_phrase_id, pp_phrase_id, user_freq, timestamp)
+VALUES (NEW.id, NEW.input_phrase,
+(SELECT id FROM vocab WHERE text = NEW.phrase),
+(SELECT id FROM vocab WHERE text = coalesce(NEW.p_phrase, '')),
+(SELECT id FROM vocab WHERE text = coalesce(NEW.pp_phrase, '')),
+NEW.user_freq, NEW.timestamp);
+END;
+CREATE TRIGGER IF NOT EXISTS {schema}phrases_update
+INSTEAD OF UPDATE ON phrases
+BEGIN
+INSERT OR IGNORE INTO vocab (text) VALUES
+(NEW.phrase), (coalesce(NEW.p_phrase, '')), (coalesce(NEW.pp_phrase, ''));
+UPDATE ngrams SET input_phrase = NEW.input_phrase,
+phrase_id = (SELECT id FROM vocab WHERE text = NEW.phrase),
+p_phrase_id = (SELECT id FROM vocab WHERE text = coalesce(NEW.p_phrase, '')),
+pp_phrase_id = (SELECT id FROM vocab WHERE text = coalesce(NEW.pp_phrase, '')),
+user_freq = NEW.user_freq, timestamp = NEW.timestamp
+WHERE id = OLD.id;
+END;
+CREATE TRIGGER IF NOT EXISTS {schema}phrases_delete
+INSTEAD OF DELETE ON phrases
+BEGIN
+DELETE FROM ngrams WHERE id = OLD.id;
+END;
+'''
+
+# The user defined shortcuts. They are looked up on every keystroke
+# with a range query on input_phrase using the index
+# shortcuts_index_p, see prefix_upper_bound().
+# The unique index on (phrase, input_phrase) is used to look up the
+# shortcuts expanding to a phrase when it is committed:
+_SHORTCUTS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS {schema}shortcuts
+(id INTEGER PRIMARY KEY,
+input_phrase TEXT,
+phrase TEXT,
+user_freq INTEGER,
+timestamp REAL);
+'''
+
+def _vocab_id(parameter: str) -> str:
+    '''Returns an SQL expression for the vocab id of a text
+
+    :param parameter: The name of the SQL parameter holding the text
+    '''
+    return f'(SELECT id FROM user_db.vocab WHERE text = :{parameter})'
+
+def _ngram_upsert_sql(on_conflict: str) -> str:
+    '''Returns a statement inserting an n-gram into user_db.ngrams
+
+    The statement has the parameters :input_phrase, :phrase,
+    :p_phrase, :pp_phrase, :user_freq and :timestamp. The texts
+    of :phrase, :p_phrase and :pp_phrase must already be in
+    user_db.vocab, see _intern_vocab().
+
+    :param on_conflict: What to do if the n-gram is already in the
+                        table, for example “DO NOTHING”
+    '''
+    return f'''
+    INSERT INTO user_db.ngrams
+    (input_phrase, phrase_id, p_phrase_id, pp_phrase_id, user_freq, timestamp)
+    VALUES (:input_phrase, {_vocab_id('phrase')}, {_vocab_id('p_phrase')},
+            {_vocab_id('pp_phrase')}, :user_freq, :timestamp)
+    ON CONFLICT (input_phrase, phrase_id, p_phrase_id, pp_phrase_id)
+    {on_conflict}
+    '''
+
+def _intern_vocab(
+        database: sqlite3.Connection,
+        sqlargs: Iterable[Dict[str, Any]]) -> None:
+    '''Add the texts of n-grams to user_db.vocab if not there yet
+
+    :param database: The database connection to use
+    :param sqlargs: Parameters of statements from _ngram_upsert_sql()
+    '''
+    texts = set()
+    for args in sqlargs:
+        texts.update((args['phrase'], args['p_phrase'], args['pp_phrase']))
+    database.executemany(
+        'INSERT OR IGNORE INTO user_db.vocab (text) VALUES (?);',
+        [(text,) for text in texts])
+
+# Frequency increments learned from user input are kept in memory and
+# written to the user database later in a single transaction. But not
+# more than MAX_PENDING_PHRASES increments and not longer than
+# MAX_PENDING_SECONDS to limit what is lost when crashing:
+MAX_PENDING_PHRASES = 100
+MAX_PENDING_SECONDS = 60.0
+
+# Maximum number of database results of select_words(),
+# select_words_empty_input() and select_shortcuts() cached. The same
+# input is looked up again and again, for example when using
+# backspace and retyping or when changing the case mode.
+SELECT_CACHE_SIZE = 2000
+
+# Maximum number of rows kept in the user database by cleanup_database():
+CLEANUP_MAX_ROWS = 50000
+
+# cleanup_database() rebuilds the database with VACUUM only if more
+# than this fraction of the pages of the database file is unused:
+VACUUM_FREELIST_RATIO = 0.25
+
+# Maximum number of distinct n-grams counted in memory while reading
+# training data before they are written to the database:
+TRAINING_CHUNK_NGRAMS = 100_000
+
+# Maximum number of bytes of the user database which are read using
+# memory-mapped I/O instead of read() system calls, 0 disables it.
+# Can be changed with the environment variable below or with
+# TabSqliteDb.set_mmap_size():
+MMAP_SIZE = 256 * 1024 * 1024
+MMAP_SIZE_ENVIRONMENT_VARIABLE = 'IBUS_TYPING_BOOSTER_MMAP_SIZE'
+
+# If this environment variable is set, the latencies of the database
+# operations are recorded and written to the file it names (a name
+# without a directory is looked up in ~/.local/share/ibus-typing-booster/),
+# see TabSqliteDb.set_query_stats_file() and “tabstatistics.py -q”:
+QUERY_STATS_ENVIRONMENT_VARIABLE = 'IBUS_TYPING_BOOSTER_QUERY_STATS'
+
+# Minimum number of seconds between writes of the query statistics file:
+QUERY_STATS_SAVE_SECONDS = 300.0
+
+# Number of buckets of the latency histograms of the query statistics.
+# Bucket i counts the latencies from 2**(i-1) to 2**i microseconds,
+# the last bucket everything above:
+QUERY_STATS_BUCKETS = 28
+
+def tokenize_file(
+        filename: str,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> Iterator[str]:
+    '''Generator for the tokens of a text file
+
+    The file is read line by line, so arbitrarily large files can be
+    tokenized without reading them into memory.
+
+    :param filename: The path of a UTF-8 encoded text file,
+                     gzip compressed if the name ends with “.gz”
+    :param progress_callback: Called after each line with the number
+                              of bytes of the file read so far and the
+                              size of the file in bytes (for compressed
+                              files these are compressed bytes)
+    :return: The tokens in NORMALIZATION_FORM_INTERNAL
+    '''
+    total_bytes = os.path.getsize(filename)
+    with open(filename, mode='rb') as raw_file:
+        binary_file: Any = raw_file
+        if filename.endswith('.gz'):
+            binary_file = gzip.GzipFile(fileobj=raw_file, mode='rb')
+        with io.TextIOWrapper(binary_file, encoding='UTF-8') as text_file:
+            for line in text_file:
+                yield from itb_util_core.tokenize(unicodedata.normalize(
+                    itb_util_core.NORMALIZATION_FORM_INTERNAL, line))
+                if progress_callback is not None:
+                    progress_callback(raw_file.tell(), total_bytes)
+
+# Pending frequency increments and their timestamps, keyed by
+# (input_phrase, phrase, p_phrase, pp_phrase):
+_PendingPhrases = Dict[Tuple[str, str, str, str], Tuple[int, float]]
+
+# The rows (input_phrase, phrase, p_phrase, pp_phrase, user_freq) of the
+# database read by the reader thread, the batches of pending
+# increments which were not committed yet when the rows were read and
+# the sequence number of the last batch submitted to the writer then:
+_NgramModelSnapshot = Tuple[
+    List[Tuple[str, str, str, str, int]], List[_PendingPhrases], int]
+
+# Approximate size in bytes of the chunks into which training data
+# files are split to count their n-grams in parallel:
+TRAINING_CHUNK_BYTES = 4 * 1024 * 1024
+
+# (n-gram counts, first two tokens, last two tokens) of a chunk of
+# training data, see _count_training_ngrams():
+_TrainingChunkResult = Tuple[
+    Dict[Tuple[str, str, str, str], int], List[str], List[str]]
+
+def _training_filenames(paths: Iterable[str]) -> List[str]:
+    '''Returns the files to read training data from
+
+    :param paths: Files or directories, directories are searched
+                  recursively and hidden files are skipped.
+    :return: The files, the files found in a directory are sorted
+    '''
+    filenames: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, files in os.walk(path):
+                dirnames[:] = sorted(
+                    name for name in dirnames if not name.startswith('.'))
+                filenames += [os.path.join(dirpath, name)
+                              for name in sorted(files)
+                              if not name.startswith('.')]
+        elif os.path.isfile(path):
+            filenames.append(path)
+        elif os.path.isfile(path + '.gz'):
+            filenames.append(path + '.gz')
+        else:
+            LOGGER.warning('Training data file %s not found', path)
+    return filenames
+
+def _training_file_signature(filename: str) -> Tuple[int, float]:
+    '''Returns (size, mtime) of a training data file
+
+    Used to detect whether a file has changed since training data
+    was read from it.
+    '''
+    stat_result = os.stat(filename)
+    return (stat_result.st_size, stat_result.st_mtime)
+
+def _training_file_chunks(
+        filename: str, chunk_bytes: int) -> List[Tuple[str, int, Optional[int]]]:
+    '''Split a training data file into line aligned chunks
+
+    :param filename: The path of the file
+    :param chunk_bytes: The approximate size of a chunk in bytes
+    :return: A list of (filename, start, end) byte offsets, end is
+             None for the last chunk. A gzip compressed file is
+             a single chunk.
+    '''
+    if filename.endswith('.gz'):
+        return [(filename, 0, None)]
+    chunk_bytes = max(1, chunk_bytes)
+    size = os.path.getsize(filename)
+    starts = [0]
+    with open(filename, mode='rb') as binary_file:
+        while starts[-1] + chunk_bytes < size:
+            binary_file.seek(starts[-1] + chunk_bytes)
+            binary_file.readline()
+            if binary_file.tell() >= size:
+                break
+            starts.append(binary_file.tell())
+    ends: List[Optional[int]] = list(starts[1:])
+    ends.append(None)
+    return [(filename, start, end) for start, end in zip(starts, ends)]
+
+def _count_training_ngrams(
+        filename: str, start: int, end: Optional[int]) -> _TrainingChunkResult:
+    '''Count the n-grams in a chunk of a training data file
+
+    This is a module level function to make it usable in a
+    concurrent.futures.ProcessPoolExecutor.
+
+    :param filename: The path of the file
+    :param start: Byte offset of the start of the chunk, must be the
+                  start of a line
+    :param end: Byte offset of the end of the chunk, must be the start
+                of a line, None means the end of the file
+    :return: A tuple (counts, head, tail). counts are the counts of
+             the n-grams of all tokens except the first two, because
+             their context is in the previous chunk. head are the
+             first two tokens (or less if the chunk has less tokens)
+             and tail the last two tokens.
+    '''
+    counts: Dict[Tuple[str, str, str, str], int] = {}
+    head: List[str] = []
+    p_token = ''
+    pp_token = ''
+    with open(filename, mode='rb') as raw_file:
+        binary_file: Any = raw_file
+        if filename.endswith('.gz'):
+            binary_file = gzip.GzipFile(fileobj=raw_file, mode='rb')
+        else:
+            binary_file.seek(start)
+        while end is None or binary_file.tell() < end:
+            line = binary_file.readline()
+            if not line:
+                break
+            for token in itb_util_core.tokenize(unicodedata.normalize(
+                    itb_util_core.NORMALIZATION_FORM_INTERNAL,
+                    line.decode('UTF-8'))):
+                if len(head) < 2:
+                    head.append(token)
+                else:
+                    key = (itb_util_core.remove_accents(token.lower()),
+                           token,
+                           itb_util_core.remove_accents(p_token.lower()),
+                           itb_util_core.remove_accents(pp_token.lower()))
+                    counts[key] = counts.get(key, 0) + 1
+                pp_token = p_token
+                p_token = token
+    tail = [token for token in (pp_token, p_token) if token]
+    return (counts, head, tail)
+
+def _count_training_chunks(
+        chunks: List[Tuple[str, int, Optional[int]]],
+        process_pool: Optional[concurrent.futures.ProcessPoolExecutor],
+) -> Iterator[_TrainingChunkResult]:
+    '''Count the n-grams in chunks of training data files
+
+    :param chunks: (filename, start, end) tuples, see
+                   _training_file_chunks()
+    :param process_pool: The pool of processes to count in or None
+                         to count in this process. If the pool breaks,
+                         for example because a process cannot import
+                         this module, the remaining chunks are counted
+                         in this process.
+    :return: The results of _count_training_ngrams() for the chunks,
+             in the order of the chunks
+    '''
+    chunks_done = 0
+    if process_pool is not None:
+        try:
+            for result in process_pool.map(
+                    _count_training_ngrams, *zip(*chunks)):
+                yield result
+                chunks_done += 1
+            return
+        except concurrent.futures.BrokenExecutor as error:
+            LOGGER.warning(
+                'Process pool broken, counting training data '
+                'in this process: %s: %s',
+                error.__class__.__name__, error)
+    if chunks_done < len(chunks):
+        yield from map(_count_training_ngrams, *zip(*chunks[chunks_done:]))
+
+def _future_completed(future: 'concurrent.futures.Future[Any]') -> bool:
+    '''Check whether a future has finished without being cancelled
+    and without raising an exception'''
+    return (future.done()
+            and not future.cancelled()
+            and future.exception() is None)
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    '''Returns the smallest string greater than all strings starting
+    with prefix
+
+    All strings starting with prefix are then found with the range
+    “string >= prefix AND string < upper bound”, a database query
+    of this form can use an index. SQLite compares strings with the
+    default BINARY collation by their UTF-8 bytes, which is the same
+    order as the order of the code points.
+
+    :param prefix: The prefix
+    :return: The upper bound or None if all strings greater than or
+             equal to prefix start with prefix (i.e. if the prefix
+             is empty or consists only of sys.maxunicode characters)
+
+    Examples:
+
+    >>> prefix_upper_bound('co')
+    'cp'
+    >>> prefix_upper_bound('a' + chr(sys.maxunicode))
+    'b'
+    >>> prefix_upper_bound('\uD7FF') == '\uE000'
+    True
+    >>> prefix_upper_bound(chr(sys.maxunicode)) is None
+    True
+    '''
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    next_code_point = ord(prefix[-1]) + 1
+    if 0xD800 <= next_code_point <= 0xDFFF:
+        # Surrogates cannot be encoded in UTF-8:
+        next_code_point = 0xE000
+    return prefix[:-1] + chr(next_code_point)
+
+class QueryStats:
+    '''Latency statistics of database operations
+
+    For each operation the number of calls, the number of rows
+    returned or written, the total and the maximum latency and a
+    histogram of the latencies with QUERY_STATS_BUCKETS logarithmic
+    buckets are kept. This is small enough to be written to a file
+    often and the percentiles are still accurate within a factor
+    of two.
+
+    The statistics are kept separately for each label, usually the
+    version of ibus-typing-booster, to be able to compare releases.
+
+    Examples:
+
+    >>> stats = QueryStats(label='1.0')
+    >>> for milliseconds in (1, 1, 1, 1, 1, 1, 1, 1, 1, 100):
+    ...     stats.record('select_words', milliseconds / 1000, rows=2)
+    >>> operation = stats.get()['1.0']['select_words']
+    >>> operation['count'], operation['rows']
+    (10, 20)
+    >>> QueryStats.percentile(operation, 50)
+    0.001024
+    >>> QueryStats.percentile(operation, 99)
+    0.1
+    '''
+    def __init__(self, label: str = '') -> None:
+        self.label = label
+        # Operations are recorded in several threads:
+        self._lock = threading.Lock()
+        # {label: {operation: {'count': …, 'rows': …, 'seconds': …,
+        #                      'max_seconds': …, 'histogram': […]}}}
+        self._stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def _operation(self, label: str, operation: str) -> Dict[str, Any]:
+        '''Returns the statistics of an operation, new ones if necessary'''
+        return self._stats.setdefault(label, {}).setdefault(
+            operation, {'count': 0,
+                        'rows': 0,
+                        'seconds': 0.0,
+                        'max_seconds': 0.0,
+                        'histogram': [0] * QUERY_STATS_BUCKETS})
+
+    def record(self, operation: str, seconds: float, rows: int = 0) -> None:
+        '''Record one call of an operation
+
+        :param operation: The name of the operation
+        :param seconds: The latency of the call
+        :param rows: The number of rows returned or written
+        '''
+        bucket = min(int(seconds * 1_000_000).bit_length(),
+                     QUERY_STATS_BUCKETS - 1)
+        with self._lock:
+            stats = self._operation(self.label, operation)
+            stats['count'] += 1
+            stats['rows'] += rows
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['histogram'][bucket] += 1
+
+    def get(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        '''Returns a copy of the statistics by label and operation'''
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def load(self, filename: str) -> bool:
+        '''Add the statistics saved in a file
+
+        :param filename: The file written by save()
+        :return: True if successful, False on failure
+        '''
+        try:
+            with open(filename, encoding='UTF-8') as stats_file:
+                saved_stats = json.load(stats_file)['stats']
+            with self._lock:
+                for label, operations in saved_stats.items():
+                    for operation, saved in operations.items():
+                        stats = self._operation(label, operation)
+                        for key in ('count', 'rows', 'seconds'):
+                            stats[key] += saved[key]
+                        stats['max_seconds'] = max(
+                            stats['max_seconds'], saved['max_seconds'])
+                        for bucket, count in enumerate(saved['histogram']):
+                            stats['histogram'][
+                                min(bucket, QUERY_STATS_BUCKETS - 1)] += count
+            return True
+        except (OSError, ValueError, KeyError, TypeError,
+                AttributeError) as error:
+            LOGGER.exception(
+                'Error loading query statistics from %s: %s: %s',
+                filename, error.__class__.__name__, error)
+        return False
+
+    def save(self, filename: str) -> bool:
+        '''Write the statistics to a file
+
+        The file is replaced atomically, so it is always complete when
+        it is read.
+
+        :param filename: The file to write
+        :return: True if successful, False on failure
+        '''
+        with self._lock:
+            try:
+                with open(filename + '.tmp', mode='w',
+                          encoding='UTF-8') as stats_file:
+                    json.dump({'stats': self._stats}, stats_file, indent=1)
+                os.replace(filename + '.tmp', filename)
+                return True
+            except OSError as error:
+                LOGGER.exception(
+                    'Error saving query statistics to %s: %s: %s',
+                    filename, error.__class__.__name__, error)
+        return False
+
+    @staticmethod
+    def percentile(stats: Dict[str, Any], percent: float) -> float:
+        '''Returns a percentile of the latencies of an operation
+
+        :param stats: The statistics of the operation
+        :param percent: The percentile to compute, from 0 to 100
+        :return: The upper bound in seconds of the histogram bucket
+                 containing the percentile, but not more than the
+                 maximum latency
+        '''
+        rank = percent / 100 * stats['count']
+        count = 0
+        for bucket, bucket_count in enumerate(stats['histogram']):
+            count += bucket_count
+            if bucket_count and count >= rank:
+                return min(2**bucket / 1_000_000, stats['max_seconds'])
+        return stats['max_seconds']
+
+_Function = TypeVar('_Function', bound=Callable[..., Any])
+
+def _timed(operation: str) -> Callable[[_Function], _Function]:
+    '''Decorator recording the latency of a method of TabSqliteDb
+
+    Only if the query statistics are enabled, see
+    TabSqliteDb.set_query_stats_file(). If the method returns a list,
+    its length is recorded as the number of rows.
+
+    :param operation: The name to record the latency under
+    '''
+    def decorator(method: _Function) -> _Function:
+        @functools.wraps(method)
+        def wrapper(self: 'TabSqliteDb', *args: Any, **kwargs: Any) -> Any:
+            if self._query_stats is None: # pylint: disable=protected-access
+                return method(self, *args, **kwargs)
+            start_time = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            self._record_query( # pylint: disable=protected-access
+                operation, time.perf_counter() - start_time,
+                len(result) if isinstance(result, list) else 0)
+            return result
+        return cast(_Function, wrapper)
+    return decorator
 
 class DatabaseConnectionError(Exception):
     '''Custom exception for database connection failures'''
 
+class NgramModel:
+    '''In-memory copy of the phrases table of the user database
+
+    Used to answer the queries of TabSqliteDb.select_words(),
+    TabSqliteDb.select_words_empty_input() and
+    TabSqliteDb.phrase_exists() without going to SQLite.
+
+    The rows are keyed by (input_phrase, phrase, p_phrase, pp_phrase)
+    like the unique index of the phrases table. The distinct
+    input phrases are kept sorted to find all rows where the input
+    phrase starts with a prefix by bisection. The sums of user_freq
+    by input phrase and phrase, by context and by phrase are kept up
+    to date in hash maps, so a prefix lookup only adds up one sum per
+    input phrase and phrase instead of all the rows.
+
+    Examples:
+
+    >>> model = NgramModel()
+    >>> model.load([('co', 'colour', 'green', 'nice', 1),
+    ...             ('col', 'colour', 'yellow', 'ugly', 2),
+    ...             ('co', 'cold', '', '', 1)])
+    >>> model.ngram_sums('co', 'green', 'nice')
+    [('cold', 1, None, None), ('colour', 3, 1, 1)]
+    >>> model.add(('co', 'cold', 'green', 'nice'), 2)
+    >>> model.context_sums('green', 'nice')
+    {'colour': 1, 'cold': 2}
+    >>> model.phrase_sum('cold')
+    3
+    >>> model.remove('cold')
+    >>> model.phrase_sum('cold')
+    0
+    >>> model.ngram_sums('c', '', '')
+    [('colour', 3, None, None)]
+    '''
+    def __init__(self) -> None:
+        # Sorted list of the distinct input phrases:
+        self._input_phrases: List[str] = []
+        # input_phrase -> {(phrase, p_phrase, pp_phrase): user_freq}
+        self._rows: Dict[str, Dict[Tuple[str, str, str], int]] = {}
+        # input_phrase -> {phrase: sum(user_freq)}
+        self._unigram_sums: Dict[str, Dict[str, int]] = {}
+        # input_phrase -> {(phrase, p_phrase): sum(user_freq)}
+        self._bigram_sums: Dict[str, Dict[Tuple[str, str], int]] = {}
+        # (p_phrase, pp_phrase) -> {phrase: sum(user_freq)}
+        self._context_sums: Dict[Tuple[str, str], Dict[str, int]] = {}
+        # phrase -> sum(user_freq)
+        self._phrase_sums: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._rows.values())
+
+    def clear(self) -> None:
+        '''Remove all rows'''
+        self._input_phrases = []
+        self._rows = {}
+        self._unigram_sums = {}
+        self._bigram_sums = {}
+        self._context_sums = {}
+        self._phrase_sums = {}
+
+    def load(self, rows: Iterable[Tuple[str, str, str, str, int]]) -> None:
+        '''Replace the contents with rows
+
+        :param rows: (input_phrase, phrase, p_phrase, pp_phrase, user_freq)
+                     tuples
+        '''
+        self.clear()
+        for (input_phrase, phrase, p_phrase, pp_phrase, user_freq) in rows:
+            self._rows.setdefault(input_phrase, {})
+            key = (phrase, p_phrase, pp_phrase)
+            self._rows[input_phrase][key] = (
+                self._rows[input_phrase].get(key, 0) + user_freq)
+            self._update_sums(
+                input_phrase, phrase, p_phrase, pp_phrase, user_freq)
+        self._input_phrases = sorted(self._rows)
+
+    def _update_sums(
+            self,
+            input_phrase: str,
+            phrase: str,
+            p_phrase: str,
+            pp_phrase: str,
+            user_freq_difference: int) -> None:
+        '''Add user_freq_difference to the sums of phrase'''
+        # The sums by input phrase are removed only together with
+        # the rows, see remove(), like the rows they may be 0:
+        unigram_sums = self._unigram_sums.setdefault(input_phrase, {})
+        unigram_sums[phrase] = (
+            unigram_sums.get(phrase, 0) + user_freq_difference)
+        bigram_sums = self._bigram_sums.setdefault(input_phrase, {})
+        bigram_sums[(phrase, p_phrase)] = (
+            bigram_sums.get((phrase, p_phrase), 0) + user_freq_difference)
+        context_sums = self._context_sums.setdefault((p_phrase, pp_phrase), {})
+        context_sums[phrase] = (
+            context_sums.get(phrase, 0) + user_freq_difference)
+        if not context_sums[phrase]:
+            del context_sums[phrase]
+            if not context_sums:
+                del self._context_sums[(p_phrase, pp_phrase)]
+        self._phrase_sums[phrase] = (
+            self._phrase_sums.get(phrase, 0) + user_freq_difference)
+        if not self._phrase_sums[phrase]:
+            del self._phrase_sums[phrase]
+
+    def get(self, key: Tuple[str, str, str, str]) -> int:
+        '''Returns the user_freq of a row or 0 if there is no such row
+
+        :param key: (input_phrase, phrase, p_phrase, pp_phrase)
+        '''
+        (input_phrase, phrase, p_phrase, pp_phrase) = key
+        return self._rows.get(input_phrase, {}).get(
+            (phrase, p_phrase, pp_phrase), 0)
+
+    def set(self, key: Tuple[str, str, str, str], user_freq: int) -> None:
+        '''Set the user_freq of a row, adding the row if necessary
+
+        :param key: (input_phrase, phrase, p_phrase, pp_phrase)
+        :param user_freq: The new user_freq
+        '''
+        (input_phrase, phrase, p_phrase, pp_phrase) = key
+        if input_phrase not in self._rows:
+            bisect.insort(self._input_phrases, input_phrase)
+            self._rows[input_phrase] = {}
+        rows = self._rows[input_phrase]
+        old_user_freq = rows.get((phrase, p_phrase, pp_phrase), 0)
+        rows[(phrase, p_phrase, pp_phrase)] = user_freq
+        self._update_sums(
+            input_phrase, phrase, p_phrase, pp_phrase,
+            user_freq - old_user_freq)
+
+    def add(
+            self,
+            key: Tuple[str, str, str, str],
+            user_freq_increment: int) -> None:
+        '''Increase the user_freq of a row, adding the row if necessary
+
+        :param key: (input_phrase, phrase, p_phrase, pp_phrase)
+        :param user_freq_increment: The increment of user_freq
+        '''
+        self.set(key, self.get(key) + user_freq_increment)
+
+    def remove(self, phrase: str, input_phrase: str = '') -> None:
+        '''Remove all rows with phrase
+
+        :param phrase: The phrase of the rows to remove
+        :param input_phrase: If not empty, remove only the rows which
+                             have this input phrase
+        '''
+        if phrase not in self._phrase_sums:
+            return
+        input_phrases = (
+            [input_phrase] if input_phrase else list(self._input_phrases))
+        for row_input_phrase in input_phrases:
+            rows = self._rows.get(row_input_phrase)
+            if not rows:
+                continue
+            if phrase not in self._unigram_sums[row_input_phrase]:
+                continue
+            bigram_sums = self._bigram_sums[row_input_phrase]
+            for key in [key for key in rows if key[0] == phrase]:
+                (row_phrase, p_phrase, pp_phrase) = key
+                self._update_sums(
+                    row_input_phrase, row_phrase, p_phrase, pp_phrase,
+                    -rows[key])
+                del rows[key]
+                bigram_sums.pop((row_phrase, p_phrase), None)
+            del self._unigram_sums[row_input_phrase][phrase]
+            if not rows:
+                del self._rows[row_input_phrase]
+                del self._unigram_sums[row_input_phrase]
+                del self._bigram_sums[row_input_phrase]
+                index = bisect.bisect_left(
+                    self._input_phrases, row_input_phrase)
+                del self._input_phrases[index]
+
+    def ngram_sums(
+            self,
+            input_phrase: str,
+            p_phrase: str,
+            pp_phrase: str,
+    ) -> List[Tuple[str, int, Optional[int], Optional[int]]]:
+        '''Returns the unigram, bigram and trigram sums of user_freq of
+        all phrases where the input phrase starts with input_phrase
+
+        The same as the query in TabSqliteDb.select_words().
+
+        :return: (phrase, unigram sum, bigram sum, trigram sum) tuples.
+                 The bigram and trigram sums are None if no row
+                 of the phrase matches the context.
+        '''
+        start = bisect.bisect_left(self._input_phrases, input_phrase)
+        input_phrase_upper = prefix_upper_bound(input_phrase)
+        end = (len(self._input_phrases) if input_phrase_upper is None
+               else bisect.bisect_left(
+                       self._input_phrases, input_phrase_upper, start))
+        sums: Dict[str, Tuple[int, Optional[int], Optional[int]]] = {}
+        for row_input_phrase in self._input_phrases[start:end]:
+            rows = self._rows[row_input_phrase]
+            bigram_sums = self._bigram_sums[row_input_phrase]
+            for phrase, user_freq in self._unigram_sums[
+                    row_input_phrase].items():
+                (uni, bi, tri) = sums.get(phrase, (0, None, None))
+                uni += user_freq
+                bigram_sum = bigram_sums.get((phrase, p_phrase))
+                if bigram_sum is not None:
+                    bi = (bi or 0) + bigram_sum
+                    # There is at most one row with the same input
+                    # phrase, phrase and context:
+                    trigram_sum = rows.get((phrase, p_phrase, pp_phrase))
+                    if trigram_sum is not None:
+                        tri = (tri or 0) + trigram_sum
+                sums[phrase] = (uni, bi, tri)
+        return [(phrase, uni, bi, tri)
+                for phrase, (uni, bi, tri) in sorted(sums.items())]
+
+    def context_sums(self, p_phrase: str, pp_phrase: str) -> Dict[str, int]:
+        '''Returns the sums of user_freq of the phrases which occured
+        with the context (p_phrase, pp_phrase)'''
+        return dict(self._context_sums.get((p_phrase, pp_phrase), {}))
+
+    def phrase_sum(self, phrase: str) -> int:
+        '''Returns the sum of user_freq of all rows with phrase'''
+        return self._phrase_sums.get(phrase, 0)
+
 class TabSqliteDb:
     # pylint: disable=line-too-long
     '''Phrase databases for ibus-typing-booster
@@ -56,9 +857,16 @@ class TabSqliteDb:
 
     It is a database where the phrases learned from the user are stored.
     user_freq >= 1: The number of times the user has used this phrase
+
+    If ngram_model is True, a copy of the phrases table is kept in
+    memory in an NgramModel and the candidates are looked up there,
+    the database is then only used to store the phrases.
     '''
     # pylint: enable=line-too-long
-    def __init__(self, user_db_file: str = 'user.db') -> None:
+    def __init__(
+            self,
+            user_db_file: str = 'user.db',
+            ngram_model: bool = False) -> None:
         global DEBUG_LEVEL # pylint: disable=global-statement
         try:
             DEBUG_LEVEL = int(str(os.getenv('IBUS_TYPING_BOOSTER_DEBUG_LEVEL')))
@@ -89,17 +897,104 @@ class TabSqliteDb:
 
         self._old_phrases: List[Tuple[str, str, int]] = []
 
+        # Frequency increments not yet written to the user database.
+        # The keys are (input_phrase, phrase, p_phrase, pp_phrase),
+        # the values (user_freq_increment, timestamp):
+        self._pending_phrases: Dict[
+            Tuple[str, str, str, str], Tuple[int, float]] = {}
+        # time.monotonic() when the oldest pending increment was added:
+        self._pending_phrases_since = 0.0
+        self.max_pending_phrases = MAX_PENDING_PHRASES
+        self.max_pending_seconds = MAX_PENDING_SECONDS
+        # LRU cache for the database results of select_words(),
+        # select_words_empty_input() and select_shortcuts(), see
+        # select_cache_info(). The keys are (kind, input_phrase,
+        # p_phrase, pp_phrase) where kind is 'words', 'empty' or
+        # 'shortcuts':
+        self._select_cache: (
+            'collections.OrderedDict[Tuple[str, str, str, str], Any]') = (
+                collections.OrderedDict())
+        self._select_cache_hits = 0
+        self._select_cache_misses = 0
+        # Set when the database has been changed by a different
+        # connection, for example by cleanup_database() in a thread:
+        self._select_cache_stale = False
+        # Threads with their own database connections to keep slow
+        # database operations out of the main loop, see set_use_threads():
+        self._reader: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._writer: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._writer_future: Optional['concurrent.futures.Future[bool]'] = None
+        self._thread_local = threading.local()
+        # Held while the writer thread commits and while the reader
+        # thread starts a read transaction. So the reader knows
+        # exactly which batches of pending increments submitted to
+        # the writer are not committed yet:
+        self._write_lock = threading.Lock()
+        # Batches of pending increments submitted to the writer
+        # thread but not committed yet, by sequence number:
+        self._flushing_phrases: Dict[int, _PendingPhrases] = {}
+        self._flush_sequence = 0
+        # Sequence numbers of the batches the writer thread failed to
+        # write. They stay in self._flushing_phrases until the next
+        # flush puts them back into self._pending_phrases to retry:
+        self._failed_flushes: List[int] = []
+        # Incremented whenever the database is written using the
+        # connection of the main thread. Results of the reader thread
+        # read before that are stale:
+        self._write_generation = 0
+        # Number of commits of the writer thread:
+        self._writer_commits = 0
+        # PRAGMA data_version of the connection of the main thread and
+        # self._writer_commits when it was last checked, to notice
+        # changes by other connections, see _check_data_version():
+        self._data_version = -1
+        self._data_version_writer_commits = 0
+        self._results_ready_callback: Optional[Callable[[], None]] = None
+        # Latency statistics of the database operations, only recorded
+        # if a file to write them to is set, see set_query_stats_file():
+        self._query_stats: Optional[QueryStats] = None
+        self._query_stats_file = ''
+        # time.monotonic() when the statistics were last written:
+        self._query_stats_saved = 0.0
+        self.set_query_stats_file(
+            os.getenv(QUERY_STATS_ENVIRONMENT_VARIABLE, ''))
+        # See set_mmap_size():
+        try:
+            self.mmap_size = max(0, int(str(
+                os.getenv(MMAP_SIZE_ENVIRONMENT_VARIABLE))))
+        except (TypeError, ValueError):
+            self.mmap_size = MMAP_SIZE
+
         self.hunspell_obj = hunspell_suggest.Hunspell(())
 
         self._check_database_compatibility()
         self._check_database_readability()
 
-        self.database = self.sqlite3_connect_database_legacy(self.user_db_file)
+        self.database = self.sqlite3_connect_database_legacy(
+            self.user_db_file, mmap_size=self.mmap_size)
         self.create_tables()
+        # The unique index is needed to restore old phrases:
+        self.create_indexes()
         self._restore_old_phrases()
 
-        self.create_indexes()
         self.generate_userdb_desc()
+        self._data_version = self._read_data_version(self.database)
+
+        self._ngram_model: Optional[NgramModel] = None
+        # Set when the database has been changed by a different
+        # connection, for example by cleanup_database() in a thread:
+        self._ngram_model_stale = False
+        # Reloading the n-gram model in the reader thread, see
+        # _get_ngram_model():
+        self._ngram_model_future: Optional[
+            'concurrent.futures.Future[_NgramModelSnapshot]'] = None
+        self._ngram_model_generation = 0
+        # Batches of pending increments submitted to the writer
+        # thread while reloading, with their sequence numbers:
+        self._ngram_model_flushes: List[Tuple[int, _PendingPhrases]] = []
+        if ngram_model:
+            self._ngram_model = NgramModel()
+            self._load_ngram_model()
 
     @contextmanager
     def transaction(
@@ -113,13 +1008,16 @@ class TabSqliteDb:
                                 but not raised
         :param checkpoint: If True, do a wal_checkpoint
         '''
+        # Write after the writer thread, not in between:
+        self._wait_for_writer()
         try:
             yield  # Execution returns to the with-block
             self.database.commit()
+            self._write_generation += 1
             if checkpoint:
                 # self.database.execute('PRAGMA wal_checkpoint;')
                 # more aggressive with TRUNCATE:
-                self.database.execute('PRAGMA wal_checkpoint(TRUNCATE);')
+                self._wal_checkpoint(self.database, 'TRUNCATE')
         except sqlite3.Error as error:
             LOGGER.exception('Transaction failed, rolling back: %s: %s',
                              error.__class__.__name__, error)
@@ -137,8 +1035,17 @@ class TabSqliteDb:
 
     @classmethod
     def _setup_database_connection(
-            cls, database_connection: sqlite3.Connection, db_file: str) -> None:
-        '''Shared configuration for all connections'''
+            cls,
+            database_connection: sqlite3.Connection,
+            db_file: str,
+            mmap_size: int = MMAP_SIZE) -> None:
+        '''Shared configuration for all connections
+
+        :param database_connection: The connection to configure
+        :param db_file: The database file to attach as “user_db”
+        :param mmap_size: The maximum number of bytes of the database
+                          to access with memory-mapped I/O, 0 disables it
+        '''
         # A database containing the complete German Hunspell
         # dictionary has less then 6000 pages. 20000 pages
         # should be enough to cache the complete database
@@ -155,6 +1062,9 @@ class TabSqliteDb:
         PRAGMA auto_vacuum = FULL;
         PRAGMA busy_timeout = 5000;
         ''')
+        # Without a schema name this applies to the databases attached
+        # later as well:
+        database_connection.execute(f'PRAGMA mmap_size = {int(mmap_size)};')
         # Pragmas autocommit, so a database_connection.commit()
         # here would be harmless but superfluous.
         database_connection.executescript(
@@ -170,13 +1080,15 @@ class TabSqliteDb:
     @contextmanager
     def sqlite3_connect_database(
             cls, db_file: str,
-            suppress_errors: bool = False) -> Iterator[sqlite3.Connection]:
+            suppress_errors: bool = False,
+            mmap_size: int = MMAP_SIZE) -> Iterator[sqlite3.Connection]:
         '''For short-lived connections (automatic close)'''
         database_connection = None
         try:
             # Creates the file db_file if it does not exist:
             database_connection = sqlite3.connect(db_file)
-            cls._setup_database_connection(database_connection, db_file)
+            cls._setup_database_connection(
+                database_connection, db_file, mmap_size=mmap_size)
             yield database_connection
         except sqlite3.Error as error:
             LOGGER.exception("Database connection failed (%s): %s", db_file, error)
@@ -192,12 +1104,14 @@ class TabSqliteDb:
 
     @classmethod
     def sqlite3_connect_database_legacy(
-            cls, db_file: str) -> sqlite3.Connection:
+            cls, db_file: str,
+            mmap_size: int = MMAP_SIZE) -> sqlite3.Connection:
         '''For long-lived connections (manual close)'''
         LOGGER.info('Connect to the database %s.', db_file)
         try:
             database_connection = sqlite3.connect(db_file)
-            cls._setup_database_connection(database_connection, db_file)
+            cls._setup_database_connection(
+                database_connection, db_file, mmap_size=mmap_size)
             return database_connection
         except sqlite3.Error as error:
             LOGGER.exception("Database connection failed (%s): %s", db_file, error)
@@ -220,12 +1134,13 @@ class TabSqliteDb:
                  'pp_phrase': '',
                  'user_freq': ophrase[2],
                  'timestamp': time.time()})
-        sqlstr = '''
-        INSERT INTO user_db.phrases (input_phrase, phrase, p_phrase, pp_phrase, user_freq, timestamp)
-        VALUES (:input_phrase, :phrase, :p_phrase, :pp_phrase, :user_freq, :timestamp)
-        ;'''
+        # Different old phrases may become equal after normalization,
+        # sum up their frequencies:
+        sqlstr = _ngram_upsert_sql(
+            'DO UPDATE SET user_freq = user_freq + excluded.user_freq')
         try:
             with self.transaction():
+                _intern_vocab(self.database, sqlargs)
                 self.database.executemany(sqlstr, sqlargs)
             return True
         except sqlite3.Error as error:
@@ -264,6 +1179,18 @@ class TabSqliteDb:
                 LOGGER.info(
                     'Compatible database %s found.', self.user_db_file)
                 return
+            if (desc
+                and
+                desc['version'] in MIGRATABLE_USER_DATABASE_VERSIONS
+                and
+                self.get_number_of_columns_of_phrase_table(self.user_db_file)
+                == len(self._phrase_table_column_names)
+                and
+                self._migrate_database(desc['version'])):
+                LOGGER.info(
+                    'Database %s migrated from version %s to version %s.',
+                    self.user_db_file, desc['version'], USER_DATABASE_VERSION)
+                return
             LOGGER.info('User database %s seems incompatible.',
                         self.user_db_file)
             # Log reason for incompatibility
@@ -292,6 +1219,77 @@ class TabSqliteDb:
                 'Unexpected error checking database compatibility: %s: %s',
                 error.__class__.__name__, error)
 
+    def _migrate_database(self, version: str) -> bool:
+        '''Migrate a database with a version from
+        MIGRATABLE_USER_DATABASE_VERSIONS to USER_DATABASE_VERSION
+
+        Before version 0.67, the texts of the phrases table are moved
+        into the vocab table and the rows into the ngrams table, then
+        the phrases table is replaced by a view. Rows with the same
+        (input_phrase, phrase, p_phrase, pp_phrase) are merged into
+        one row with the sum of their user_freq and the newest
+        timestamp. Then the shortcuts are moved from the ngrams table
+        into the shortcuts table. The indexes are created later by
+        create_indexes().
+
+        :param version: The version of the database
+        :return: True if the migration succeeded, False on failure
+        '''
+        LOGGER.info('Migrating database %s ...', self.user_db_file)
+        sqlstr = ''
+        if version in ('0.65', '0.66'):
+            sqlstr += f'''
+            {_NGRAM_TABLES_SQL.format(schema='')}
+            INSERT OR IGNORE INTO vocab (text)
+            SELECT phrase FROM phrases WHERE phrase IS NOT NULL
+            UNION SELECT coalesce(p_phrase, '') FROM phrases
+            UNION SELECT coalesce(pp_phrase, '') FROM phrases;
+            INSERT INTO ngrams
+            (id, input_phrase, phrase_id, p_phrase_id, pp_phrase_id,
+             user_freq, timestamp)
+            SELECT min(phrases.id), input_phrase,
+            phrase.id, p_phrase.id, pp_phrase.id,
+            sum(user_freq), max(timestamp)
+            FROM phrases
+            JOIN vocab AS phrase ON phrase.text = phrases.phrase
+            JOIN vocab AS p_phrase
+            ON p_phrase.text = coalesce(phrases.p_phrase, '')
+            JOIN vocab AS pp_phrase
+            ON pp_phrase.text = coalesce(phrases.pp_phrase, '')
+            GROUP BY input_phrase, phrase.id, p_phrase.id, pp_phrase.id;
+            DROP TABLE phrases;
+            {_PHRASES_VIEW_SQL.format(schema='')}
+            '''
+        sqlstr += f'''
+        {_SHORTCUTS_TABLE_SQL.format(schema='')}
+        INSERT INTO shortcuts (input_phrase, phrase, user_freq, timestamp)
+        SELECT input_phrase, phrase, max(user_freq), max(timestamp)
+        FROM phrases
+        WHERE user_freq >= {itb_util_core.SHORTCUT_USER_FREQ}
+        GROUP BY input_phrase, phrase;
+        DELETE FROM ngrams
+        WHERE user_freq >= {itb_util_core.SHORTCUT_USER_FREQ};
+        UPDATE desc SET value = '{USER_DATABASE_VERSION}'
+        WHERE name = 'version';
+        '''
+        database = None
+        try:
+            with self.__class__.sqlite3_connect_database(
+                    self.user_db_file) as database:
+                # executescript() commits a pending transaction first,
+                # start one explicitly to make the migration atomic:
+                database.executescript(f'BEGIN; {sqlstr} COMMIT;')
+            return True
+        except sqlite3.Error as error:
+            LOGGER.exception(
+                'Database error migrating database: %s: %s',
+                error.__class__.__name__, error)
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error migrating database: %s: %s',
+                error.__class__.__name__, error)
+        return False
+
     def _check_database_readability(self) -> bool:
         '''Check whether all rows from the phrases table of the
         database are readable
@@ -343,7 +1341,7 @@ class TabSqliteDb:
         LOGGER.info(
             'Creating a new, empty database "%s".', self.user_db_file)
         self.database = self.__class__.sqlite3_connect_database_legacy(
-            self.user_db_file)
+            self.user_db_file, mmap_size=self.mmap_size)
 
     def update_phrase(
             self,
@@ -363,11 +1361,13 @@ class TabSqliteDb:
             itb_util_core.NORMALIZATION_FORM_INTERNAL, phrase)
         p_phrase = itb_util_core.remove_accents(p_phrase.lower())
         pp_phrase = itb_util_core.remove_accents(pp_phrase.lower())
-        sqlstr = '''
-        UPDATE user_db.phrases
+        sqlstr = f'''
+        UPDATE user_db.ngrams
         SET user_freq = :user_freq, timestamp = :timestamp
         WHERE input_phrase = :input_phrase
-         AND phrase = :phrase AND p_phrase = :p_phrase AND pp_phrase = :pp_phrase
+         AND phrase_id = {_vocab_id('phrase')}
+         AND p_phrase_id = {_vocab_id('p_phrase')}
+         AND pp_phrase_id = {_vocab_id('pp_phrase')}
         '''
         sqlargs = {'user_freq': user_freq,
                    'input_phrase': input_phrase,
@@ -381,6 +1381,13 @@ class TabSqliteDb:
         try:
             with self.transaction():
                 self.database.execute(sqlstr, sqlargs)
+            self._select_cache_invalidate(input_phrase, p_phrase, pp_phrase)
+            if self._ngram_model is not None:
+                key = (input_phrase, phrase, p_phrase, pp_phrase)
+                if self._ngram_model.get(key):
+                    (user_freq_increment, _timestamp) = (
+                        self._pending_phrases.get(key, (0, 0.0)))
+                    self._ngram_model.set(key, user_freq + user_freq_increment)
             return True
         except sqlite3.Error as error:
             LOGGER.exception(
@@ -392,36 +1399,659 @@ class TabSqliteDb:
                 error.__class__.__name__, error)
         return False
 
+    def _load_ngram_model(self) -> None:
+        '''(Re)load the in-memory n-gram model from the database
+
+        The pending increments not yet written to the database are
+        included.
+        '''
+        if self._ngram_model is None:
+            return
+        # A reload in the reader thread is not needed anymore:
+        self._ngram_model_future = None
+        self._ngram_model_flushes = []
+        self._wait_for_writer()
+        self._ngram_model_stale = False
+        rows: List[Tuple[str, str, str, str, int]] = []
+        try:
+            rows = self.database.execute(
+                'SELECT input_phrase, phrase, p_phrase, pp_phrase, user_freq '
+                'FROM user_db.phrases;').fetchall()
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error loading n-gram model: %s: %s',
+                error.__class__.__name__, error)
+        self._set_ngram_model(rows, [self._pending_phrases])
+
+    def _set_ngram_model(
+            self,
+            rows: Iterable[Tuple[str, str, str, str, int]],
+            batches: Iterable[_PendingPhrases]) -> None:
+        '''Fill the in-memory n-gram model
+
+        :param rows: The rows read from the database
+        :param batches: The pending increments not contained in rows
+        '''
+        if self._ngram_model is None:
+            return
+        self._ngram_model.load(rows)
+        for batch in batches:
+            for key, (user_freq_increment, _timestamp) in batch.items():
+                self._ngram_model.add(key, user_freq_increment)
+        LOGGER.info('N-gram model loaded: %s rows', len(self._ngram_model))
+
+    def _get_ngram_model(self) -> Optional[NgramModel]:
+        '''Returns the in-memory n-gram model if it is used
+
+        Reloads it first if the database has been changed by a
+        different connection. If the reader thread is used, the model
+        is reloaded there and None is returned until that is finished,
+        i.e. the database is queried directly in the mean time.
+        '''
+        if self._ngram_model is None:
+            return None
+        self._check_data_version()
+        self.collect_background_results()
+        if self._ngram_model_future is not None:
+            return None
+        if self._ngram_model_stale:
+            if self._reader is None:
+                self._load_ngram_model()
+            else:
+                self._submit_ngram_model_reload()
+                return None
+        return self._ngram_model
+
+    def set_use_threads(self, use_threads: bool) -> None:
+        '''Choose whether slow database operations are done in threads
+
+        If True, a reader thread and a writer thread are started,
+        each with its own database connection. The writer thread
+        writes the pending increments when flush_pending_phrases() is
+        called with background=True. The reader thread reloads the
+        in-memory n-gram model when the database has been changed by
+        a different connection. So neither blocks the main loop.
+
+        Not possible for a memory database, each connection to
+        “:memory:” would get a different database.
+
+        :param use_threads: Whether to use threads. If False, the
+                            threads are stopped after finishing
+                            their work.
+        '''
+        if use_threads == (self._writer is not None):
+            return
+        if not use_threads:
+            self._wait_for_writer()
+            self._ngram_model_future = None
+            self._ngram_model_flushes = []
+            for executor in (self._reader, self._writer):
+                if executor is not None:
+                    executor.submit(self._close_thread_database)
+                    executor.shutdown(wait=True)
+            self._reader = None
+            self._writer = None
+            self._writer_future = None
+            return
+        if self.user_db_file == ':memory:':
+            LOGGER.info('Database threads not possible for memory database.')
+            return
+        self._reader = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='itb-database-reader',
+            initializer=self._connect_thread_database)
+        self._writer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='itb-database-writer',
+            initializer=self._connect_thread_database)
+        # Connect right away to start watching for changes by other
+        # connections, see _check_data_version():
+        self._writer.submit(self._check_data_version_job)
+
+    def set_results_ready_callback(
+            self, callback: Optional[Callable[[], None]]) -> None:
+        '''Set a function to call when the reader thread has finished
+        reading something
+
+        :param callback: The function to call. It is called from the
+                         reader thread, i.e. it should use
+                         GLib.idle_add() to call
+                         collect_background_results() in the main loop.
+        '''
+        self._results_ready_callback = callback
+
+    def collect_background_results(self) -> None:
+        '''Use the results of the reader thread which are ready
+
+        Results are discarded if the database has been changed in
+        the mean time in a way the results do not reflect.
+        '''
+        future = self._ngram_model_future
+        if future is None or not future.done():
+            return
+        self._ngram_model_future = None
+        flushes = self._ngram_model_flushes
+        self._ngram_model_flushes = []
+        if (not _future_completed(future)
+            or self._ngram_model_stale
+            or self._ngram_model_generation != self._write_generation):
+            # Stale, try again:
+            self._ngram_model_stale = True
+            return
+        (rows, unwritten_batches, last_sequence) = future.result()
+        # Batches submitted after the rows were read are not included:
+        unwritten_batches += [batch for sequence, batch in flushes
+                              if sequence > last_sequence]
+        self._set_ngram_model(
+            rows, unwritten_batches + [self._pending_phrases])
+        # Results cached while the model was stale were read from
+        # the database directly, they are the same but do not hurt:
+        self.select_cache_clear()
+
+    def _submit_ngram_model_reload(self) -> None:
+        '''Reload the in-memory n-gram model in the reader thread'''
+        if self._reader is None or self._ngram_model_future is not None:
+            return
+        self._ngram_model_stale = False
+        self._ngram_model_generation = self._write_generation
+        self._ngram_model_flushes = []
+        self._ngram_model_future = self._reader.submit(
+            self._read_ngram_model_job)
+        self._ngram_model_future.add_done_callback(
+            self._on_background_result_ready)
+
+    def _read_ngram_model_job(self) -> _NgramModelSnapshot:
+        '''Read the rows for the n-gram model in the reader thread
+
+        :return: The rows, the batches of pending increments which
+                 were not committed when the rows were read and the
+                 sequence number of the last batch submitted then
+        '''
+        database = self._thread_local.database
+        with self._write_lock:
+            # The first read in a transaction determines which
+            # commits it sees:
+            database.execute('BEGIN;')
+            database.execute('SELECT id FROM user_db.ngrams LIMIT 1;').fetchall()
+            unwritten_batches = list(self._flushing_phrases.values())
+            last_sequence = self._flush_sequence
+        try:
+            rows = database.execute(
+                'SELECT input_phrase, phrase, p_phrase, pp_phrase, user_freq '
+                'FROM user_db.phrases;').fetchall()
+        finally:
+            database.rollback()
+        return (rows, unwritten_batches, last_sequence)
+
+    def _on_background_result_ready(
+            self, _future: 'concurrent.futures.Future[Any]') -> None:
+        '''Called in the reader thread when a job has finished'''
+        if self._results_ready_callback is None:
+            return
+        try:
+            self._results_ready_callback()
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error in results ready callback: %s: %s',
+                error.__class__.__name__, error)
+
+    def _connect_thread_database(self) -> None:
+        '''Open the database connection of a reader or writer thread'''
+        self._thread_local.database = self.sqlite3_connect_database_legacy(
+            self.user_db_file, mmap_size=self.mmap_size)
+        self._thread_local.data_version = self._read_data_version(
+            self._thread_local.database)
+
+    @staticmethod
+    def _read_data_version(database: sqlite3.Connection) -> int:
+        '''Returns PRAGMA data_version of the user database
+
+        It changes whenever a different connection has committed
+        a change of the user database.
+
+        :param database: The database connection to use
+        :return: The data version or -1 on failure
+        '''
+        try:
+            return int(database.execute(
+                'PRAGMA user_db.data_version;').fetchone()[0])
+        except sqlite3.Error as error:
+            LOGGER.exception(
+                'Database error reading the data version: %s: %s',
+                error.__class__.__name__, error)
+        return -1
+
+    def _check_data_version(self) -> None:
+        '''Notice changes of the user database by other connections
+
+        For example when the setup tool deletes the learned data or
+        learn_from_files.py adds n-grams. The in-memory n-gram model
+        is reloaded and the cache of the database results is cleared
+        then.
+
+        The data version of the connection of the main thread changes
+        on commits of the writer thread as well. If the writer thread
+        has committed since the last check, it cannot be told apart
+        here and the writer thread checks the data version of its own
+        connection instead, see _check_data_version_job().
+        '''
+        if self.user_db_file == ':memory:':
+            return # No other connection can change it
+        # Not taking self._write_lock to avoid waiting for commits of
+        # the writer thread. self._writer_commits is incremented only
+        # after a commit, when read before the data version a commit
+        # in between may only cause an unnecessary reload:
+        writer_commits = self._writer_commits
+        data_version = self._read_data_version(self.database)
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        if (writer_commits == self._data_version_writer_commits
+            or self._writer is None):
+            LOGGER.info('User database changed by a different connection.')
+            self._ngram_model_stale = True
+            self._select_cache_stale = True
+            return
+        self._data_version_writer_commits = writer_commits
+        self._writer.submit(self._check_data_version_job)
+
+    def _check_data_version_job(self) -> None:
+        '''Notice changes of the user database by other connections
+        in the writer thread
+
+        The data version of the connection of the writer thread does
+        not change on its own commits, only on those of other
+        connections. That includes the rare commits of the main
+        thread, for example by remove_phrase(), which cause an
+        unnecessary reload then.
+        '''
+        data_version = self._read_data_version(self._thread_local.database)
+        if data_version == self._thread_local.data_version:
+            return
+        self._thread_local.data_version = data_version
+        LOGGER.info('User database changed by a different connection.')
+        self._ngram_model_stale = True
+        self._select_cache_stale = True
+
+    def _close_thread_database(self) -> None:
+        '''Close the database connection of a reader or writer thread'''
+        database = getattr(self._thread_local, 'database', None)
+        if database is not None:
+            database.close()
+            self._thread_local.database = None
+
+    def _execute_thread_database(self, sqlstr: str) -> None:
+        '''Execute a statement with the connection of a reader or
+        writer thread'''
+        self._thread_local.database.execute(sqlstr)
+
+    def set_mmap_size(self, mmap_size: int) -> None:
+        '''Set how much of the user database is accessed with memory-mapped I/O
+
+        With memory-mapped I/O, SQLite reads pages in the page cache
+        of the operating system directly instead of copying them with
+        read() system calls.
+
+        :param mmap_size: The maximum number of bytes of the database
+                          to access with memory-mapped I/O, 0 disables it.
+                          Used for all connections of this database,
+                          including those of the reader and writer
+                          threads.
+        '''
+        self.mmap_size = max(0, int(mmap_size))
+        sqlstr = f'PRAGMA mmap_size = {self.mmap_size};'
+        self.database.execute(sqlstr)
+        for executor in (self._reader, self._writer):
+            if executor is not None:
+                executor.submit(self._execute_thread_database, sqlstr)
+
+    def prewarm_database(self, background: bool = True) -> bool:
+        '''Read the parts of the user database needed for the first lookups
+
+        After a restart, the user database may not be in the page
+        cache of the operating system anymore and the first keystrokes
+        would have to wait for the disk. This reads the index used
+        for the prefix lookups of select_words() and
+        select_shortcuts(), the n-grams and the vocabulary. The
+        operating system then keeps these pages in its page cache.
+
+        :param background: If True and the reader thread is used (see
+                           set_use_threads()), read in the reader
+                           thread and return immediately.
+        :return: True if successful (or submitted successfully to
+                 the reader thread), False on failure
+        '''
+        if self.user_db_file == ':memory:':
+            return True # Nothing to read from disk
+        if background and self._reader is not None:
+            self._reader.submit(self._prewarm_database_job)
+            return True
+        return self._prewarm_database(self.database)
+
+    def _prewarm_database_job(self) -> bool:
+        '''Read the user database into the page cache in the reader thread
+
+        :return: True if successful, False on failure
+        '''
+        return self._prewarm_database(self._thread_local.database)
+
+    def _prewarm_database(self, database: sqlite3.Connection) -> bool:
+        '''Read the user database into the page cache
+
+        :param database: The database connection to use
+        :return: True if successful, False on failure
+        '''
+        LOGGER.info('Prewarming the user database ...')
+        start_time = time.perf_counter()
+        try:
+            for sqlstr in (
+                    'SELECT count(input_phrase) FROM user_db.ngrams '
+                    'INDEXED BY ngrams_index_p;',
+                    'SELECT sum(user_freq) FROM user_db.ngrams NOT INDEXED;',
+                    'SELECT count(text) FROM user_db.vocab NOT INDEXED;',
+                    'SELECT count(input_phrase) FROM user_db.shortcuts '
+                    'INDEXED BY shortcuts_index_p;'):
+                database.execute(sqlstr).fetchall()
+            seconds = time.perf_counter() - start_time
+            self._record_query('prewarm_database', seconds)
+            LOGGER.info('Prewarming the user database done in %s seconds.',
+                        seconds)
+            return True
+        except sqlite3.Error as error:
+            LOGGER.exception(
+                'Database error prewarming the user database: %s: %s',
+                error.__class__.__name__, error)
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error prewarming the user database: %s: %s',
+                error.__class__.__name__, error)
+        return False
+
+    def _wait_for_writer(self) -> None:
+        '''Wait until the writer thread has written everything
+        submitted to it'''
+        if self._writer_future is not None:
+            concurrent.futures.wait([self._writer_future])
+            self._writer_future = None
+
+    def _select_cache_get(self, key: Tuple[str, str, str, str]) -> Any:
+        '''Returns a cached database result or None if not cached'''
+        self._check_data_version()
+        if self._select_cache_stale:
+            self.select_cache_clear()
+        cached = self._select_cache.get(key)
+        if cached is not None:
+            self._select_cache_hits += 1
+            self._select_cache.move_to_end(key)
+            return cached
+        self._select_cache_misses += 1
+        return None
+
+    def _select_cache_put(
+            self, key: Tuple[str, str, str, str], value: Any) -> None:
+        '''Adds a database result to the cache'''
+        self._select_cache[key] = value
+        if len(self._select_cache) > SELECT_CACHE_SIZE:
+            self._select_cache.popitem(last=False)
+
+    def _select_cache_invalidate(
+            self,
+            input_phrase: str,
+            p_phrase: Optional[str] = None,
+            pp_phrase: Optional[str] = None) -> None:
+        '''Removes the cached results which may change when a row
+        with input_phrase and context is written
+
+        :param input_phrase: The input phrase of the row written
+        :param p_phrase: The p_phrase of the row written,
+                         None if rows with any context were written
+        :param pp_phrase: The pp_phrase of the row written,
+                          None if rows with any context were written
+        '''
+        for key in list(self._select_cache):
+            (kind, cached_input_phrase, cached_p_phrase, cached_pp_phrase) = key
+            if kind == 'empty':
+                if (p_phrase is None
+                    or (cached_p_phrase, cached_pp_phrase)
+                    == (p_phrase, pp_phrase)):
+                    del self._select_cache[key]
+            elif input_phrase.startswith(cached_input_phrase):
+                del self._select_cache[key]
+
+    def select_cache_clear(self) -> None:
+        '''Clear the cache of the database results of select_words(),
+        select_words_empty_input() and select_shortcuts()'''
+        self._select_cache_stale = False
+        self._select_cache.clear()
+
+    def select_cache_info(self) -> Dict[str, int]:
+        '''
+        Returns statistics about the cache of the database results of
+        select_words(), select_words_empty_input() and select_shortcuts()
+
+        :return: A dictionary with the number of cache hits and misses,
+                 the current number of entries and the maximum number
+                 of entries.
+        '''
+        return {'hits': self._select_cache_hits,
+                'misses': self._select_cache_misses,
+                'size': len(self._select_cache),
+                'maxsize': SELECT_CACHE_SIZE}
+
+    def has_pending_phrases(self) -> bool:
+        '''Whether there are frequency increments which have not been
+        written to the user database yet'''
+        return bool(self._pending_phrases)
+
+    def flush_pending_phrases(self, background: bool = False) -> bool:
+        '''Write the pending frequency increments to the user database
+
+        All pending increments are written in a single transaction.
+
+        :param background: If True and the writer thread is used (see
+                           set_use_threads()), write in the writer
+                           thread and return immediately. Otherwise
+                           everything pending, including what was
+                           submitted to the writer thread before, is
+                           written when this returns.
+        :return: True if successful (or submitted successfully to
+                 the writer thread), False on failure
+        '''
+        if not background:
+            self._wait_for_writer()
+        self._retry_failed_flushes()
+        if not self._pending_phrases:
+            return True # “Nothing” successfully written
+        pending_phrases = self._pending_phrases
+        self._pending_phrases = {}
+        self._pending_phrases_since = 0.0
+        if DEBUG_LEVEL > 1:
+            LOGGER.debug('Writing %s pending phrases', len(pending_phrases))
+        if background and self._writer is not None:
+            # Changes by other connections cannot be told apart from
+            # the commits of the writer thread after submitting:
+            self._check_data_version()
+            with self._write_lock:
+                self._flush_sequence += 1
+                sequence = self._flush_sequence
+                self._flushing_phrases[sequence] = pending_phrases
+            if self._ngram_model_future is not None:
+                self._ngram_model_flushes.append((sequence, pending_phrases))
+            self._writer_future = self._writer.submit(
+                self._write_pending_phrases_job, sequence, pending_phrases)
+            return True
+        try:
+            start_time = time.perf_counter()
+            with self.transaction(checkpoint=False):
+                self._write_pending_phrases(self.database, pending_phrases)
+            self._record_query('flush_pending_phrases',
+                               time.perf_counter() - start_time,
+                               len(pending_phrases))
+            self._wal_checkpoint(self.database, 'TRUNCATE')
+            return True
+        except sqlite3.Error as error:
+            LOGGER.exception(
+                'Database error writing pending phrases: %s: %s',
+                error.__class__.__name__, error)
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error writing pending phrases: %s: %s',
+                error.__class__.__name__, error)
+            try:
+                self.database.rollback()
+            except sqlite3.Error:
+                pass
+        # Keep the increments to retry with the next flush, the
+        # n-gram model and the cache already contain them:
+        self._merge_pending_phrases(pending_phrases)
+        return False
+
+    def _merge_pending_phrases(self, pending_phrases: _PendingPhrases) -> None:
+        '''Put increments which could not be written back into the
+        pending increments
+
+        :param pending_phrases: The increments which could not be written
+        '''
+        if not self._pending_phrases:
+            self._pending_phrases_since = time.monotonic()
+        for key, (user_freq_increment, timestamp) in pending_phrases.items():
+            (pending_increment, pending_timestamp) = self._pending_phrases.get(
+                key, (0, 0.0))
+            self._pending_phrases[key] = (
+                pending_increment + user_freq_increment,
+                max(timestamp, pending_timestamp))
+
+    def _retry_failed_flushes(self) -> None:
+        '''Put the batches the writer thread failed to write back
+        into the pending increments to write them with the next flush'''
+        if not self._failed_flushes:
+            return
+        with self._write_lock:
+            failed_batches = [self._flushing_phrases.pop(sequence)
+                              for sequence in self._failed_flushes]
+            self._failed_flushes = []
+        if self._ngram_model_future is not None:
+            # The n-gram model being reloaded may already count the
+            # failed batches as unwritten, do not count them twice:
+            self._ngram_model_stale = True
+        for pending_phrases in failed_batches:
+            self._merge_pending_phrases(pending_phrases)
+
+    def _write_pending_phrases_job(
+            self, sequence: int, pending_phrases: _PendingPhrases) -> bool:
+        '''Write a batch of pending increments in the writer thread
+
+        :param sequence: The sequence number of the batch
+        :param pending_phrases: The pending increments
+        :return: True if successful, False on failure
+        '''
+        database = self._thread_local.database
+        try:
+            start_time = time.perf_counter()
+            try:
+                # Other connections do not see the upserts before the
+                # commit, only the commit needs the lock:
+                self._write_pending_phrases(database, pending_phrases)
+                with self._write_lock:
+                    database.commit()
+                    self._writer_commits += 1
+                    del self._flushing_phrases[sequence]
+            except Exception:
+                # Keep the batch to retry with the next flush, the
+                # n-gram model and the cache already contain it:
+                with self._write_lock:
+                    self._failed_flushes.append(sequence)
+                database.rollback()
+                raise
+            self._record_query('flush_pending_phrases',
+                               time.perf_counter() - start_time,
+                               len(pending_phrases))
+            self._wal_checkpoint(database, 'TRUNCATE')
+            return True
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error writing pending phrases in thread: %s: %s',
+                error.__class__.__name__, error)
+        return False
+
+    @staticmethod
+    def _write_pending_phrases(
+            database: sqlite3.Connection,
+            pending_phrases: _PendingPhrases) -> None:
+        '''Write pending increments without committing
+
+        :param database: The database connection to use
+        :param pending_phrases: The pending increments
+        '''
+        sqlstr = _ngram_upsert_sql(
+            'DO UPDATE SET user_freq = user_freq + excluded.user_freq, '
+            'timestamp = excluded.timestamp')
+        sqlargs = [{'input_phrase': input_phrase,
+                    'phrase': phrase,
+                    'p_phrase': p_phrase,
+                    'pp_phrase': pp_phrase,
+                    'user_freq': user_freq_increment,
+                    'timestamp': timestamp}
+                   for ((input_phrase, phrase, p_phrase, pp_phrase),
+                        (user_freq_increment, timestamp))
+                   in pending_phrases.items()]
+        _intern_vocab(database, sqlargs)
+        database.executemany(sqlstr, sqlargs)
+
+    def _execute_with_unwritten_phrases(
+            self,
+            sqlstr: str,
+            sqlargs: Dict[str, Any],
+    ) -> Tuple[List[Any], List[_PendingPhrases]]:
+        '''Execute a query and get the increments not in its result
+
+        :param sqlstr: The query
+        :param sqlargs: The parameters of the query
+        :return: The rows found and the batches of increments which
+                 were not written to the database when the query was
+                 executed
+        '''
+        with self._write_lock:
+            rows = self.database.execute(sqlstr, sqlargs).fetchall()
+            batches = list(self._flushing_phrases.values())
+        batches.append(self._pending_phrases)
+        return (rows, batches)
+
     def sync_usrdb(self) -> None:
-        '''Trigger a checkpoint operation.'''
+        '''Write pending phrases and trigger a checkpoint operation.'''
+        self.flush_pending_phrases()
         LOGGER.info('commit and execute checkpoint ...')
         try:
             self.database.commit()
             # self.database.execute('PRAGMA wal_checkpoint;')
             # more aggressive with TRUNCATE:
-            self.database.execute('PRAGMA wal_checkpoint(TRUNCATE);')
+            self._wal_checkpoint(self.database, 'TRUNCATE')
             LOGGER.info('commit and execute checkpoint done.')
         except sqlite3.OperationalError as error:
             LOGGER.exception(
                 'Unexpected error syncing user database: %s: %s',
                 error.__class__.__name__, error)
+        self.save_query_stats()
 
     def create_tables(self) -> bool:
-        '''Create table for the phrases
+        '''Create tables for the phrases
 
         :return: True if tables were created, False on error
         '''
         LOGGER.info('Creating tables...')
         try:
             with self.transaction():
+                self.database.executescript(
+                    _NGRAM_TABLES_SQL.format(schema='user_db.')
+                    + _PHRASES_VIEW_SQL.format(schema='user_db.')
+                    + _SHORTCUTS_TABLE_SQL.format(schema='user_db.'))
+                # The files training data was read from, to be able to
+                # skip them when feeding training data continuously:
                 self.database.execute('''
-                CREATE TABLE IF NOT EXISTS user_db.phrases
-                (id INTEGER PRIMARY KEY,
-                input_phrase TEXT,
-                phrase TEXT,
-                p_phrase TEXT,
-                pp_phrase TEXT,
-                user_freq INTEGER,
+                CREATE TABLE IF NOT EXISTS user_db.training_files
+                (filename TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
                 timestamp REAL)
                 ''')
             LOGGER.info('Tables created.')
@@ -457,26 +2087,9 @@ class TabSqliteDb:
             itb_util_core.NORMALIZATION_FORM_INTERNAL, phrase)
         p_phrase = itb_util_core.remove_accents(p_phrase.lower())
         pp_phrase = itb_util_core.remove_accents(pp_phrase.lower())
-        select_sqlstr = '''
-        SELECT * FROM user_db.phrases
-        WHERE input_phrase = :input_phrase
-        AND phrase = :phrase AND p_phrase = :p_phrase AND pp_phrase = :pp_phrase
-        '''
-        select_sqlargs = {
-            'input_phrase': input_phrase,
-            'phrase': phrase,
-            'p_phrase': p_phrase,
-            'pp_phrase': pp_phrase}
-        if self.database.execute(select_sqlstr, select_sqlargs).fetchall():
-            # there is already such a phrase, i.e. add_phrase was called
-            # in error, do nothing to avoid duplicate entries.
-            return True
-
-        insert_sqlstr = '''
-        INSERT INTO user_db.phrases
-        (input_phrase, phrase, p_phrase, pp_phrase, user_freq, timestamp)
-        VALUES (:input_phrase, :phrase, :p_phrase, :pp_phrase, :user_freq, :timestamp)
-        '''
+        # If there is already such a phrase, add_phrase was called
+        # in error, do nothing to avoid duplicate entries:
+        insert_sqlstr = _ngram_upsert_sql('DO NOTHING')
         insert_sqlargs = {'input_phrase': input_phrase,
                           'phrase': phrase,
                           'p_phrase': p_phrase,
@@ -488,7 +2101,15 @@ class TabSqliteDb:
             LOGGER.debug('insert_sqlargs=%s', insert_sqlargs)
         try:
             with self.transaction():
-                self.database.execute(insert_sqlstr, insert_sqlargs)
+                _intern_vocab(self.database, [insert_sqlargs])
+                inserted = self.database.execute(
+                    insert_sqlstr, insert_sqlargs).rowcount
+            if inserted:
+                self._select_cache_invalidate(
+                    input_phrase, p_phrase, pp_phrase)
+            if inserted and self._ngram_model is not None:
+                self._ngram_model.add(
+                    (input_phrase, phrase, p_phrase, pp_phrase), user_freq)
             return True
         except sqlite3.Error as error:
             LOGGER.exception(
@@ -506,10 +2127,18 @@ class TabSqliteDb:
         :return: True if indexes were created, False on error
         '''
         sqlstr = '''
-        CREATE INDEX IF NOT EXISTS user_db.phrases_index_p ON phrases
+        CREATE INDEX IF NOT EXISTS user_db.ngrams_index_p ON ngrams
         (input_phrase, id ASC);
-        CREATE INDEX IF NOT EXISTS user_db.phrases_index_i ON phrases
-        (phrase)
+        CREATE INDEX IF NOT EXISTS user_db.ngrams_index_i ON ngrams
+        (phrase_id);
+        CREATE INDEX IF NOT EXISTS user_db.ngrams_index_context ON ngrams
+        (p_phrase_id, pp_phrase_id);
+        CREATE UNIQUE INDEX IF NOT EXISTS user_db.ngrams_index_ngram ON ngrams
+        (input_phrase, phrase_id, p_phrase_id, pp_phrase_id);
+        CREATE INDEX IF NOT EXISTS user_db.shortcuts_index_p ON shortcuts
+        (input_phrase);
+        CREATE UNIQUE INDEX IF NOT EXISTS user_db.shortcuts_index_shortcut
+        ON shortcuts (phrase, input_phrase)
         '''
         LOGGER.info('Creating indexes...')
         try:
@@ -527,6 +2156,7 @@ class TabSqliteDb:
                 error.__class__.__name__, error)
         return False
 
+    @_timed('select_shortcuts')
     def select_shortcuts(
             self,
             input_phrase: str) -> List[itb_util_core.PredictionCandidate]:
@@ -536,21 +2166,30 @@ class TabSqliteDb:
         if DEBUG_LEVEL > 1:
             LOGGER.debug('input_phrase=%s', input_phrase)
         phrase_frequencies: Dict[str, float] = {}
-        sqlargs = {'input_phrase': input_phrase + '%',
-                   'user_freq': itb_util_core.SHORTCUT_USER_FREQ}
-        sqlstr = ('SELECT phrase, sum(user_freq) FROM user_db.phrases '
-                  'WHERE input_phrase LIKE :input_phrase '
-                  'AND user_freq >= :user_freq '
-                  'GROUP BY phrase;')
-        results_shortcuts: List[Tuple[str, int]] = []
-        try:
-            results_shortcuts = self.database.execute(
-                sqlstr, sqlargs).fetchall()
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error fetching '
-                'user shortcuts from database: %s: %s',
-                 error.__class__.__name__, error)
+        cache_key = ('shortcuts', input_phrase, '', '')
+        results_shortcuts: List[Tuple[str, int]] = self._select_cache_get(
+            cache_key)
+        if results_shortcuts is None:
+            # A range query which can use the index shortcuts_index_p
+            # instead of LIKE (which would also treat “%” and “_”
+            # typed by the user as wildcards):
+            sqlargs = {'input_phrase': input_phrase,
+                       'input_phrase_upper': prefix_upper_bound(input_phrase)}
+            prefix_condition = 'input_phrase >= :input_phrase'
+            if sqlargs['input_phrase_upper'] is not None:
+                prefix_condition += ' AND input_phrase < :input_phrase_upper'
+            sqlstr = ('SELECT phrase, sum(user_freq) FROM user_db.shortcuts '
+                      f'WHERE {prefix_condition} GROUP BY phrase;')
+            results_shortcuts = []
+            try:
+                results_shortcuts = self.database.execute(
+                    sqlstr, sqlargs).fetchall()
+            except Exception as error: # pylint: disable=broad-except
+                LOGGER.exception(
+                    'Unexpected error fetching '
+                    'user shortcuts from database: %s: %s',
+                     error.__class__.__name__, error)
+            self._select_cache_put(cache_key, results_shortcuts)
         if results_shortcuts:
             phrase_frequencies.update(results_shortcuts)
         best_shortcut_candidates = itb_util_core.best_candidates(phrase_frequencies)
@@ -559,6 +2198,7 @@ class TabSqliteDb:
                 'best_shortcut_candidates=%s', best_shortcut_candidates)
         return best_shortcut_candidates
 
+    @_timed('select_words_empty_input')
     def select_words_empty_input(
             self,
             p_phrase: str,
@@ -579,45 +2219,143 @@ class TabSqliteDb:
             return itb_util_core.best_candidates(phrase_frequencies)
         p_phrase = itb_util_core.remove_accents(p_phrase.lower())
         pp_phrase = itb_util_core.remove_accents(pp_phrase.lower())
+        cache_key = ('empty', '', p_phrase, pp_phrase)
+        user_freqs: Dict[str, int] = self._select_cache_get(cache_key)
+        if user_freqs is None:
+            ngram_model = self._get_ngram_model()
+            if ngram_model is not None:
+                user_freqs = ngram_model.context_sums(p_phrase, pp_phrase)
+            else:
+                user_freqs = self._select_context_sums(p_phrase, pp_phrase)
+            self._select_cache_put(cache_key, user_freqs)
+        count_pp_phrase_p_phrase = sum(user_freqs.values())
+        if not count_pp_phrase_p_phrase:
+            return itb_util_core.best_candidates(phrase_frequencies)
+        for phrase, user_freq in user_freqs.items():
+            phrase_frequencies[phrase] = (
+                user_freq/float(count_pp_phrase_p_phrase))
+        if DEBUG_LEVEL > 1:
+            LOGGER.debug(
+                'Best candidates for empty input with given context=%s',
+                itb_util_core.best_candidates(phrase_frequencies))
+        return itb_util_core.best_candidates(phrase_frequencies)
+
+    def _select_context_sums(
+            self, p_phrase: str, pp_phrase: str) -> Dict[str, int]:
+        '''Get the sums of user_freq of the phrases which occured with
+        the context (p_phrase, pp_phrase) from the database
+
+        The pending increments not yet written to the database are
+        included.
+        '''
         sqlargs = {'p_phrase': p_phrase, 'pp_phrase': pp_phrase}
-        sqlstr = ('SELECT phrase, sum(user_freq) FROM user_db.phrases '
-                  'WHERE p_phrase = :p_phrase '
-                  'AND pp_phrase = :pp_phrase GROUP BY phrase;')
+        # The context is matched by a seek in the index
+        # ngrams_index_context on the vocab ids:
+        sqlstr = ('SELECT text, sum(user_freq) FROM user_db.ngrams '
+                  'JOIN user_db.vocab ON vocab.id = ngrams.phrase_id '
+                  f'WHERE p_phrase_id = {_vocab_id("p_phrase")} '
+                  f'AND pp_phrase_id = {_vocab_id("pp_phrase")} '
+                  'GROUP BY text;')
         results = None
+        batches = [self._pending_phrases]
         try:
-            results = self.database.execute(sqlstr, sqlargs).fetchall()
+            (results, batches) = self._execute_with_unwritten_phrases(
+                sqlstr, sqlargs)
         except Exception as error: # pylint: disable=broad-except
             LOGGER.exception(
                 'Unexpected error getting phrases for empty input '
                 'with given context from user_db: %s: %s',
                 error.__class__.__name__, error)
             results = None
-        if not results:
-            return itb_util_core.best_candidates(phrase_frequencies)
+        user_freqs: Dict[str, int] = dict(results or [])
+        for batch in batches:
+            for ((_input_phrase, phrase, pending_p_phrase, pending_pp_phrase),
+                 (user_freq_increment, _timestamp)) in batch.items():
+                if (pending_p_phrase == p_phrase
+                    and pending_pp_phrase == pp_phrase):
+                    user_freqs[phrase] = (
+                        user_freqs.get(phrase, 0) + user_freq_increment)
+        return user_freqs
+
+    def _select_ngram_sums(
+            self,
+            input_phrase: str,
+            p_phrase: str,
+            pp_phrase: str,
+    ) -> List[Tuple[str, int, Optional[int], Optional[int]]]:
+        '''Get the unigram, bigram and trigram sums of user_freq of
+        all phrases where the input phrase starts with input_phrase
+        from the database
+
+        The pending increments not yet written to the database are
+        included.
+
+        :param input_phrase: The input with accents removed
+        :param p_phrase: The previous word with accents removed
+        :param pp_phrase: The word before the previous word with
+                          accents removed
+        :return: (phrase, unigram sum, bigram sum, trigram sum) tuples.
+                 The bigram and trigram sums are None if no row
+                 of the phrase matches the context.
+        '''
+        # Find the rows where input_phrase starts with the input with
+        # a range query which can use the index ngrams_index_p
+        # instead of LIKE (which would also treat “%” and “_” typed
+        # by the user as wildcards):
+        sqlargs = {'input_phrase': input_phrase,
+                   'input_phrase_upper': prefix_upper_bound(input_phrase),
+                   'p_phrase': p_phrase,
+                   'pp_phrase': pp_phrase}
+        prefix_condition = 'input_phrase >= :input_phrase'
+        if sqlargs['input_phrase_upper'] is not None:
+            prefix_condition += ' AND input_phrase < :input_phrase_upper'
+        # Get the “unigram”, “bigram” and “trigram” data from user_db
+        # in a single pass over the matching rows. The conditional sums
+        # are NULL if no row of a phrase matches the context. The
+        # context is compared as vocab ids, the subqueries looking up
+        # the ids are evaluated only once:
         sqlstr = (
-            'SELECT sum(user_freq) FROM user_db.phrases '
-            'WHERE p_phrase = :p_phrase AND pp_phrase = :pp_phrase;')
-        count_pp_phrase_p_phrase = 0
+            'SELECT text, sum(user_freq), '
+            f'sum(CASE WHEN p_phrase_id = {_vocab_id("p_phrase")} '
+            'THEN user_freq END), '
+            f'sum(CASE WHEN p_phrase_id = {_vocab_id("p_phrase")} '
+            f'AND pp_phrase_id = {_vocab_id("pp_phrase")} '
+            'THEN user_freq END) '
+            'FROM user_db.ngrams '
+            'JOIN user_db.vocab ON vocab.id = ngrams.phrase_id '
+            f'WHERE {prefix_condition} GROUP BY text;')
+        results: List[Tuple[str, int, Optional[int], Optional[int]]] = []
+        batches = [self._pending_phrases]
         try:
-            count_pp_phrase_p_phrase = self.database.execute(
-                sqlstr, sqlargs).fetchall()[0][0]
+            # Example: Let’s assume the user typed “co”, p_phrase is
+            # “green”, pp_phrase is “nice” and user_db contains
+            #
+            #     1|colou|colour|green|nice|1
+            #     2|col|colour|yellow|ugly|2
+            #     3|co|colour|green|awesome|1
+            #     4|co|cold|||1
+            #     5|conspirac|conspiracy|||5
+            #     6|conspi|conspiracy|||1
+            #     7|c|conspiracy|||1
+            (results, batches) = self._execute_with_unwritten_phrases(
+                sqlstr, sqlargs)
+            # Then the result returned by .fetchall() is:
+            #
+            # [('colour', 4, 2, 1), ('cold', 1, None, None),
+            #  ('conspiracy', 6, None, None)]
+            #
+            # (“c|conspiracy|1” is not selected because its
+            # input_phrase doesn’t start with the user input “co”!)
         except Exception as error: # pylint: disable=broad-except
             LOGGER.exception(
-                'Unexpected error getting total count for empty input '
-                'with given context from user_db: %s: %s',
-                 error.__class__.__name__, error)
-            count_pp_phrase_p_phrase = 0
-        if not count_pp_phrase_p_phrase:
-            return itb_util_core.best_candidates(phrase_frequencies)
-        for result in results:
-            phrase_frequencies.update(
-                [(result[0], result[1]/float(count_pp_phrase_p_phrase))])
-        if DEBUG_LEVEL > 1:
-            LOGGER.debug(
-                'Best candidates for empty input with given context=%s',
-                itb_util_core.best_candidates(phrase_frequencies))
-        return itb_util_core.best_candidates(phrase_frequencies)
+                'Unexpected error getting n-gram data from user_db: %s: %s',
+                error.__class__.__name__, error)
+        if any(batches):
+            results = self._add_pending_phrases(
+                results, batches, input_phrase, p_phrase, pp_phrase)
+        return results
 
+    @_timed('select_words')
     def select_words(
             self,
             input_phrase: str,
@@ -642,6 +2380,10 @@ class TabSqliteDb:
         p_phrase = itb_util_core.remove_accents(p_phrase.lower())
         pp_phrase = itb_util_core.remove_accents(pp_phrase.lower())
         title_case = input_phrase.istitle()
+        # Order of the hunspell suggestions, used to order suggestions
+        # with equal scores, for example dictionary completions ranked
+        # by word frequency:
+        hunspell_ranks: Dict[str, int] = {}
         if ' ' not in input_phrase:
             # Get suggestions from hunspell dictionaries. But only
             # if input_phrase does not contain spaces. The hunspell
@@ -649,11 +2391,18 @@ class TabSqliteDb:
             # Trying to complete an input_phrase which contains spaces
             # will never work and spell checking suggestions by hunspell
             # for input which contains spaces is almost always nonsense.
-            phrase_frequencies.update(self.hunspell_obj.suggest(input_phrase))
+            hunspell_suggestions = self.hunspell_obj.suggest(input_phrase)
+            phrase_frequencies.update(hunspell_suggestions)
+            if self.hunspell_obj.has_word_frequencies():
+                hunspell_ranks = {
+                    phrase: rank
+                    for rank, (phrase, _score)
+                    in enumerate(hunspell_suggestions)}
         if DEBUG_LEVEL > 1:
             LOGGER.debug(
                 'hunspell: best_candidates=%s',
-                itb_util_core.best_candidates(phrase_frequencies, title=title_case))
+                itb_util_core.best_candidates(
+                    phrase_frequencies, title=title_case, ranks=hunspell_ranks))
         # Remove the accents *after* getting the hunspell candidates.
         # If the accents were removed before getting the hunspell candidates
         # an input phrase like “Glühwürmchen” would not be added as a
@@ -667,171 +2416,134 @@ class TabSqliteDb:
         #
         # {'code': 0, 'communicability': 0, 'cold': 0, 'colour': 0}
 
-        # To quote a string to be used as a parameter when assembling
-        # an sqlite statement with Python string operations, remove
-        # all NUL characters, replace ' with '' and wrap the whole
-        # string in single quotes. Assembling sqlite statements using
-        # parameters containing user input with python string operations
-        # is not recommended because of the risk of SQL injection attacks
-        # if the quoting is not done the right way. So it is better to use
-        # the parameter substitution of the sqlite3 python interface.
-        # But unfortunately that does not work when creating views,
-        # (“OperationalError: parameters are not allowed in views”).
-        sql_escaped_input_phrase = input_phrase.replace(
-            '\x00', '').replace("'", "''")
-        self.database.execute('DROP VIEW IF EXISTS like_input_phrase_view;')
-        sqlstr = f'''
-        CREATE TEMPORARY VIEW IF NOT EXISTS like_input_phrase_view AS
-        SELECT * FROM user_db.phrases
-        WHERE input_phrase LIKE '{sql_escaped_input_phrase}%'
-        ;'''
-        try:
-            self.database.execute(sqlstr)
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error in creating database view: %s: %s',
-                error.__class__.__name__, error)
-        sqlargs = {'p_phrase': p_phrase, 'pp_phrase': pp_phrase}
-        sqlstr = (
-            'SELECT phrase, sum(user_freq) FROM like_input_phrase_view '
-            'GROUP BY phrase;')
-        try:
-            # Get “unigram” data from user_db.
-            #
-            # Example: Let’s assume the user typed “co” and user_db contains
-            #
-            #     1|colou|colour|green|nice|1
-            #     2|col|colour|yellow|ugly|2
-            #     3|co|colour|green|awesome|1
-            #     4|co|cold|||1
-            #     5|conspirac|conspiracy|||5
-            #     6|conspi|conspiracy|||1
-            #     7|c|conspiracy|||1
-            results_uni = self.database.execute(sqlstr, sqlargs).fetchall()
-            # Then the result returned by .fetchall() is:
-            #
-            # [('colour', 4), ('cold', 1), ('conspiracy', 6)]
-            #
-            # (“c|conspiracy|1” is not selected because it doesn’t
-            # match the user input “LIKE co%”! I.e. this is filtered
-            # out by the VIEW created above already)
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error getting “unigram” data from user_db: %s: %s',
-                error.__class__.__name__, error)
-        if not results_uni:
+        cache_key = ('words', input_phrase, p_phrase, pp_phrase)
+        results: List[Tuple[str, int, Optional[int], Optional[int]]] = (
+            self._select_cache_get(cache_key))
+        if results is None:
+            ngram_model = self._get_ngram_model()
+            if ngram_model is not None:
+                results = ngram_model.ngram_sums(
+                    input_phrase, p_phrase, pp_phrase)
+            else:
+                results = self._select_ngram_sums(
+                    input_phrase, p_phrase, pp_phrase)
+            self._select_cache_put(cache_key, results)
+        if not results:
             # If no unigrams matched, bigrams and trigrams cannot
             # match either. We can stop here and return what we got
             # from hunspell.
-            return itb_util_core.best_candidates(phrase_frequencies, title=title_case)
+            return itb_util_core.best_candidates(
+                phrase_frequencies, title=title_case, ranks=hunspell_ranks)
         # Now normalize the unigram frequencies with the total count
-        # (which is 11 in the above example), which gives us the
-        # normalized result:
+        # (which is 11 in the example in _select_ngram_sums()), which
+        # gives us the normalized result:
         # [('colour', 4/11), ('cold', 1/11), ('conspiracy', 6/11)]
-        sqlstr = 'SELECT sum(user_freq) FROM like_input_phrase_view;'
-        try:
-            count = self.database.execute(sqlstr, sqlargs).fetchall()[0][0]
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error getting total unigram count '
-                'from user_db: %s: %s',
-                 error.__class__.__name__, error)
+        count = sum(result[1] for result in results)
         # Updating the phrase_frequency dictionary with the normalized
         # results gives: {'conspiracy': 6/11, 'code': 0,
         # 'communicability': 0, 'cold': 1/11, 'colour': 4/11}
-        for result_uni in results_uni:
-            phrase_frequencies.update(
-                [(result_uni[0], result_uni[1]/float(count))])
+        for result in results:
+            phrase_frequencies[result[0]] = result[1]/float(count)
         if DEBUG_LEVEL > 1:
             LOGGER.debug(
                 'Unigram best_candidates=%s',
-                itb_util_core.best_candidates(phrase_frequencies, title=title_case))
+                itb_util_core.best_candidates(
+                    phrase_frequencies, title=title_case, ranks=hunspell_ranks))
         if not p_phrase:
             # If no context for bigram matching is available, return
             # what we have so far:
-            return itb_util_core.best_candidates(phrase_frequencies, title=title_case)
-        sqlstr = (
-            'SELECT phrase, sum(user_freq) FROM like_input_phrase_view '
-            'WHERE p_phrase = :p_phrase GROUP BY phrase;')
-        try:
-            results_bi = self.database.execute(sqlstr, sqlargs).fetchall()
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error getting “bigram” data '
-                'from user_db: %s: %s',
-                error.__class__.__name__, error)
-        if not results_bi:
-            # If no bigram could be matched, return what we have so far:
-            return itb_util_core.best_candidates(phrase_frequencies, title=title_case)
+            return itb_util_core.best_candidates(
+                phrase_frequencies, title=title_case, ranks=hunspell_ranks)
         # get the total count of p_phrase to normalize the bigram frequencies:
-        sqlstr = (
-            'SELECT sum(user_freq) FROM like_input_phrase_view '
-            'WHERE p_phrase = :p_phrase;')
-        try:
-            count_p_phrase = self.database.execute(
-                sqlstr, sqlargs).fetchall()[0][0]
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error getting total bigram count '
-                'from user_db: %s: %s',
-                 error.__class__.__name__, error)
+        count_p_phrase = sum(
+            result[2] for result in results if result[2] is not None)
+        if not count_p_phrase:
+            # If no bigram could be matched, return what we have so far:
+            return itb_util_core.best_candidates(
+                phrase_frequencies, title=title_case, ranks=hunspell_ranks)
         # Update the phrase frequency dictionary by using a linear
         # combination of the unigram and the bigram results, giving
         # both the weight of 0.5:
-        for result_bi in results_bi:
-            phrase_frequencies.update(
-                [(result_bi[0],
-                  0.5*result_bi[1]/float(count_p_phrase)
-                  +0.5*phrase_frequencies[result_bi[0]])])
+        for result in results:
+            if result[2] is not None:
+                phrase_frequencies[result[0]] = (
+                    0.5*result[2]/float(count_p_phrase)
+                    +0.5*phrase_frequencies[result[0]])
         if DEBUG_LEVEL > 1:
             LOGGER.debug(
                 'Bigram best_candidates=%s',
-                itb_util_core.best_candidates(phrase_frequencies, title=title_case))
+                itb_util_core.best_candidates(
+                    phrase_frequencies, title=title_case, ranks=hunspell_ranks))
         if not pp_phrase:
             # If no context for trigram matching is available, return
             # what we have so far:
-            return itb_util_core.best_candidates(phrase_frequencies, title=title_case)
-        sqlstr = ('SELECT phrase, sum(user_freq) FROM like_input_phrase_view '
-                  'WHERE p_phrase = :p_phrase '
-                  'AND pp_phrase = :pp_phrase GROUP BY phrase;')
-        try:
-            results_tri = self.database.execute(sqlstr, sqlargs).fetchall()
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error getting “trigram” data '
-                'from user_db: %s: %s',
-                 error.__class__.__name__, error)
-        if not results_tri:
-            # if no trigram could be matched, return what we have so far:
-            return itb_util_core.best_candidates(phrase_frequencies, title=title_case)
+            return itb_util_core.best_candidates(
+                phrase_frequencies, title=title_case, ranks=hunspell_ranks)
         # get the total count of (p_phrase, pp_phrase) pairs to
-        # normalize the bigram frequencies:
-        sqlstr = (
-            'SELECT sum(user_freq) FROM like_input_phrase_view '
-            'WHERE p_phrase = :p_phrase AND pp_phrase = :pp_phrase;')
-        try:
-            count_pp_phrase_p_phrase = self.database.execute(
-                sqlstr, sqlargs).fetchall()[0][0]
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error getting total trigram count '
-                'from user_db: %s: %s',
-                 error.__class__.__name__, error)
+        # normalize the trigram frequencies:
+        count_pp_phrase_p_phrase = sum(
+            result[3] for result in results if result[3] is not None)
+        if not count_pp_phrase_p_phrase:
+            # if no trigram could be matched, return what we have so far:
+            return itb_util_core.best_candidates(
+                phrase_frequencies, title=title_case, ranks=hunspell_ranks)
         # Update the phrase frequency dictionary by using a linear
         # combination of the bigram and the trigram results, giving
         # both the weight of 0.5 (that makes the total weights: 0.25 *
         # unigram + 0.25 * bigram + 0.5 * trigram, i.e. the trigrams
         # get higher weight):
-        for result_tri in results_tri:
-            phrase_frequencies.update(
-                [(result_tri[0],
-                  0.5*result_tri[1]/float(count_pp_phrase_p_phrase)
-                  +0.5*phrase_frequencies[result_tri[0]])])
+        for result in results:
+            if result[3] is not None:
+                phrase_frequencies[result[0]] = (
+                    0.5*result[3]/float(count_pp_phrase_p_phrase)
+                    +0.5*phrase_frequencies[result[0]])
         if DEBUG_LEVEL > 1:
             LOGGER.debug(
                 'Trigram best_candidates=%s',
-                itb_util_core.best_candidates(phrase_frequencies, title=title_case))
-        return itb_util_core.best_candidates(phrase_frequencies, title=title_case)
+                itb_util_core.best_candidates(
+                    phrase_frequencies, title=title_case, ranks=hunspell_ranks))
+        return itb_util_core.best_candidates(
+            phrase_frequencies, title=title_case, ranks=hunspell_ranks)
+
+    def _add_pending_phrases(
+            self,
+            results: List[Tuple[str, int, Optional[int], Optional[int]]],
+            batches: Iterable[_PendingPhrases],
+            input_phrase: str,
+            p_phrase: str,
+            pp_phrase: str,
+    ) -> List[Tuple[str, int, Optional[int], Optional[int]]]:
+        '''Add the pending frequency increments to the n-gram data
+        for select_words()
+
+        :param results: The (phrase, unigram sum, bigram sum, trigram sum)
+                        tuples found in the user database. The bigram
+                        and trigram sums are None if no row matches
+                        the context.
+        :param batches: The pending increments not contained
+                        in results
+        :param input_phrase: The input with accents removed
+        :param p_phrase: The previous word with accents removed
+        :param pp_phrase: The word before the previous word with
+                          accents removed
+        :return: The results including the pending increments
+        '''
+        sums: Dict[str, Tuple[int, Optional[int], Optional[int]]] = {
+            result[0]: result[1:] for result in results}
+        for ((pending_input_phrase, phrase, pending_p_phrase, pending_pp_phrase),
+             (user_freq_increment, _timestamp)) in (
+                 item for batch in batches for item in batch.items()):
+            if not pending_input_phrase.startswith(input_phrase):
+                continue
+            (uni, bi, tri) = sums.get(phrase, (0, None, None))
+            uni += user_freq_increment
+            if pending_p_phrase == p_phrase:
+                bi = (bi or 0) + user_freq_increment
+                if pending_pp_phrase == pp_phrase:
+                    tri = (tri or 0) + user_freq_increment
+            sums[phrase] = (uni, bi, tri)
+        return [(phrase, uni, bi, tri)
+                for phrase, (uni, bi, tri) in sums.items()]
 
     def generate_userdb_desc(self) -> bool:
         '''
@@ -867,6 +2579,81 @@ class TabSqliteDb:
                  error.__class__.__name__, error)
         return False
 
+    def set_query_stats_file(self, filename: str) -> None:
+        '''Enable or disable recording the latencies of database operations
+
+        The latencies, the numbers of rows and the durations of the
+        checkpoints are added to the statistics already in the file.
+        The file is rewritten every QUERY_STATS_SAVE_SECONDS and by
+        sync_usrdb(). “tabstatistics.py --query-stats” displays
+        the percentiles.
+
+        :param filename: The file to write the statistics to.
+                         A file name without a directory is put into
+                         ~/.local/share/ibus-typing-booster/.
+                         If empty, the statistics are not recorded.
+        '''
+        if self._query_stats is not None:
+            self.save_query_stats()
+        self._query_stats = None
+        self._query_stats_file = filename
+        if not filename:
+            return
+        if os.path.basename(filename) == filename:
+            self._query_stats_file = os.path.join(os.path.expanduser(
+                '~/.local/share/ibus-typing-booster'), filename)
+        query_stats = QueryStats(label=itb_version.get_version())
+        if os.path.exists(self._query_stats_file):
+            # Continue the statistics of earlier sessions:
+            query_stats.load(self._query_stats_file)
+        else:
+            os.makedirs(os.path.dirname(self._query_stats_file),
+                        exist_ok=True)
+        self._query_stats = query_stats
+        self._query_stats_saved = time.monotonic()
+        LOGGER.info('Recording query statistics in %s', self._query_stats_file)
+
+    def save_query_stats(self) -> bool:
+        '''Write the query statistics file
+
+        :return: True if successful or nothing to do, False on failure
+        '''
+        if self._query_stats is None:
+            return True
+        self._query_stats_saved = time.monotonic()
+        return self._query_stats.save(self._query_stats_file)
+
+    def _record_query(
+            self, operation: str, seconds: float, rows: int = 0) -> None:
+        '''Record the latency of a database operation
+
+        Does nothing unless enabled by set_query_stats_file().
+
+        :param operation: The name of the operation
+        :param seconds: The latency
+        :param rows: The number of rows returned or written
+        '''
+        query_stats = self._query_stats
+        if query_stats is None:
+            return
+        query_stats.record(operation, seconds, rows)
+        if (threading.current_thread() is threading.main_thread()
+            and time.monotonic() - self._query_stats_saved
+            > QUERY_STATS_SAVE_SECONDS):
+            self.save_query_stats()
+
+    def _wal_checkpoint(
+            self, database: sqlite3.Connection, mode: str = 'PASSIVE') -> None:
+        '''Do a checkpoint of the write ahead log and record its duration
+
+        :param database: The database connection to use
+        :param mode: The checkpoint mode, 'PASSIVE' or 'TRUNCATE'
+        '''
+        start_time = time.perf_counter()
+        database.execute(f'PRAGMA wal_checkpoint({mode});')
+        self._record_query(
+            'wal_checkpoint', time.perf_counter() - start_time)
+
     @classmethod
     def get_database_desc(cls, db_file: str) -> Optional[Dict[str, str]]:
         '''Get the description of the database'''
@@ -896,39 +2683,21 @@ class TabSqliteDb:
     @classmethod
     def get_number_of_columns_of_phrase_table(
             cls, db_file: str) -> Optional[int]:
-        # pylint: disable=line-too-long
         '''
         Get the number of columns in the 'phrases' table in
         the database in db_file.
 
-        Determines the number of columns by parsing this:
-
-        sqlite> select sql from sqlite_master where name='phrases';
-CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_phrase TEXT, pp_phrase TEXT, user_freq INTEGER, timestamp REAL)
-        sqlite>
-
-        This result could be on a single line, as above, or on multiple
-        lines.
+        Since version 0.67 'phrases' is a view on the ngrams and
+        vocab tables with the same columns the table had before.
+        PRAGMA table_info() works for both.
         '''
-        # pylint: enable=line-too-long
         if not os.path.exists(db_file):
             return None
         database = None
         try:
             with cls.sqlite3_connect_database(db_file) as database:
-                table_phrases_result = database.execute(
-                    "select sql from sqlite_master where name='phrases';"
-                ).fetchall()
-                if not table_phrases_result or not table_phrases_result[0][0]:
-                    return 0
-                # Remove possible line breaks from the string where we
-                # want to match:
-                string = ' '.join(table_phrases_result[0][0].splitlines())
-                match = re.match(r'.*\((.*)\)', string)
-                if match:
-                    table_phrases_columns = match.group(1).split(',')
-                    return len(table_phrases_columns)
-                return 0
+                return len(database.execute(
+                    'PRAGMA table_info(phrases);').fetchall())
         except (sqlite3.Error, OSError, IndexError, AttributeError) as error:
             LOGGER.exception(
                 'Error getting number of columns: %s: %s',
@@ -944,13 +2713,11 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
         '''Returns a list of user defined shortcuts from the user database.
         '''
         sqlstr = '''
-        SELECT input_phrase, phrase FROM user_db.phrases WHERE user_freq >= :freq
+        SELECT input_phrase, phrase FROM user_db.shortcuts
         ;'''
-        sqlargs = {'freq': itb_util_core.SHORTCUT_USER_FREQ}
         if DEBUG_LEVEL > 1:
             LOGGER.debug('sqlstr=%s', sqlstr)
-            LOGGER.debug('sqlargs=%s', sqlargs)
-        result = self.database.execute(sqlstr, sqlargs).fetchall()
+        result = self.database.execute(sqlstr).fetchall()
         if DEBUG_LEVEL > 1:
             LOGGER.debug('result=%s', result)
         return result
@@ -985,12 +2752,16 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
                    'user_freq': user_freq,
                    'timestamp': time.time()}
         sqlstr = (
-            'INSERT INTO user_db.phrases '
-            '(input_phrase, phrase, p_phrase, pp_phrase, user_freq, timestamp)'
-            'VALUES (:input_phrase, :phrase, "", "", :user_freq, :timestamp);')
+            'INSERT INTO user_db.shortcuts '
+            '(input_phrase, phrase, user_freq, timestamp) '
+            'VALUES (:input_phrase, :phrase, :user_freq, :timestamp) '
+            'ON CONFLICT (phrase, input_phrase) '
+            'DO UPDATE SET user_freq = max(user_freq, excluded.user_freq), '
+            'timestamp = excluded.timestamp;')
         try:
             with self.transaction():
                 self.database.execute(sqlstr, sqlargs)
+            self._select_cache_invalidate(input_phrase, '', '')
             return True
         except sqlite3.Error as error:
             LOGGER.exception(
@@ -1002,6 +2773,7 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
                 error.__class__.__name__, error)
         return False
 
+    @_timed('check_shortcut_and_update_frequency')
     def check_shortcut_and_update_frequency(
             self,
             input_phrase: str = '',
@@ -1026,12 +2798,10 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
         input_phrase = unicodedata.normalize(
             itb_util_core.NORMALIZATION_FORM_INTERNAL, input_phrase)
         sqlargs = {'phrase': phrase,
-                   'user_freq': itb_util_core.SHORTCUT_USER_FREQ,
                    'timestamp': time.time()}
         sqlstr = ('SELECT input_phrase, user_freq '
-                  'FROM user_db.phrases '
-                  'WHERE phrase = :phrase '
-                  'AND user_freq >= :user_freq;')
+                  'FROM user_db.shortcuts '
+                  'WHERE phrase = :phrase;')
         results = []
         try:
             results = self.database.execute(sqlstr, sqlargs).fetchall()
@@ -1056,13 +2826,14 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
             sqlargs['user_freq'] = new_user_freq
             sqlargs['input_phrase'] = db_input_phrase
             sqlstr = (
-                'UPDATE user_db.phrases '
+                'UPDATE user_db.shortcuts '
                 'SET user_freq = :user_freq, timestamp = :timestamp '
-                'WHERE input_phrase = :input_phrase '
-                'AND phrase = :phrase ;')
+                'WHERE phrase = :phrase '
+                'AND input_phrase = :input_phrase;')
             try:
                 with self.transaction():
                     self.database.execute(sqlstr, sqlargs)
+                self._select_cache_invalidate(db_input_phrase)
                 continue
             except sqlite3.Error as error:
                 LOGGER.exception(
@@ -1075,6 +2846,7 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
             return False
         return True
 
+    @_timed('check_phrase_and_update_frequency')
     def check_phrase_and_update_frequency(
             self,
             input_phrase: str = '',
@@ -1086,6 +2858,12 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
         Check whether input_phrase and phrase are already in database. If
         they are in the database, increase the frequency by 1, if not
         add them.
+
+        The increment is only recorded in memory, it is written to the
+        database by flush_pending_phrases(), which happens
+        automatically when too many increments are pending or the
+        oldest one is too old. The pending increments are already used
+        by select_words() and phrase_exists().
         '''
         if DEBUG_LEVEL > 1:
             LOGGER.debug(
@@ -1113,54 +2891,27 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
         pp_phrase = itb_util_core.remove_accents(pp_phrase.lower())
         input_phrase = itb_util_core.remove_accents(input_phrase.lower())
 
-        # There should never be more than 1 database row for the same
-        # input_phrase *and* phrase. So the following query on
-        # the database should match at most one database
-        # row and the length of the result array should be 0 or
-        # 1. So the “GROUP BY phrase” is actually redundant. It is
-        # only a safeguard for the case when duplicate rows have been
-        # added to the database accidentally (But in that case there
-        # is a bug somewhere else which should be fixed).
-        sqlstr = '''
-        SELECT max(user_freq) FROM user_db.phrases
-        WHERE input_phrase = :input_phrase
-        AND phrase = :phrase AND p_phrase = :p_phrase AND pp_phrase = :pp_phrase
-        GROUP BY phrase
-        ;'''
-        sqlargs = {'input_phrase': input_phrase,
-                   'phrase': phrase,
-                   'p_phrase': p_phrase,
-                   'pp_phrase': pp_phrase}
-        if DEBUG_LEVEL > 1:
-            LOGGER.debug(
-                'TabSqliteDb.check_phrase_and_update_frequency() sqlstr=%s',
-                sqlstr)
-            LOGGER.debug(
-                'TabSqliteDb.check_phrase_and_update_frequency() sqlargs=%s',
-                sqlargs)
-        result = self.database.execute(sqlstr, sqlargs).fetchall()
-        if DEBUG_LEVEL > 1:
-            LOGGER.debug(
-                'check_phrase_and_update_frequency() result=%s', result)
-        if result:
-            # A match was found in user_db, increase user frequency by
-            # user_freq_increment (1 by default)
-            return self.update_phrase(
-                input_phrase=input_phrase,
-                phrase=phrase,
-                p_phrase=p_phrase,
-                pp_phrase=pp_phrase,
-                user_freq=result[0][0]+user_freq_increment)
-        # The phrase was not found in user_db.
-        # Add it as a new phrase, i.e. with user_freq = user_freq_increment
-        # (1 by default):
-        return self.add_phrase(
-            input_phrase=input_phrase,
-            phrase=phrase,
-            p_phrase=p_phrase,
-            pp_phrase=pp_phrase,
-            user_freq=user_freq_increment)
+        # Do not write to the database immediately, a transaction with
+        # a checkpoint for every word typed is expensive. Collect the
+        # increments in memory, flush_pending_phrases() writes them
+        # later in a single transaction:
+        key = (input_phrase, phrase, p_phrase, pp_phrase)
+        if not self._pending_phrases:
+            self._pending_phrases_since = time.monotonic()
+        (pending_increment, _timestamp) = self._pending_phrases.get(
+            key, (0, 0.0))
+        self._pending_phrases[key] = (
+            pending_increment + user_freq_increment, time.time())
+        self._select_cache_invalidate(input_phrase, p_phrase, pp_phrase)
+        if self._ngram_model is not None:
+            self._ngram_model.add(key, user_freq_increment)
+        if (len(self._pending_phrases) >= self.max_pending_phrases
+            or (time.monotonic() - self._pending_phrases_since
+                >= self.max_pending_seconds)):
+            return self.flush_pending_phrases(background=True)
+        return True
 
+    @_timed('phrase_exists')
     def phrase_exists(self, phrase: str) -> int:
         '''
         Checks if an entry for phrase already exists in the user database
@@ -1176,12 +2927,28 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
             return 0
         phrase = unicodedata.normalize(
             itb_util_core.NORMALIZATION_FORM_INTERNAL, phrase)
+        ngram_model = self._get_ngram_model()
         try:
-            row = self.database.execute(
-                'SELECT sum(user_freq) FROM user_db.phrases WHERE phrase = ?',
-                (phrase,)
-            ).fetchone()
-            return int(row[0]) if row and row[0] is not None else 0
+            # The shortcuts expanding to phrase count as well:
+            user_freq = int(self.database.execute(
+                'SELECT coalesce(sum(user_freq), 0) FROM user_db.shortcuts '
+                'WHERE phrase = :phrase',
+                {'phrase': phrase}).fetchone()[0])
+            if ngram_model is not None:
+                return user_freq + ngram_model.phrase_sum(phrase)
+            (rows, batches) = self._execute_with_unwritten_phrases(
+                'SELECT sum(user_freq) FROM user_db.ngrams '
+                f'WHERE phrase_id = {_vocab_id("phrase")}',
+                {'phrase': phrase})
+            if rows and rows[0][0] is not None:
+                user_freq += int(rows[0][0])
+            for batch in batches:
+                for ((_input_phrase, pending_phrase, _p_phrase, _pp_phrase),
+                     (user_freq_increment, _timestamp)
+                     ) in batch.items():
+                    if pending_phrase == phrase:
+                        user_freq += user_freq_increment
+            return user_freq
         except sqlite3.Error as error:
             LOGGER.exception(
                 'Error checking whether phrase exists: %s: %s',
@@ -1192,6 +2959,7 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
                  error.__class__.__name__, error)
         return 0
 
+    @_timed('remove_phrase')
     def remove_phrase(
             self,
             input_phrase: str = '',
@@ -1200,6 +2968,7 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
         Remove all rows matching “input_phrase” and “phrase” from database.
         Or, if “input_phrase” is '', remove all rows matching “phrase”
         no matter for what input phrase from the database.
+        Shortcuts are removed the same way.
 
         :return: True if successful, False on failure
         '''
@@ -1212,15 +2981,31 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
         if input_phrase:
             input_phrase = unicodedata.normalize(
                 itb_util_core.NORMALIZATION_FORM_INTERNAL, input_phrase)
+        input_phrase_condition = (
+            'input_phrase = :input_phrase AND ' if input_phrase else '')
         delete_sqlstr = f'''
-            DELETE FROM user_db.phrases
-            WHERE {'input_phrase = :input_phrase AND ' if input_phrase else ''}
+            DELETE FROM user_db.ngrams
+            WHERE {input_phrase_condition}
+            phrase_id = {_vocab_id('phrase')}
+        '''
+        delete_shortcuts_sqlstr = f'''
+            DELETE FROM user_db.shortcuts
+            WHERE {input_phrase_condition}
             phrase = :phrase
         '''
         delete_sqlargs = {'input_phrase': input_phrase, 'phrase': phrase}
+        self._pending_phrases = {
+            key: value for key, value in self._pending_phrases.items()
+            if not (key[1] == phrase
+                    and (not input_phrase or key[0] == input_phrase))}
         try:
             with self.transaction():
                 self.database.execute(delete_sqlstr, delete_sqlargs)
+                self.database.execute(delete_shortcuts_sqlstr, delete_sqlargs)
+            # The rows removed may have had any input phrase:
+            self.select_cache_clear()
+            if self._ngram_model is not None:
+                self._ngram_model.remove(phrase, input_phrase=input_phrase)
             return True
         except sqlite3.Error as error:
             LOGGER.exception(
@@ -1265,112 +3050,293 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
                  error.__class__.__name__, error)
         return []
 
-    def read_training_data_from_file(self, filename: str) -> bool:
+    def read_training_data_from_file(
+            self,
+            filename: str,
+            progress_callback: Optional[Callable[[int, int], None]] = None,
+    ) -> bool:
         '''
         Read data to train the prediction from a text file.
 
+        The file is read as a stream, the n-grams are counted in
+        chunks of at most TRAINING_CHUNK_NGRAMS distinct n-grams which
+        are added to the database when a chunk is full. So memory use
+        does not grow with the size of the file.
+
+        The user_freq of n-grams already in the database is increased,
+        their timestamp is kept. New n-grams get a timestamp at 20% of
+        the time range of the database, i.e. rather old, so that
+        they are removed before the phrases learned from the user by
+        cleanup_database().
+
         :param filename: Full path of the text file to read.
+        :param progress_callback: Called with the number of bytes read
+                                  so far and the size of the file
+        :return: True if successful, False on failure
         '''
         if not os.path.isfile(filename):
             filename += '.gz'
             if not os.path.isfile(filename):
                 return False
-
-        def _open_text_file(filename: str) -> TextIO:
-            if filename.endswith('.gz'):
-                return gzip.open(filename, mode='rt', encoding='UTF-8')
-            return open(filename, mode='rt', encoding='UTF-8')
-
-        rows = self.database.execute(
-            'SELECT input_phrase, phrase, p_phrase, pp_phrase, '
-            + 'user_freq, timestamp FROM phrases;').fetchall()
-        rows = sorted(rows, key = lambda x: (float(x[5]))) # sort by timestamp
-        time_min = time.time()
-        time_max = time.time()
-        if rows:
-            time_min = rows[0][5]
-            time_max = rows[-1][5]
-        # timestamp for added entries (timestamp of existing entries is kept):
-        time_new = time_min + 0.20 * (time_max - time_min)
-        LOGGER.info('Minimum timestamp in the database=%s',
-                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time_min)))
-        LOGGER.info('Maximum timestamp in the database=%s',
-                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time_max)))
-        LOGGER.info('New timestamp in the database=%s',
-                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time_new)))
+        self.flush_pending_phrases()
+        time_new = self._training_timestamp()
+        if time_new is None:
+            return False
         p_token = ''
         pp_token = ''
-        database_dict: Dict[Tuple[str, str, str, str], Dict[str, Any]] = {}
-        for row in rows:
-            # itb_util_core.remove_accents() returns in NORMALIZATION_FORM_INTERNAL.
-            # row[1] (“phrase”) should already be in NORMALIZATION_FORM_INTERNAL
-            # but better convert it again here just to make sure.
-            input_phrase = itb_util_core.remove_accents(row[0].lower())
-            phrase = unicodedata.normalize(
-                itb_util_core.NORMALIZATION_FORM_INTERNAL, row[1])
-            p_phrase = itb_util_core.remove_accents(row[2].lower())
-            pp_phrase = itb_util_core.remove_accents(row[3].lower())
-            database_dict.update([((row[0], row[1], row[2], row[3]),
-                                   {'input_phrase': input_phrase,
-                                    'phrase': phrase,
-                                    'p_phrase': p_phrase,
-                                    'pp_phrase': pp_phrase,
-                                    'user_freq': row[4],
-                                    'timestamp': row[5]}
-                                  )])
-        lines = []
+        ngram_counts: Dict[Tuple[str, str, str, str], int] = {}
+        number_of_ngrams = 0
         try:
-            with _open_text_file(filename) as file_handle:
-                lines = [
-                    unicodedata.normalize(
-                        itb_util_core.NORMALIZATION_FORM_INTERNAL, line)
-                    for line in file_handle]
-        except Exception as error: # pylint: disable=broad-except
-            LOGGER.exception(
-                'Unexpected error reading training data from file: %s: %s',
-                 error.__class__.__name__, error)
-            return False
-        for line in lines:
-            for token in itb_util_core.tokenize(line):
+            for token in tokenize_file(
+                    filename, progress_callback=progress_callback):
                 key = (itb_util_core.remove_accents(token.lower()),
                        token,
                        itb_util_core.remove_accents(p_token.lower()),
                        itb_util_core.remove_accents(pp_token.lower()))
-                if key in database_dict:
-                    database_dict[key]['user_freq'] += 1
-                else:
-                    database_dict[key] = {
-                        'input_phrase': itb_util_core.remove_accents(token.lower()),
-                        'phrase': token,
-                        'p_phrase': itb_util_core.remove_accents(p_token.lower()),
-                        'pp_phrase': itb_util_core.remove_accents(pp_token.lower()),
-                        'user_freq': 1,
-                        'timestamp': time_new}
+                ngram_counts[key] = ngram_counts.get(key, 0) + 1
                 pp_token = p_token
                 p_token = token
-        sqlargs = []
-        for key, value in database_dict.items():
-            sqlargs.append(value)
-        sqlstr = '''
-        INSERT INTO user_db.phrases (input_phrase, phrase, p_phrase, pp_phrase, user_freq, timestamp)
-        VALUES (:input_phrase, :phrase, :p_phrase, :pp_phrase, :user_freq, :timestamp)
-        ;'''
+                if len(ngram_counts) >= TRAINING_CHUNK_NGRAMS:
+                    number_of_ngrams += len(ngram_counts)
+                    self._add_training_ngrams(ngram_counts, time_new)
+                    ngram_counts = {}
+            number_of_ngrams += len(ngram_counts)
+            self._add_training_ngrams(
+                ngram_counts, time_new, filenames=[filename])
+            self.database.execute('PRAGMA wal_checkpoint;')
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error reading training data from file: %s: %s',
+                 error.__class__.__name__, error)
+            return False
+        finally:
+            self.select_cache_clear()
+            self._load_ngram_model()
+        LOGGER.info('%s n-grams read from %s', number_of_ngrams, filename)
+        return True
+
+    def read_training_data_from_files(
+            self,
+            paths: Iterable[str],
+            processes: Optional[int] = None,
+            chunk_bytes: int = TRAINING_CHUNK_BYTES,
+            progress_callback: Optional[Callable[[int, int], None]] = None,
+            only_new: bool = False,
+    ) -> bool:
+        '''
+        Read data to train the prediction from many text files in parallel.
+
+        The files are split into line aligned chunks of about
+        chunk_bytes bytes (gzip compressed files cannot be split and
+        are one chunk each). Tokenizing and counting the n-grams of
+        the chunks is CPU bound and done in a pool of processes. The
+        counts are then added up and written to the database at once.
+        The result is the same as calling read_training_data_from_file()
+        for each file.
+
+        :param paths: Text files (gzip compressed if the name ends
+                      with “.gz”) or directories. Directories are
+                      searched recursively, hidden files are skipped.
+        :param processes: The number of processes to use, if None
+                          the number of CPUs is used. If 1, no extra
+                          processes are started. The extra processes
+                          import the main module of the program,
+                          graphical programs should use 1.
+        :param chunk_bytes: The approximate size of a chunk in bytes
+        :param progress_callback: Called after each chunk with the
+                                  number of bytes read so far and the
+                                  total size of all files
+        :param only_new: If True, skip files which have already been
+                         read and have not changed since. Useful to
+                         feed training data continuously, for example
+                         from a directory of sent mail.
+        :return: True if successful, False on failure
+        '''
+        filenames = _training_filenames(paths)
+        if not filenames:
+            LOGGER.warning('No training data found in %s', paths)
+            return False
+        if only_new:
+            learned_files = self._learned_training_files()
+            filenames = [
+                filename for filename in filenames
+                if learned_files.get(os.path.realpath(filename))
+                != _training_file_signature(filename)]
+            if not filenames:
+                LOGGER.info('No new training data found in %s', paths)
+                return True
+        self.flush_pending_phrases()
+        time_new = self._training_timestamp()
+        if time_new is None:
+            return False
+        start_time = time.monotonic()
         try:
-            self.database.execute('DELETE FROM phrases;')
-            # Without the following commit, the
-            # self.database.executemany() fails with
-            # “OperationalError: database is locked”.
-            self.database.commit()
-            self.database.executemany(sqlstr, sqlargs)
-            self.database.commit()
+            chunks = [chunk
+                      for filename in filenames
+                      for chunk in _training_file_chunks(
+                              filename, chunk_bytes)]
+        except OSError as error:
+            LOGGER.exception(
+                'Error splitting training data into chunks: %s: %s',
+                error.__class__.__name__, error)
+            return False
+        total_bytes = sum(os.path.getsize(filename) for filename in filenames)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, len(chunks)))
+        process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        if processes > 1:
+            try:
+                # Do not “fork”, forking a process which runs threads
+                # (for example the setup tool or the reader and writer
+                # threads of this database) can deadlock the children:
+                mp_context = (
+                    multiprocessing.get_context('forkserver')
+                    if 'forkserver' in multiprocessing.get_all_start_methods()
+                    else multiprocessing.get_context())
+                # Unless forked, the processes import this module to
+                # unpickle _count_training_ngrams(). Its directory
+                # may not be in the sys.path they start with, for
+                # example when running from the source tree:
+                process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=processes, mp_context=mp_context,
+                    initializer=site.addsitedir,
+                    initargs=(os.path.dirname(os.path.abspath(__file__)),))
+            except (OSError, ValueError, RuntimeError) as error:
+                LOGGER.warning(
+                    'Cannot count training data in a process pool: %s: %s',
+                    error.__class__.__name__, error)
+        ngram_counts: Dict[Tuple[str, str, str, str], int] = {}
+        try:
+            bytes_done = 0
+            context = ('', '')
+            for chunk, (counts, head, tail) in zip(
+                    chunks, _count_training_chunks(chunks, process_pool)):
+                (filename, start, end) = chunk
+                if start == 0:
+                    # New file, the context does not continue from the
+                    # previous file:
+                    context = ('', '')
+                for key, count in counts.items():
+                    ngram_counts[key] = ngram_counts.get(key, 0) + count
+                # The first two tokens of a chunk were not counted in
+                # the worker because their context is at the end of
+                # the previous chunk:
+                (p_token, pp_token) = context
+                for token in head:
+                    key = (itb_util_core.remove_accents(token.lower()),
+                           token,
+                           itb_util_core.remove_accents(p_token.lower()),
+                           itb_util_core.remove_accents(pp_token.lower()))
+                    ngram_counts[key] = ngram_counts.get(key, 0) + 1
+                    pp_token = p_token
+                    p_token = token
+                if len(tail) == 2:
+                    (pp_token, p_token) = tail
+                context = (p_token, pp_token)
+                bytes_done += (end if end is not None
+                               else os.path.getsize(filename)) - start
+                if progress_callback is not None:
+                    progress_callback(bytes_done, total_bytes)
+            self._add_training_ngrams(
+                ngram_counts, time_new, filenames=filenames)
             self.database.execute('PRAGMA wal_checkpoint;')
         except Exception as error: # pylint: disable=broad-except
             LOGGER.exception(
-                'Unexpected error writing training data to database: %s: %s',
+                'Unexpected error reading training data from files: %s: %s',
                  error.__class__.__name__, error)
             return False
+        finally:
+            if process_pool is not None:
+                process_pool.shutdown(wait=False)
+            self.select_cache_clear()
+            self._load_ngram_model()
+        duration = time.monotonic() - start_time
+        LOGGER.info(
+            '%s n-grams read from %s files (%s chunks, %s processes) '
+            'in %.3f seconds, %.2f MB/s',
+            len(ngram_counts), len(filenames), len(chunks), processes,
+            duration, total_bytes / 1e6 / max(duration, 1e-9))
         return True
 
+    def _training_timestamp(self) -> Optional[float]:
+        '''Returns the timestamp for n-grams added from training data
+
+        The timestamp is at 20% of the time range of the database,
+        i.e. rather old, so that these n-grams are removed before the
+        phrases learned from the user by cleanup_database().
+
+        :return: The timestamp or None if the database could not be read
+        '''
+        time_min = time_max = time.time()
+        try:
+            (row_time_min, row_time_max) = self.database.execute(
+                'SELECT min(timestamp), max(timestamp) '
+                'FROM user_db.ngrams;').fetchone()
+            if row_time_min is not None and row_time_max is not None:
+                (time_min, time_max) = (row_time_min, row_time_max)
+        except Exception as error: # pylint: disable=broad-except
+            LOGGER.exception(
+                'Unexpected error getting timestamps from database: %s: %s',
+                 error.__class__.__name__, error)
+            return None
+        # timestamp for added entries (timestamp of existing entries is kept):
+        time_new = time_min + 0.20 * (time_max - time_min)
+        LOGGER.info('Minimum timestamp in the database=%s',
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time_min)))
+        LOGGER.info('Maximum timestamp in the database=%s',
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time_max)))
+        LOGGER.info('New timestamp in the database=%s',
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time_new)))
+        return time_new
+
+    def _learned_training_files(self) -> Dict[str, Tuple[int, float]]:
+        '''Returns the files training data has been read from
+
+        :return: A dictionary mapping the real paths of the files
+                 to their (size, mtime) when they were read
+        '''
+        return {
+            filename: (size, mtime)
+            for (filename, size, mtime) in self.database.execute(
+                'SELECT filename, size, mtime '
+                'FROM user_db.training_files;').fetchall()}
+
+    def _add_training_ngrams(
+            self,
+            ngram_counts: Dict[Tuple[str, str, str, str], int],
+            timestamp: float,
+            filenames: Iterable[str] = ()) -> None:
+        '''Add counted n-grams from training data to the database
+
+        :param ngram_counts: The counts of the n-grams, keyed by
+                             (input_phrase, phrase, p_phrase, pp_phrase)
+        :param timestamp: The timestamp for n-grams not yet in the
+                          database, existing ones keep their timestamp
+        :param filenames: The files the n-grams were read from, they
+                          are recorded in the same transaction in the
+                          training_files table
+        '''
+        sqlstr = _ngram_upsert_sql(
+            'DO UPDATE SET user_freq = user_freq + excluded.user_freq')
+        sqlargs = [{'input_phrase': input_phrase,
+                    'phrase': phrase,
+                    'p_phrase': p_phrase,
+                    'pp_phrase': pp_phrase,
+                    'user_freq': user_freq,
+                    'timestamp': timestamp}
+                   for ((input_phrase, phrase, p_phrase, pp_phrase),
+                        user_freq) in ngram_counts.items()]
+        with self.transaction(checkpoint=False):
+            _intern_vocab(self.database, sqlargs)
+            self.database.executemany(sqlstr, sqlargs)
+            self.database.executemany(
+                'INSERT OR REPLACE INTO user_db.training_files '
+                '(filename, size, mtime, timestamp) VALUES (?, ?, ?, ?);',
+                [(os.path.realpath(filename),)
+                 + _training_file_signature(filename) + (time.time(),)
+                 for filename in filenames])
+
     def remove_all_phrases(self) -> bool:
         '''
         Remove all phrases from the database, i.e. delete all the
@@ -1378,9 +3344,16 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
 
         :return: True if successful, False on failure
         '''
+        self._pending_phrases = {}
         try:
             with self.transaction():
-                self.database.execute('DELETE FROM phrases;')
+                self.database.execute('DELETE FROM user_db.ngrams;')
+                self.database.execute('DELETE FROM user_db.vocab;')
+                self.database.execute('DELETE FROM user_db.shortcuts;')
+                self.database.execute('DELETE FROM user_db.training_files;')
+            self.select_cache_clear()
+            if self._ngram_model is not None:
+                self._ngram_model.clear()
             return True
         except sqlite3.Error as error:
             LOGGER.exception(
@@ -1398,6 +3371,7 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
 
         (For debugging)
         '''
+        self.flush_pending_phrases()
         try:
             LOGGER.debug('SELECT * FROM desc;\n')
             for row in self.database.execute("SELECT * FROM desc;").fetchall():
@@ -1416,6 +3390,7 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
 
         (For debugging)
         '''
+        self.flush_pending_phrases()
         try:
             return len(self.database.execute(
                 "SELECT * FROM phrases;").fetchall())
@@ -1444,8 +3419,6 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
             return
         LOGGER.info('Database cleanup starting ...')
         time_now = time.time()
-        # id, input_phrase, phrase, p_phrase, pp_phrase, user_freq, timestamp
-        rows: List[Tuple[int, str, str, str, str, int, float]] = []
         database = None
         try:
             if thread:
@@ -1453,44 +3426,31 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
                 # that same thread.  As the database cleanup is usually
                 # called in a separate thread, get a new connection:
                 database = self.sqlite3_connect_database_legacy(
-                    self.user_db_file)
+                    self.user_db_file, mmap_size=self.mmap_size)
             else:
+                self.flush_pending_phrases()
                 database = self.database
-            rows = database.execute("SELECT * FROM phrases;").fetchall()
-            if not rows:
+            number_of_rows = database.execute(
+                'SELECT count(*) FROM ngrams;').fetchone()[0]
+            if not number_of_rows:
                 return
-            rows = sorted(rows,
-                          key = lambda x: (
-                              x[5], # user_freq
-                              x[6], # timestamp
-                              x[0], # id
-                          ))
-            LOGGER.info('Total number of database rows to check=%s', len(rows))
-            index = len(rows)
-            max_rows = 50000
+            LOGGER.info('Total number of database rows to check=%s',
+                        number_of_rows)
+            max_rows = CLEANUP_MAX_ROWS
+            # 1st pass: If there are more than max_rows rows, delete the
+            # rows with the lowest user_freq and, among these, the oldest
+            # ones. The shortcuts are in a different table and are
+            # never deleted.
             number_delete_above_max = 0
-            rows_kept: List[Tuple[int, str, str, str, str, int, float]] = []
-            for row in rows:
-                user_freq = row[5]
-                if (index > max_rows
-                    and user_freq < itb_util_core.SHORTCUT_USER_FREQ):
-                    LOGGER.info('1st pass: deleting %s %s',
-                                repr(row),
-                                time.strftime("%Y-%m-%d %H:%M:%S",
-                                              time.gmtime(row[6])))
-                    number_delete_above_max += 1
-                    sqlstr_delete = 'DELETE from phrases WHERE id = :id;'
-                    sqlargs_delete = {'id': row[0]}
-                    try:
-                        database.execute(sqlstr_delete, sqlargs_delete)
-                    except Exception as error: # pylint: disable=broad-except
-                        LOGGER.exception(
-                            '1st pass: exception deleting row '
-                            'from database: %s: %s',
-                             error.__class__.__name__, error)
-                else:
-                    rows_kept.append(row)
-                index -= 1
+            if number_of_rows > max_rows:
+                number_delete_above_max = database.execute(
+                    '''
+                    DELETE FROM ngrams WHERE id IN
+                    (SELECT id FROM ngrams
+                     ORDER BY user_freq, timestamp, id
+                     LIMIT :limit)
+                    ;''',
+                    {'limit': number_of_rows - max_rows}).rowcount
             LOGGER.info('1st pass: Number of rows deleted above maximum size=%s',
                         number_delete_above_max)
             # As the first pass above removes rows sorted by count and
@@ -1507,79 +3467,94 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
             #
             # 0.1% is really not much but I want to be careful not to remove
             # too much when trying this out.
-            #
-            # sort kept rows by timestamp only instead of user_freq and timestamp:
-            rows_kept = sorted(rows_kept,
-                               key = lambda x: (
-                                   x[6], # timestamp
-                                   x[0], # id
-                               ))
-            index = len(rows_kept)
-            LOGGER.info('1st pass: Number of rows kept=%s', index)
+            number_of_rows_kept = number_of_rows - number_delete_above_max
+            LOGGER.info('1st pass: Number of rows kept=%s', number_of_rows_kept)
             index_decay = int(max_rows * 0.999)
             LOGGER.info('2nd pass: Index for decay=%s', index_decay)
             number_of_rows_to_decay = 0
             number_of_rows_to_delete = 0
-            for row in rows_kept:
-                user_freq = row[5]
-                if (index > index_decay
-                    and user_freq < itb_util_core.SHORTCUT_USER_FREQ):
-                    if user_freq == 1:
-                        LOGGER.info('2nd pass: deleting %s %s',
-                                    repr(row),
-                                    time.strftime("%Y-%m-%d %H:%M:%S",
-                                                  time.gmtime(row[6])))
-                        number_of_rows_to_delete += 1
-                        sqlstr_delete = 'DELETE from phrases WHERE id = :id;'
-                        sqlargs_delete = {'id': row[0]}
-                        try:
-                            database.execute(sqlstr_delete, sqlargs_delete)
-                        except Exception as error: # pylint: disable=broad-except
-                            LOGGER.exception(
-                                '2nd pass: exception deleting row '
-                                'from database: %s: %s',
-                                 error.__class__.__name__, error)
-                    else:
-                        LOGGER.info('2nd pass: decaying %s %s',
-                                    repr(row),
-                                    time.strftime("%Y-%m-%d %H:%M:%S",
-                                                  time.gmtime(row[6])))
-                        number_of_rows_to_decay += 1
-                        sqlstr_update = '''
-                        UPDATE phrases
-                        SET user_freq = :user_freq, timestamp = :timestamp
-                        WHERE id = :id
-                        ;'''
-                        sqlargs_update = {'id': row[0],
-                                          'user_freq': int(user_freq/2),
-                                          'timestamp': time.time()}
-
-                        try:
-                            database.execute(sqlstr_update, sqlargs_update)
-                        except Exception as error: # pylint: disable=broad-except
-                            LOGGER.exception(
-                                '2nd pass: exception decaying row '
-                                'from database: %s: %s',
-                                 error.__class__.__name__, error)
-                index -= 1
+            if number_of_rows_kept > index_decay:
+                # The newest of the oldest rows to check:
+                (last_timestamp, last_id) = database.execute(
+                    'SELECT timestamp, id FROM ngrams '
+                    'ORDER BY timestamp, id LIMIT 1 OFFSET :offset;',
+                    {'offset': number_of_rows_kept - index_decay - 1}
+                ).fetchone()
+                sqlargs = {
+                    'last_timestamp': last_timestamp,
+                    'last_id': last_id,
+                    'timestamp': time.time()}
+                oldest_rows_condition = '''
+                    (timestamp < :last_timestamp
+                     OR (timestamp = :last_timestamp AND id <= :last_id))
+                    '''
+                number_of_rows_to_delete = database.execute(
+                    f'DELETE FROM ngrams WHERE user_freq = 1 '
+                    f'AND {oldest_rows_condition};',
+                    sqlargs).rowcount
+                number_of_rows_to_decay = database.execute(
+                    f'UPDATE ngrams SET '
+                    f'user_freq = CAST(user_freq / 2 AS INTEGER), '
+                    f'timestamp = :timestamp '
+                    f'WHERE {oldest_rows_condition};',
+                    sqlargs).rowcount
+            # Remove the texts not used by any n-gram anymore, for
+            # example the texts of rows removed by remove_phrase().
+            # A single NULL in the subquery would make “NOT IN” never
+            # true and nothing would be deleted:
+            number_of_texts_to_delete = database.execute(
+                'DELETE FROM vocab WHERE id NOT IN '
+                '(SELECT phrase_id FROM ngrams '
+                'WHERE phrase_id IS NOT NULL '
+                'UNION SELECT p_phrase_id FROM ngrams '
+                'WHERE p_phrase_id IS NOT NULL '
+                'UNION SELECT pp_phrase_id FROM ngrams '
+                'WHERE pp_phrase_id IS NOT NULL);').rowcount
+            LOGGER.info('Number of texts deleted from vocab=%s',
+                        number_of_texts_to_delete)
             LOGGER.info('Commit database and execute checkpoint ...')
             database.commit()
-            database.execute('PRAGMA wal_checkpoint;')
-            LOGGER.info('Rebuild database using VACUUM command ...')
-            database.execute('VACUUM;')
+            self._wal_checkpoint(database)
+            # Rebuilding the database is expensive, do it only when
+            # a lot of pages are unused:
+            freelist_count = database.execute(
+                'PRAGMA freelist_count;').fetchone()[0]
+            page_count = database.execute(
+                'PRAGMA page_count;').fetchone()[0]
+            LOGGER.info('Free pages=%s, total pages=%s',
+                        freelist_count, page_count)
+            if page_count and freelist_count / page_count > VACUUM_FREELIST_RATIO:
+                LOGGER.info('Rebuild database using VACUUM command ...')
+                database.execute('VACUUM;')
             LOGGER.info('Number of database rows deleted=%s',
                          number_delete_above_max + number_of_rows_to_delete)
             LOGGER.info('Number of database rows decayed=%s',
                         number_of_rows_to_decay)
-            LOGGER.info('Number of rows before cleanup=%s', len(rows))
+            LOGGER.info('Number of rows before cleanup=%s', number_of_rows)
             LOGGER.info('Number of rows remaining=%s',
-                        len(rows_kept) - number_of_rows_to_delete)
+                        number_of_rows_kept - number_of_rows_to_delete)
             LOGGER.info('Time for database cleanup=%s seconds',
                         time.time() - time_now)
             LOGGER.info('Database cleanup finished.')
+            self._record_query(
+                'cleanup_database', time.time() - time_now, number_of_rows)
+            if thread:
+                # The n-gram model can only be reloaded using the
+                # database connection of the main thread and the
+                # cache may be in use by the main thread:
+                self._ngram_model_stale = True
+                self._select_cache_stale = True
+            else:
+                self.select_cache_clear()
+                self._load_ngram_model()
         except Exception as error: # pylint: disable=broad-except
             LOGGER.exception('Exception when accessing database: %s: %s',
                               error.__class__.__name__, error)
+            if database:
+                try:
+                    database.rollback()
+                except sqlite3.Error as rollback_error:
+                    LOGGER.warning('Failed to roll back: %s', rollback_error)
             return
         finally:
             if thread and database:
@@ -1591,3 +3566,207 @@ CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT, phrase TEXT, p_
             elif not thread:
                 LOGGER.debug(
                     'Reused main thread database connection (not closing)')
+
+BENCHMARK = True
+
+def _create_benchmark_database(
+        user_db_file: str,
+        number_of_rows: int,
+        random_generator: Any) -> Dict[Tuple[str, str, str, str], int]:
+    '''Create a user database of random n-grams for benchmarks
+
+    The rows are random words similar to the rows written when
+    learning from user input.
+
+    :param user_db_file: The database file to create
+    :param number_of_rows: The number of rows in the user database
+    :param random_generator: A random.Random() object
+    :return: The user frequencies of the rows by (input_phrase,
+             phrase, p_phrase, pp_phrase)
+    '''
+    vocabulary = sorted({
+        ''.join(random_generator.choices(
+            'abcdefghijklmnopqrstuvwxyzäöü', k=random_generator.randint(2, 12)))
+        for _ in range(number_of_rows // 5)})
+    random_generator.shuffle(vocabulary)
+    # Zipf distribution, the first words of the vocabulary are the
+    # most frequent ones:
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    rows: Dict[Tuple[str, str, str, str], int] = {}
+    while len(rows) < number_of_rows:
+        (phrase, p_phrase, pp_phrase) = random_generator.choices(
+            vocabulary, weights=weights, k=3)
+        input_phrase = phrase[:random_generator.randint(1, len(phrase))]
+        key = (input_phrase, phrase, p_phrase, pp_phrase)
+        rows[key] = rows.get(key, 0) + 1
+    database = TabSqliteDb(user_db_file=user_db_file)
+    sqlargs = [{'input_phrase': input_phrase,
+                'phrase': phrase,
+                'p_phrase': p_phrase,
+                'pp_phrase': pp_phrase,
+                'user_freq': user_freq,
+                'timestamp': time.time()}
+               for ((input_phrase, phrase, p_phrase, pp_phrase),
+                    user_freq) in rows.items()]
+    with database.transaction():
+        _intern_vocab(database.database, sqlargs)
+        database.database.executemany(
+            _ngram_upsert_sql('DO NOTHING'), sqlargs)
+    database.database.close()
+    return rows
+
+def benchmark_select_words(
+        number_of_rows: int = 50_000,
+        number_of_words: int = 20,
+        repeat: int = 10,
+        ngram_model: bool = False) -> None:
+    '''Benchmark select_words() with a user database of random n-grams
+
+    Creates a temporary user database with number_of_rows rows of
+    random words similar to the rows written when learning from user
+    input. Then types some words from the database character by
+    character and logs the time select_words() needs per keystroke.
+    No dictionaries are used to measure only the database queries.
+
+    :param number_of_rows: The number of rows in the user database
+    :param number_of_words: The number of words to type
+    :param repeat: How often to type each word
+    :param ngram_model: Whether to use the in-memory n-gram model
+    '''
+    # pylint: disable=import-outside-toplevel
+    import random
+    import tempfile
+    import statistics
+    # pylint: enable=import-outside-toplevel
+    random_generator = random.Random(4711)
+    with tempfile.TemporaryDirectory() as tempdir:
+        user_db_file = os.path.join(tempdir, 'user.db')
+        rows = _create_benchmark_database(
+            user_db_file, number_of_rows, random_generator)
+        database = TabSqliteDb(
+            user_db_file=user_db_file, ngram_model=ngram_model)
+        typed_words = random_generator.sample(
+            [key for key in rows if key[0] == key[1]], number_of_words)
+        times = []
+        for _ in range(repeat):
+            # Measure the lookups, not the cache:
+            database.select_cache_clear()
+            for (_input_phrase, phrase, p_phrase, pp_phrase) in typed_words:
+                for length in range(1, len(phrase) + 1):
+                    start_time = time.perf_counter()
+                    database.select_words(
+                        phrase[:length], p_phrase=p_phrase, pp_phrase=pp_phrase)
+                    times.append(time.perf_counter() - start_time)
+        database.database.close()
+    LOGGER.info(
+        'select_words() with %s rows, ngram_model=%s: %s keystrokes, '
+        'mean %.1f µs, median %.1f µs, maximum %.1f µs per keystroke',
+        number_of_rows, ngram_model, len(times),
+        statistics.mean(times) * 1e6, statistics.median(times) * 1e6,
+        max(times) * 1e6)
+
+def benchmark_first_keystroke(
+        number_of_rows: int = 50_000,
+        number_of_words: int = 20,
+        directory: Optional[str] = None) -> None:
+    '''Benchmark the first keystrokes after a start with a cold page cache
+
+    Creates a temporary user database with number_of_rows rows of
+    random n-grams. Then, for each word to type, the database file
+    is dropped from the page cache of the operating system, the
+    database is opened like after a restart and the time
+    select_words() needs for the first keystroke and for the
+    complete word is logged. This is done without memory-mapped I/O,
+    with memory-mapped I/O and with memory-mapped I/O after
+    prewarm_database().
+
+    Dropping a file from the page cache needs os.posix_fadvise()
+    and does not work on all file systems, for example not on tmpfs.
+
+    :param number_of_rows: The number of rows in the user database
+    :param number_of_words: The number of words to type
+    :param directory: The directory for the temporary database, if
+                      None the default temporary directory is used
+    '''
+    # pylint: disable=import-outside-toplevel
+    import random
+    import tempfile
+    import statistics
+    # pylint: enable=import-outside-toplevel
+    if not hasattr(os, 'posix_fadvise'):
+        LOGGER.info('Cannot drop files from the page cache, skipping.')
+        return
+    random_generator = random.Random(4711)
+    with tempfile.TemporaryDirectory(dir=directory) as tempdir:
+        user_db_file = os.path.join(tempdir, 'user.db')
+        rows = _create_benchmark_database(
+            user_db_file, number_of_rows, random_generator)
+        typed_words = random_generator.sample(
+            [key for key in rows if key[0] == key[1]], number_of_words)
+        for (mmap_size, prewarm) in ((0, False),
+                                     (MMAP_SIZE, False),
+                                     (MMAP_SIZE, True)):
+            first_times = []
+            word_times = []
+            for (_input_phrase, phrase, p_phrase, pp_phrase) in typed_words:
+                with open(user_db_file, 'rb') as user_db:
+                    os.fsync(user_db.fileno())
+                    os.posix_fadvise(
+                        user_db.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                database = TabSqliteDb(user_db_file=user_db_file)
+                database.set_mmap_size(mmap_size)
+                if prewarm:
+                    # Assume the first key is typed after prewarming
+                    # in the reader thread has finished:
+                    database.set_use_threads(True)
+                    database.prewarm_database()
+                    database.set_use_threads(False)
+                start_time = time.perf_counter()
+                for length in range(1, len(phrase) + 1):
+                    database.select_words(
+                        phrase[:length], p_phrase=p_phrase, pp_phrase=pp_phrase)
+                    if length == 1:
+                        first_times.append(time.perf_counter() - start_time)
+                word_times.append(time.perf_counter() - start_time)
+                database.database.close()
+            LOGGER.info(
+                'First keystroke with a cold page cache, %s rows, '
+                'mmap_size=%s, prewarm=%s: '
+                'median %.1f µs, maximum %.1f µs, '
+                'median %.1f µs for the first word',
+                number_of_rows, mmap_size, prewarm,
+                statistics.median(first_times) * 1e6, max(first_times) * 1e6,
+                statistics.median(word_times) * 1e6)
+
+def main() -> None:
+    '''
+    Used for testing and profiling.
+
+    “python3 tabsqlitedb.py”
+
+    runs some tests and prints profiling data.
+    '''
+    log_handler = logging.StreamHandler(stream=sys.stderr)
+    log_formatter = logging.Formatter(
+        '%(asctime)s %(filename)s '
+        'line %(lineno)d %(funcName)s %(levelname)s: '
+        '%(message)s')
+    log_handler.setFormatter(log_formatter)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.addHandler(log_handler)
+
+    import doctest # pylint: disable=import-outside-toplevel
+    (failed, _attempted) = doctest.testmod()
+
+    if BENCHMARK:
+        for ngram_model in (False, True):
+            benchmark_select_words(
+                number_of_rows=50_000, ngram_model=ngram_model)
+            benchmark_select_words(
+                number_of_rows=500_000, ngram_model=ngram_model)
+        benchmark_first_keystroke(number_of_rows=500_000)
+
+    sys.exit(failed)
+
+if __name__ == "__main__":
+    main()
@@ -26,11 +26,13 @@ from typing import Tuple
 from typing import Dict
 from typing import Any
 import os
+import sys
 import time
 import sqlite3
 import argparse
 
 import itb_util_core
+import tabsqlitedb
 
 def parse_args() -> Any:
     '''
@@ -133,6 +135,24 @@ def parse_args() -> Any:
         help=('Show information about which rows would be decayed or deleted. '
               '(Just shows information, doesn’t change the database!) '
               'default: %(default)s'))
+    parser.add_argument(
+        '-q', '--query-stats',
+        dest='query_stats',
+        action='store_true',
+        default=False,
+        help=('Show the percentiles of the latencies of the database '
+              'operations recorded by Typing Booster when the environment '
+              f'variable {tabsqlitedb.QUERY_STATS_ENVIRONMENT_VARIABLE} '
+              'is set, instead of inspecting the database. '
+              'default: %(default)s'))
+    parser.add_argument(
+        '--query-stats-file',
+        dest='query_stats_file',
+        type=str,
+        action='store',
+        default='~/.local/share/ibus-typing-booster/query-stats.json',
+        help=('Full path of the file with the recorded latencies, '
+              'default: "%(default)s"'))
     return parser.parse_args()
 
 _ARGS = parse_args()
@@ -395,7 +415,35 @@ class DbContents:
                                          x[0], # id
                                      ))
 
+def print_query_stats(query_stats_file: str) -> bool:
+    '''Print the percentiles of the recorded latencies
+
+    :param query_stats_file: The file written by Typing Booster
+    :return: True if successful, False on failure
+    '''
+    query_stats = tabsqlitedb.QueryStats()
+    if not query_stats.load(os.path.expanduser(query_stats_file)):
+        return False
+    for label, operations in sorted(query_stats.get().items()):
+        print(f'Version {label}: latencies in milliseconds')
+        print(f'{"operation":36} {"calls":>8} {"rows/call":>9} '
+              f'{"mean":>9} {"p50":>9} {"p90":>9} {"p99":>9} {"max":>9}')
+        for operation, stats in sorted(operations.items()):
+            count = stats['count']
+            if not count:
+                continue
+            print(f'{operation:36} {count:8} '
+                  f'{stats["rows"] / count:9.1f} '
+                  f'{1000 * stats["seconds"] / count:9.3f} '
+                  f'{1000 * tabsqlitedb.QueryStats.percentile(stats, 50):9.3f} '
+                  f'{1000 * tabsqlitedb.QueryStats.percentile(stats, 90):9.3f} '
+                  f'{1000 * tabsqlitedb.QueryStats.percentile(stats, 99):9.3f} '
+                  f'{1000 * stats["max_seconds"]:9.3f}')
+    return True
+
 if __name__ == '__main__':
+    if _ARGS.query_stats:
+        sys.exit(0 if print_query_stats(_ARGS.query_stats_file) else 1)
     dbcontents = DbContents(user_db_file=_ARGS.file,
                             verbose=_ARGS.verbose,
                             max_rows=_ARGS.max_rows)
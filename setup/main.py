@@ -1107,6 +1107,23 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         options_grid.attach(
             self._min_char_complete_adjustment, 1, _options_grid_row, 1, 1)
 
+        self._compact_dictionaries_checkbutton = Gtk.CheckButton(
+            # Translators: Whether to store the words of the
+            # dictionaries in a compact way to save memory
+            label=_('Store dictionaries compactly'))
+        self._compact_dictionaries_checkbutton.set_tooltip_text(
+            _('Store the words of the dictionaries in compact buffers. '
+              'This needs much less memory for big dictionaries but '
+              'the completions are a bit slower.'))
+        self._compact_dictionaries_checkbutton.connect(
+            'toggled', self._on_compact_dictionaries_checkbutton)
+        self._compact_dictionaries_checkbutton.set_active(
+            self._settings_dict['compactdictionaries']['user'])
+        _options_grid_row += 1
+        options_grid.attach(
+            self._compact_dictionaries_checkbutton,
+            0, _options_grid_row, 2, 1)
+
         self._error_sound_checkbutton = Gtk.CheckButton(
             # Translators: A checkbox where one can choose whether a
             # sound is played on error
@@ -1273,6 +1290,21 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         self._dictionaries_default_button.connect(
             'clicked', self._on_dictionaries_default_button_clicked)
         self._dictionaries_default_button.set_sensitive(True)
+        self._dictionaries_correction_index_checkbutton = Gtk.CheckButton(
+            # Translators: A checkbox to choose whether the selected
+            # dictionary uses a precomputed index to find spelling
+            # corrections faster
+            label=_('Fast spelling corrections'))
+        self._dictionaries_correction_index_checkbutton.set_tooltip_text(
+            # Translators: Tooltip for the checkbox
+            # “Fast spelling corrections”
+            _('Use a precomputed index to find spelling corrections '
+              'for the selected dictionary very fast. Building the index '
+              'takes some time and memory when the dictionary is used '
+              'for the first time, afterwards it is cached on disk.'))
+        self._dictionaries_correction_index_checkbutton.connect(
+            'toggled', self._on_dictionaries_correction_index_checkbutton)
+        self._dictionaries_correction_index_checkbutton.set_sensitive(False)
         add_child(dictionaries_action_area, self._dictionaries_add_button)
         add_child(dictionaries_action_area, self._dictionaries_remove_button)
         add_child(dictionaries_action_area, self._dictionaries_up_button)
@@ -1280,6 +1312,8 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         add_child(dictionaries_action_area, self._dictionaries_install_missing_button)
         add_child(dictionaries_action_area, self._dictionaries_download_button)
         add_child(dictionaries_action_area, self._dictionaries_default_button)
+        add_child(dictionaries_action_area,
+                  self._dictionaries_correction_index_checkbutton)
         self._dictionaries_listbox_selected_dictionary_name = ''
         self._dictionaries_listbox_selected_dictionary_index = -1
         self._dictionary_names: List[str] = []
@@ -1797,6 +1831,44 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             self._candidates_delay_milliseconds_adjustment,
             1, _appearance_grid_row, 1, 1)
 
+        spellcheck_suggest_deadline_milliseconds_label = Gtk.Label()
+        spellcheck_suggest_deadline_milliseconds_label.set_text(
+            # Translators: Here one can choose how many milliseconds
+            # to wait for spelling suggestions before the candidates
+            # are displayed without them
+            _('Spelling suggestions deadline in milliseconds:'))
+        spellcheck_suggest_deadline_milliseconds_label.set_tooltip_text(
+            # Translators: A tooltip explaining the meaning of the
+            # “Spelling suggestions deadline in milliseconds:” option.
+            _('How long to wait for spelling suggestions before the '
+              'candidates are displayed without them. Spelling '
+              'suggestions which are ready later are added to the '
+              'candidates when they arrive.'))
+        spellcheck_suggest_deadline_milliseconds_label.set_xalign(0)
+        self._spellcheck_suggest_deadline_milliseconds_adjustment = (
+            Gtk.SpinButton())
+        self._spellcheck_suggest_deadline_milliseconds_adjustment.set_visible(
+            True)
+        self._spellcheck_suggest_deadline_milliseconds_adjustment.set_can_focus(
+            True)
+        self._spellcheck_suggest_deadline_milliseconds_adjustment.set_increments(
+            10.0, 100.0)
+        self._spellcheck_suggest_deadline_milliseconds_adjustment.set_range(
+            0.0, float(itb_util_core.UINT32_MAX))
+        self._spellcheck_suggest_deadline_milliseconds_adjustment.set_value(
+            int(self._settings_dict[
+                'spellchecksuggestdeadlinemilliseconds']['user']))
+        self._spellcheck_suggest_deadline_milliseconds_adjustment.connect(
+            'value-changed',
+            self._on_spellcheck_suggest_deadline_milliseconds_adjustment_value_changed)
+        _appearance_grid_row += 1
+        appearance_grid.attach(
+            spellcheck_suggest_deadline_milliseconds_label,
+            0, _appearance_grid_row, 1, 1)
+        appearance_grid.attach(
+            self._spellcheck_suggest_deadline_milliseconds_adjustment,
+            1, _appearance_grid_row, 1, 1)
+
         preedit_underline_label = Gtk.Label()
         preedit_underline_label.set_text(
             # Translators: A combobox to choose the style of
@@ -2765,6 +2837,8 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             'pagesize': self.set_page_size,
             'candidatesdelaymilliseconds':
             self.set_candidates_delay_milliseconds,
+            'spellchecksuggestdeadlinemilliseconds':
+            self.set_spellcheck_suggest_deadline_milliseconds,
             'lookuptableorientation': self.set_lookup_table_orientation,
             'preeditunderline': self.set_preedit_underline,
             'preeditstyleonlywhenlookup':
@@ -2813,6 +2887,9 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             'inputmodefalsesymbol': self.set_input_mode_false_symbol,
             'inputmethod': self.set_current_imes,
             'dictionary': self.set_dictionary_names,
+            'correctionindexdictionaries':
+            self.set_correction_index_dictionaries,
+            'compactdictionaries': self.set_compact_dictionaries,
             'keybindings': self.set_keybindings,
             'dictionaryinstalltimestamp': self.__class__.reload_dictionaries,
             'inputmethodchangetimestamp': self.__class__.reload_input_methods,
@@ -2978,6 +3055,12 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
                 row_item += '❌'
                 missing_dictionary = True
         row += itb_util_core.bidi_embed(row_item)
+        if name in self._get_correction_index_dictionaries():
+            # Translators: Shown in the list of dictionaries if the
+            # dictionary uses a precomputed index to find spelling
+            # corrections faster
+            row_item = ' ' + _('Fast spelling corrections') + ' ✔️'
+            row += itb_util_core.bidi_embed(row_item)
         row_item = ' ' + _('Emoji') + ' '
         cldr_path = itb_emoji.find_cldr_annotation_path(name)
         if cldr_path:
@@ -3007,6 +3090,7 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         add_child(self._dictionaries_scroll, self._dictionaries_listbox)
         self._dictionaries_listbox_selected_dictionary_name = ''
         self._dictionaries_listbox_selected_dictionary_index = -1
+        self._dictionaries_correction_index_checkbutton.set_sensitive(False)
         self._dictionaries_listbox.set_visible(True)
         self._dictionaries_listbox.set_vexpand(True)
         self._dictionaries_listbox.set_selection_mode(Gtk.SelectionMode.SINGLE)
@@ -3755,6 +3839,15 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         self.set_ascii_digits(
             widget.get_active(), update_gsettings=True)
 
+    def _on_compact_dictionaries_checkbutton(
+            self, widget: Gtk.CheckButton) -> None:
+        '''
+        The checkbutton whether to store the words of the
+        dictionaries compactly has been clicked.
+        '''
+        self.set_compact_dictionaries(
+            widget.get_active(), update_gsettings=True)
+
     def _on_show_final_form_checkbutton(
             self, widget: Gtk.CheckButton) -> None:
         '''
@@ -3857,6 +3950,15 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             self._candidates_delay_milliseconds_adjustment.get_value(),
             update_gsettings=True)
 
+    def _on_spellcheck_suggest_deadline_milliseconds_adjustment_value_changed(
+            self, _widget: Gtk.SpinButton) -> None:
+        '''
+        The deadline for spelling suggestions has been changed.
+        '''
+        self.set_spellcheck_suggest_deadline_milliseconds(
+            self._spellcheck_suggest_deadline_milliseconds_adjustment.get_value(),
+            update_gsettings=True)
+
     def _on_lookup_table_orientation_combobox_changed(
             self, widget: Gtk.ComboBox) -> None:
         '''
@@ -4251,6 +4353,24 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             return
         self.set_dictionary_names(self._settings_dict['dictionary']['default'])
 
+    def _on_dictionaries_correction_index_checkbutton(
+            self, widget: Gtk.CheckButton) -> None:
+        '''
+        The checkbutton whether the selected dictionary uses a
+        correction index has been clicked.
+        '''
+        name = self._dictionaries_listbox_selected_dictionary_name
+        if not name:
+            return
+        dictionary_names = [
+            dictionary_name for dictionary_name
+            in self._get_correction_index_dictionaries()
+            if dictionary_name != name]
+        if widget.get_active():
+            dictionary_names.append(name)
+        self.set_correction_index_dictionaries(
+            dictionary_names, update_gsettings=True)
+
     def _on_dictionary_selected(
             self, _listbox: Gtk.ListBox, listbox_row: Gtk.ListBoxRow) -> None:
         '''
@@ -4268,6 +4388,11 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             self._dictionaries_up_button.set_sensitive(index > 0)
             self._dictionaries_down_button.set_sensitive(
                 index < len(self._dictionary_names) - 1)
+            self._dictionaries_correction_index_checkbutton.set_active(
+                self._dictionary_names[index]
+                in self._get_correction_index_dictionaries())
+            self._dictionaries_correction_index_checkbutton.set_sensitive(
+                True)
         else:
             # all rows have been unselected
             self._dictionaries_listbox_selected_dictionary_name = ''
@@ -4275,6 +4400,8 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             self._dictionaries_remove_button.set_sensitive(False)
             self._dictionaries_up_button.set_sensitive(False)
             self._dictionaries_down_button.set_sensitive(False)
+            self._dictionaries_correction_index_checkbutton.set_sensitive(
+                False)
 
     def _on_input_method_to_add_selected(
             self, _listbox: Gtk.ListBox, listbox_row: Gtk.ListBoxRow) -> None:
@@ -5593,7 +5720,9 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         filename = choose_file_open(parent=self, title=_('Open File ...'))
         LOGGER.info('filename=%r', filename)
         if filename and os.path.isfile(filename):
-            if self.tabsqlitedb.read_training_data_from_file(filename):
+            # No extra processes, they would import this module again:
+            if self.tabsqlitedb.read_training_data_from_files(
+                    [filename], processes=1):
                 MessageDialogCompat(
                     parent=self,
                     message=(_('Learned successfully from file %(filename)s.')
@@ -5747,6 +5876,31 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
         else:
             self._ascii_digits_checkbutton.set_active(mode)
 
+    def set_compact_dictionaries(
+            self,
+            mode: Union[bool, Any],
+            update_gsettings: bool = True) -> None:
+        '''Sets whether to store the words of the dictionaries compactly
+
+        :param mode: Whether to store the words of the dictionaries
+                     compactly
+        :param update_gsettings: Whether to write the change to Gsettings.
+                                 Set this to False if this method is
+                                 called because the Gsettings key changed
+                                 to avoid endless loops when the Gsettings
+                                 key is changed twice in a short time.
+        '''
+        LOGGER.info(
+            '(%s, update_gsettings = %s)', mode, update_gsettings)
+        mode = bool(mode)
+        self._settings_dict['compactdictionaries']['user'] = mode
+        if update_gsettings:
+            self._gsettings.set_value(
+                'compactdictionaries',
+                GLib.Variant.new_boolean(mode))
+        else:
+            self._compact_dictionaries_checkbutton.set_active(mode)
+
     def set_show_final_form(
             self,
             mode: Union[bool, Any],
@@ -6939,6 +7093,34 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
                 self._candidates_delay_milliseconds_adjustment.set_value(
                     int(milliseconds))
 
+    def set_spellcheck_suggest_deadline_milliseconds(
+            self,
+            milliseconds: Union[int, Any],
+            update_gsettings: bool = True) -> None:
+        '''Sets how long to wait for spelling suggestions in milliseconds
+
+        :param milliseconds: How long to wait for spelling suggestions
+                             0 <= milliseconds <= itb_util_core.UINT32_MAX
+        :param update_gsettings: Whether to write the change to Gsettings.
+                                 Set this to False if this method is
+                                 called because the Gsettings key changed
+                                 to avoid endless loops when the Gsettings
+                                 key is changed twice in a short time.
+        '''
+        LOGGER.info(
+            '(%s, update_gsettings = %s)', milliseconds, update_gsettings)
+        milliseconds = int(milliseconds)
+        if 0 <= milliseconds <= itb_util_core.UINT32_MAX:
+            self._settings_dict[
+                'spellchecksuggestdeadlinemilliseconds']['user'] = milliseconds
+            if update_gsettings:
+                self._gsettings.set_value(
+                    'spellchecksuggestdeadlinemilliseconds',
+                    GLib.Variant.new_uint32(milliseconds))
+            else:
+                self._spellcheck_suggest_deadline_milliseconds_adjustment.set_value(
+                    int(milliseconds))
+
     def set_lookup_table_orientation(
             self,
             orientation: Union[int, Any],
@@ -7483,6 +7665,52 @@ class SetupUI(Gtk.Window):  # type: ignore[misc]
             self._dictionaries_up_button.set_sensitive(False)
             self._dictionaries_down_button.set_sensitive(False)
 
+    def _get_correction_index_dictionaries(self) -> List[str]:
+        '''Returns the names of the dictionaries using a correction index'''
+        return [
+            name.strip() for name in self._settings_dict[
+                'correctionindexdictionaries']['user'].split(',')
+            if name.strip()]
+
+    def set_correction_index_dictionaries(
+            self,
+            dictionary_names: Union[str, List[str], Any],
+            update_gsettings: bool = True) -> None:
+        '''Set the names of the dictionaries which use a correction index
+
+        :param dictionary_names: List of names of dictionaries which
+                                 use a precomputed index to find spelling
+                                 corrections fast. If a single string is
+                                 used, it should contain the names of
+                                 the dictionaries separated by commas.
+        :param update_gsettings: Whether to write the change to Gsettings.
+                                 Set this to False if this method is
+                                 called because the Gsettings key changed
+                                 to avoid endless loops when the Gsettings
+                                 key is changed twice in a short time.
+        '''
+        LOGGER.info(
+            '(%s, update_gsettings = %s)', dictionary_names, update_gsettings)
+        if isinstance(dictionary_names, str):
+            dictionary_names = [
+                name.strip() for name in dictionary_names.split(',')
+                if name.strip()]
+        if dictionary_names == self._get_correction_index_dictionaries():
+            return
+        self._settings_dict['correctionindexdictionaries']['user'] = (
+            ','.join(dictionary_names))
+        # Show the change in the list of dictionaries and keep the
+        # selected dictionary selected:
+        index = self._dictionaries_listbox_selected_dictionary_index
+        self._fill_dictionaries_listbox()
+        if 0 <= index < len(self._dictionary_names):
+            self._dictionaries_listbox.select_row(
+                self._dictionaries_listbox.get_row_at_index(index))
+        if update_gsettings:
+            self._gsettings.set_value(
+                'correctionindexdictionaries',
+                GLib.Variant.new_string(','.join(dictionary_names)))
+
     def set_autosettings(
             self,
             autosettings: Union[List[Tuple[str, str, str]], Any],
@@ -22,9 +22,12 @@ This file implements test cases for suggestions from hunspell dictionaries
 '''
 
 from typing import Optional
+from typing import List
 import sys
 import os
+import time
 import tempfile
+import threading
 import importlib.util
 import unittest
 
@@ -78,9 +81,18 @@ class HunspellSuggestTestCase(unittest.TestCase):
 
     def setUp(self) -> None:
         self.maxDiff = None
+        # Do not write the word list and correction index caches
+        # into the real ~/.cache/ibus-typing-booster:
+        self._cache_tempdir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self._orig_xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self._cache_tempdir.name
 
     def tearDown(self) -> None:
-        pass
+        if self._orig_xdg_cache_home is not None:
+            os.environ['XDG_CACHE_HOME'] = self._orig_xdg_cache_home
+        else:
+            _value = os.environ.pop('XDG_CACHE_HOME', None)
+        self._cache_tempdir.cleanup()
 
     def test_dummy(self) -> None:
         self.assertEqual(True, True)
@@ -259,6 +271,290 @@ class HunspellSuggestTestCase(unittest.TestCase):
              ('kissajuttu', 0),
              ('kissamaiseksi',0)])
 
+    def test_fi_FI_prefix_index(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        d = hunspell_suggest.Dictionary('fi_FI')
+        keep = itb_util_core.ACCENT_LANGUAGES['fi']
+        for prefix in ('k', 'kissa', 'Kissa', 'pää', 'paa', 'ö', 'A-', 'xyzzy', ''):
+            query = itb_util_core.remove_accents(prefix, keep=keep).casefold()
+            self.assertEqual(
+                sorted(d.completions(query)),
+                sorted(word for word, stripped in d.word_pairs
+                       if stripped.casefold().startswith(query)))
+
+    def test_fi_FI_incremental_completions(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        d = hunspell_suggest.Dictionary('fi_FI')
+        # Type, then backspace, then type something different:
+        for query in ('k', 'ki', 'kis', 'kiss', 'kissa', 'kiss', 'kisa',
+                      'k', 'ka', '', 'ö', 'öl'):
+            self.assertEqual(
+                [word for word, _frequency
+                 in h._completions(d, query)], # pylint: disable=protected-access
+                d.completions(query))
+
+    def test_fi_FI_word_frequencies(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        d = hunspell_suggest.Dictionary('fi_FI')
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        self.assertFalse(d.has_word_frequencies())
+        xdg_data_home = os.environ.get('XDG_DATA_HOME')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ['XDG_DATA_HOME'] = tmpdir
+            datadir = os.path.join(tmpdir, 'ibus-typing-booster', 'data')
+            os.makedirs(datadir, exist_ok=True)
+            with open(os.path.join(datadir, 'fi_FI.freq'),
+                      'w', encoding='UTF-8') as frequency_file:
+                frequency_file.write(
+                    '# word count\n'
+                    'kissa 100\n'
+                    'kissoja 70\n'
+                    'KISSASSA 50\n'
+                    'kissoja 20\n'
+                    'koira 1000\n')
+            try:
+                d.load_dictionary()
+                self.assertTrue(d.has_word_frequencies())
+                self.assertTrue(h.has_word_frequencies())
+                (start, end) = d.prefix_range('kiss')
+                ranked = d.ranked_completions(start, end, limit=5)
+                self.assertEqual(
+                    ranked[:3],
+                    [('kissa', 100), ('kissoja', 70), ('kissassa', 50)])
+                self.assertEqual(
+                    ranked[3:], [('kissaa', 0), ('kissun', 0)])
+                self.assertEqual(
+                    len(d.ranked_completions(start, end)),
+                    end - start)
+                (start, end) = d.prefix_range('k')
+                self.assertEqual(
+                    d.ranked_completions(start, end, limit=2),
+                    [('koira', 1000), ('kissa', 100)])
+                # Big ranges keep their ranked completions, the result
+                # is the same as ranking the range from scratch:
+                ranked = d.ranked_completions(start, end)
+                self.assertEqual(len(ranked), hunspell_suggest.MAX_WORDS)
+                self.assertEqual(
+                    ranked[:4],
+                    [('koira', 1000), ('kissa', 100), ('kissoja', 70),
+                     ('kissassa', 50)])
+                self.assertEqual(
+                    ranked,
+                    [(word, frequency) for word, frequency in
+                     d.ranked_completions(start, end, limit=200)[
+                         :hunspell_suggest.MAX_WORDS]])
+                self.assertIn(
+                    (start, end, hunspell_suggest.MAX_WORDS),
+                    d._ranked_positions_cache) # pylint: disable=protected-access
+                self.assertEqual(d.ranked_completions(start, end), ranked)
+                h.init_dictionaries()
+                self.assertEqual(
+                    [word for word, _score in h.suggest('kis')[:3]],
+                    ['kissa', 'kissoja', 'kissassa'])
+            finally:
+                if xdg_data_home is None:
+                    del os.environ['XDG_DATA_HOME']
+                else:
+                    os.environ['XDG_DATA_HOME'] = xdg_data_home
+                d.load_dictionary()
+                h.init_dictionaries()
+        self.assertFalse(d.has_word_frequencies())
+
+    def test_fi_FI_background_loading(self) -> None:
+        # Make sure the dictionary is not loaded already:
+        hunspell_suggest.Dictionary._instances.pop( # pylint: disable=protected-access
+            (hunspell_suggest.Dictionary, 'fi_FI'), None)
+        loaded = threading.Event()
+        h = hunspell_suggest.Hunspell(())
+        h.set_dictionaries_loaded_callback(loaded.set)
+        h.set_dictionary_names(['fi_FI'], background=True)
+        self.assertTrue(loaded.wait(timeout=60))
+        self.assertFalse(h.is_loading())
+        self.assertEqual(h.suggest('kissa')[0], ('kissa', 0))
+
+    def test_load_dictionaries(self) -> None:
+        for name in ('fi_FI', 'None'):
+            hunspell_suggest.Dictionary._instances.pop( # pylint: disable=protected-access
+                (hunspell_suggest.Dictionary, name), None)
+        self.assertEqual(
+            sorted(dictionary.name for dictionary in
+                   hunspell_suggest.load_dictionaries(['fi_FI', 'None', 'fi_FI'])),
+            ['None', 'fi_FI'])
+        self.assertTrue(hunspell_suggest.Dictionary.is_loaded('fi_FI'))
+        self.assertTrue(hunspell_suggest.Dictionary.is_loaded('None'))
+        # Already loaded dictionaries are not loaded again:
+        self.assertEqual(
+            list(hunspell_suggest.load_dictionaries(['fi_FI', 'None'])), [])
+
+    def test_fi_FI_wordlist_cache(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        keep = itb_util_core.ACCENT_LANGUAGES['fi']
+        (dic_path,
+         encoding,
+         words) = itb_util_core.get_hunspell_dictionary_wordlist('fi_FI')
+        stripped_words = [
+            itb_util_core.remove_accents(word, keep=keep) for word in words]
+        max_word_len = max(len(word) for word in words)
+        # The first call may write the cache, the second call
+        # reads it:
+        for _ in range(2):
+            self.assertEqual(
+                itb_util_core.get_hunspell_dictionary_wordlist_cached(
+                    'fi_FI', keep=keep),
+                (dic_path, encoding, words, stripped_words, max_word_len))
+        self.assertIsNotNone(
+            itb_util_core.read_wordlist_cache(dic_path, keep))
+        self.assertIsNone(
+            itb_util_core.read_wordlist_cache(dic_path, 'xyz'))
+        # If the cache directory cannot be created, the word list is
+        # read without the cache:
+        not_a_directory = os.path.join(self._cache_tempdir.name, 'file')
+        with open(not_a_directory, 'w', encoding='UTF-8') as file:
+            file.write('')
+        os.environ['XDG_CACHE_HOME'] = not_a_directory
+        self.assertIsNone(itb_util_core.read_wordlist_cache(dic_path, keep))
+        self.assertEqual(
+            itb_util_core.get_hunspell_dictionary_wordlist_cached(
+                'fi_FI', keep=keep),
+            (dic_path, encoding, words, stripped_words, max_word_len))
+
+    def test_fi_FI_suggest_deadline(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        expected = h.suggest('kissam')
+        ready = threading.Event()
+        h.set_suggestions_ready_callback(lambda _input_phrase: ready.set())
+        h.set_suggest_deadline(0.0)
+        result = h.suggest('kissam')
+        # Completions are always returned immediately:
+        self.assertEqual(
+            [x for x in result if x[1] == 0],
+            [x for x in expected if x[1] == 0])
+        if result != expected:
+            # Spelling suggestions were not ready within the deadline:
+            self.assertTrue(ready.wait(timeout=10))
+        self.assertEqual(h.suggest('kissam'), expected)
+        # After the dictionaries changed, the finished job is not
+        # reused, a new one is submitted:
+        jobs = len(h._suggest_jobs) # pylint: disable=protected-access
+        h.set_correction_index_names([])
+        h.suggest('kissam')
+        self.assertEqual(len(h._suggest_jobs), jobs + 1) # pylint: disable=protected-access
+        h.cancel_suggestions()
+        h.set_suggest_deadline(None)
+        self.assertEqual(h.suggest('kissam'), expected)
+
+    def test_fi_FI_slow_suggest_does_not_block(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        class SlowBackend():
+            '''Stands in for a voikko object with very slow suggestions'''
+            def spell(self, _word: str) -> bool:
+                return False
+            def suggest(self, _word: str) -> List[str]:
+                time.sleep(0.5)
+                return []
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        d = hunspell_suggest.Dictionary('fi_FI')
+        saved_backends = (d.voikko, d._suggest_backend) # pylint: disable=protected-access
+        d.voikko = SlowBackend()
+        d._suggest_backend = (None, None, SlowBackend()) # pylint: disable=protected-access
+        try:
+            h.set_suggest_deadline(0.05)
+            for input_phrase in ('kisxaa', 'kisxab', 'kisxac'):
+                start_time = time.monotonic()
+                h.suggest(input_phrase)
+                # The spellcheck of the input does not wait for the
+                # slow suggestions computed in the thread:
+                self.assertLess(time.monotonic() - start_time, 0.3)
+            h.cancel_suggestions()
+            h.set_suggest_deadline(None)
+            h._suggest_executor.shutdown(wait=True) # pylint: disable=protected-access
+        finally:
+            (d.voikko, d._suggest_backend) = saved_backends # pylint: disable=protected-access
+
+    def test_correction_index(self) -> None:
+        index = hunspell_suggest.CorrectionIndex(
+            ['kissa', 'kissat', 'koira', 'talo', 'Talvi'])
+        index.build()
+        self.assertEqual(
+            index.corrections('ksisa'), ['kissa', 'koira', 'kissat'])
+        self.assertEqual(index.corrections('KOIRA'), ['koira'])
+        self.assertEqual(index.corrections('talvi'), ['Talvi', 'talo'])
+        self.assertEqual(index.corrections('xyzzy'), [])
+        self.assertEqual(hunspell_suggest.edit_distance('abcd', 'acbd', 2), 1)
+        self.assertEqual(hunspell_suggest.edit_distance('abcd', 'dcba', 2), 3)
+
+    def test_fi_FI_correction_index(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        h.set_correction_index_names(['fi_FI'])
+        self.assertEqual(h.get_correction_index_names(), ['fi_FI'])
+        d = hunspell_suggest.Dictionary('fi_FI')
+        self.assertIsNotNone(d.correction_index)
+        suggestions = h.suggest('kisssa')
+        self.assertIn('kissa', [x[0] for x in suggestions if x[1] < 0])
+        # The second time the index is read from the cache:
+        index = d.correction_index
+        d.correction_index = None
+        d.load_correction_index()
+        self.assertIsNotNone(d.correction_index)
+        if index is not None and d.correction_index is not None:
+            self.assertEqual(
+                index.index_arrays(), d.correction_index.index_arrays())
+        h.set_correction_index_names([])
+        self.assertEqual(h.get_correction_index_names(), [])
+
+    def test_fi_FI_compact_storage(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        d = hunspell_suggest.Dictionary('fi_FI')
+        queries = ('k', 'kissa', 'pää', 'paa', 'ö', 'xyzzy', '')
+        words = list(d.words)
+        word_pairs = list(d.word_pairs)
+        completions = [d.completions(query) for query in queries]
+        suggestions = h.suggest('kissa')
+        memory = d.memory_usage()
+        try:
+            h.set_compact_storage(True)
+            self.assertIsInstance(d.words, hunspell_suggest.PermutedWordList)
+            self.assertLess(d.memory_usage(), memory / 4)
+            self.assertEqual(list(d.words), words)
+            self.assertEqual(d.words[1234], words[1234])
+            self.assertEqual(list(d.word_pairs), word_pairs)
+            self.assertEqual(
+                [d.completions(query) for query in queries], completions)
+            h._suggest.cache_clear() # pylint: disable=protected-access
+            self.assertEqual(h.suggest('kissa'), suggestions)
+        finally:
+            h.set_compact_storage(False)
+        self.assertIsInstance(d.words, list)
+        self.assertEqual(d.words, words)
+        self.assertLessEqual(d.memory_usage(), memory)
+
+    def test_fi_FI_spellcheck_cache(self) -> None:
+        # dictionary file is included in ibus-typing-booster
+        d = hunspell_suggest.Dictionary('fi_FI')
+        d.spellcheck_cache_clear()
+        results = d.spellcheck_many(['kissa', 'kisssa', 'kissa'])
+        self.assertEqual(list(results), ['kissa', 'kisssa'])
+        self.assertEqual(d.spellcheck('kissa'), results['kissa'])
+        self.assertEqual(d.spellcheck_cache_info()['hits'], 1)
+        self.assertEqual(d.spellcheck_cache_info()['misses'], 2)
+        self.assertEqual(d.spellcheck_cache_info()['size'], 2)
+        h = hunspell_suggest.Hunspell(['fi_FI'])
+        match_lists = h.spellcheck_match_list_many(['kissa', 'kisssa', ' '])
+        self.assertEqual(
+            match_lists,
+            {phrase: h.spellcheck_match_list(phrase)
+             for phrase in ('kissa', 'kisssa', ' ')})
+        # Reloading the dictionary invalidates the cache:
+        d.load_dictionary()
+        self.assertEqual(
+            d.spellcheck_cache_info(),
+            {'hits': 0, 'misses': 0, 'size': 0,
+             'maxsize': hunspell_suggest.SPELLCHECK_CACHE_SIZE})
+
     @unittest.skipUnless(
         testutils.get_libvoikko_version() >= '4.3',
         "Skipping, requires python3-libvoikko version >= 4.3.")
@@ -31,8 +31,11 @@ import sys
 import os
 import gzip
 import tempfile
+import sqlite3
+import threading
 import logging
 import unittest
+from unittest import mock
 
 LOGGER = logging.getLogger('ibus-typing-booster')
 
@@ -102,8 +105,10 @@ class TabSqliteDbTestCase(unittest.TestCase):
     def init_database(
             self,
             user_db_file: str = ':memory:',
-            dictionary_names: Iterable[str] = ('en_US',)) -> None:
-        self.database = tabsqlitedb.TabSqliteDb(user_db_file=user_db_file)
+            dictionary_names: Iterable[str] = ('en_US',),
+            ngram_model: bool = False) -> None:
+        self.database = tabsqlitedb.TabSqliteDb(
+            user_db_file=user_db_file, ngram_model=ngram_model)
         self.database.hunspell_obj.set_dictionary_names(
             list(dictionary_names))
 
@@ -190,6 +195,727 @@ class TabSqliteDbTestCase(unittest.TestCase):
     def test_dummy(self) -> None:
         self.assertEqual(True, True)
 
+    def test_select_words_prefix(self) -> None:
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        for (input_phrase, phrase, p_phrase, user_freq) in (
+                ('co', 'colour', 'green', 3),
+                ('col', 'colour', 'nice', 1),
+                ('co', 'cold', '', 1),
+                ('c', 'conspiracy', '', 5),
+                ('cp', 'cpu', '', 1),
+                ('co_', 'co_op', '', 1),
+                ('c%', 'c%', '', 1),
+                ('cô', 'côte', '', 2)):
+            self.database.add_phrase(
+                input_phrase=input_phrase, phrase=phrase,
+                p_phrase=p_phrase, user_freq=user_freq)
+        self.assertEqual(
+            [(candidate.phrase, candidate.user_freq)
+             for candidate in self.database.select_words('co')],
+            [('colour', 0.5), ('côte', 0.25), ('cold', 0.125), ('co_op', 0.125)])
+        self.assertEqual(
+            [(candidate.phrase, candidate.user_freq)
+             for candidate in self.database.select_words('co', p_phrase='green')],
+            [('colour', 0.75), ('côte', 0.25), ('cold', 0.125), ('co_op', 0.125)])
+        # “_” and “%” are not wildcards:
+        self.assertEqual(
+            [candidate.phrase
+             for candidate in self.database.select_words('c_')], [])
+        self.assertEqual(
+            [candidate.phrase
+             for candidate in self.database.select_words('c%')], ['c%'])
+        self.assertEqual(
+            [candidate.phrase
+             for candidate in self.database.select_words('cp')], ['cpu'])
+
+    def test_pending_phrases(self) -> None:
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        self.database.add_phrase(
+            input_phrase='co', phrase='colour', p_phrase='green', user_freq=2)
+        for _ in range(3):
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='co', phrase='cold', p_phrase='nice')
+        self.database.check_phrase_and_update_frequency(
+            input_phrase='co', phrase='colour', p_phrase='green')
+        self.assertTrue(self.database.has_pending_phrases())
+        # Only the row added by add_phrase() has been written yet
+        # (number_of_rows_in_database() would write the pending
+        # phrases first):
+        self.assertEqual(
+            1,
+            self.database.database.execute(
+                'SELECT count(*) FROM user_db.phrases;').fetchone()[0])
+        self.assertTrue(self.database.has_pending_phrases())
+        # The pending phrases are used before they are written:
+        self.assertEqual(3, self.database.phrase_exists('cold'))
+        self.assertEqual(3, self.database.phrase_exists('colour'))
+        expected = [('cold', 0.5), ('colour', 0.5)]
+        self.assertEqual(
+            [(candidate.phrase, candidate.user_freq)
+             for candidate in self.database.select_words('co')], expected)
+        self.assertTrue(self.database.flush_pending_phrases())
+        self.assertFalse(self.database.has_pending_phrases())
+        self.assertEqual(
+            [(candidate.phrase, candidate.user_freq)
+             for candidate in self.database.select_words('co')], expected)
+        self.assertEqual(2, self.database.number_of_rows_in_database())
+        self.assertEqual(3, self.database.phrase_exists('cold'))
+        # Too many pending phrases are written immediately:
+        self.database.max_pending_phrases = 2
+        self.database.check_phrase_and_update_frequency(
+            input_phrase='co', phrase='cold', p_phrase='nice')
+        self.assertTrue(self.database.has_pending_phrases())
+        self.database.check_phrase_and_update_frequency(
+            input_phrase='co', phrase='cool', p_phrase='nice')
+        self.assertFalse(self.database.has_pending_phrases())
+        self.assertEqual(3, self.database.number_of_rows_in_database())
+        self.assertEqual(4, self.database.phrase_exists('cold'))
+        # Pending phrases which are too old are written immediately:
+        self.database.max_pending_seconds = 0.0
+        self.database.check_phrase_and_update_frequency(
+            input_phrase='co', phrase='cool', p_phrase='nice')
+        self.assertFalse(self.database.has_pending_phrases())
+        self.assertEqual(2, self.database.phrase_exists('cool'))
+        # Removed phrases are removed from the pending phrases as well:
+        self.database.max_pending_seconds = 60.0
+        self.database.check_phrase_and_update_frequency(
+            input_phrase='co', phrase='cool', p_phrase='nice')
+        self.assertTrue(self.database.remove_phrase(phrase='cool'))
+        self.assertFalse(self.database.has_pending_phrases())
+        self.assertEqual(0, self.database.phrase_exists('cool'))
+
+    def test_ngram_model(self) -> None:
+        databases = [
+            tabsqlitedb.TabSqliteDb(user_db_file=':memory:', ngram_model=False),
+            tabsqlitedb.TabSqliteDb(user_db_file=':memory:', ngram_model=True)]
+        for database in databases:
+            database.hunspell_obj.set_dictionary_names([])
+            database.add_phrase(
+                input_phrase='co', phrase='colour', p_phrase='green',
+                pp_phrase='nice', user_freq=2)
+            database.add_phrase(
+                input_phrase='co', phrase='colour', p_phrase='green',
+                pp_phrase='nice', user_freq=5) # ignored, already there
+            database.define_user_shortcut(
+                input_phrase='co', phrase='company')
+            for (input_phrase, phrase, p_phrase, pp_phrase) in (
+                    ('co', 'cold', 'green', 'nice'),
+                    ('col', 'colour', 'green', 'nice'),
+                    ('côt', 'côte', 'nice', ''),
+                    ('co', 'company', '', ''),
+                    ('cons', 'conspiracy', 'green', 'ugly'),
+                    ('cool', 'cool', 'green', 'nice')):
+                database.check_phrase_and_update_frequency(
+                    input_phrase=input_phrase, phrase=phrase,
+                    p_phrase=p_phrase, pp_phrase=pp_phrase)
+            database.flush_pending_phrases()
+            database.check_phrase_and_update_frequency(
+                input_phrase='co', phrase='cold', p_phrase='green',
+                pp_phrase='nice')
+            database.remove_phrase(phrase='cool')
+        for (input_phrase, p_phrase, pp_phrase) in (
+                ('c', '', ''),
+                ('co', 'green', ''),
+                ('co', 'green', 'nice'),
+                ('cô', 'nice', ''),
+                ('coo', 'green', 'nice'),
+                ('', 'green', 'nice')):
+            self.assertEqual(
+                databases[0].select_words(
+                    input_phrase, p_phrase=p_phrase, pp_phrase=pp_phrase),
+                databases[1].select_words(
+                    input_phrase, p_phrase=p_phrase, pp_phrase=pp_phrase))
+        for phrase in ('cold', 'colour', 'company', 'cool', 'côte'):
+            self.assertEqual(
+                databases[0].phrase_exists(phrase),
+                databases[1].phrase_exists(phrase))
+        self.assertEqual(2, databases[1].phrase_exists('cold'))
+        self.assertEqual(0, databases[1].phrase_exists('cool'))
+        self.assertEqual(
+            [candidate.phrase
+             for candidate in databases[1].select_words('', 'green', 'nice')],
+            ['colour', 'cold'])
+        databases[1].remove_all_phrases()
+        self.assertEqual([], databases[1].select_words('co'))
+
+    def test_select_cache(self) -> None:
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        self.database.add_phrase(
+            input_phrase='co', phrase='colour', p_phrase='green',
+            pp_phrase='nice', user_freq=1)
+        self.database.define_user_shortcut(input_phrase='cc', phrase='company')
+        self.database.select_cache_clear()
+        for input_phrase in ('c', 'co', 'col', 'cold', 'd'):
+            self.database.select_words(input_phrase)
+        self.database.select_words_empty_input('green', 'nice')
+        self.database.select_shortcuts('c')
+        info = self.database.select_cache_info()
+        self.assertEqual((0, 7, 7), (info['hits'], info['misses'], info['size']))
+        self.assertEqual(
+            ['colour'],
+            [candidate.phrase for candidate in self.database.select_words('co')])
+        self.assertEqual(1, self.database.select_cache_info()['hits'])
+        # Only the results for prefixes of the input “cold” and for
+        # the context are removed from the cache:
+        self.database.check_phrase_and_update_frequency(
+            input_phrase='cold', phrase='cold', p_phrase='green',
+            pp_phrase='nice')
+        self.assertEqual(1, self.database.select_cache_info()['size'])
+        self.assertEqual(
+            ['cold', 'colour'],
+            [candidate.phrase for candidate in self.database.select_words('co')])
+        self.assertEqual(
+            ['cold', 'colour'],
+            [candidate.phrase for candidate
+             in self.database.select_words_empty_input('green', 'nice')])
+        self.assertEqual(
+            ['company'],
+            [candidate.phrase for candidate
+             in self.database.select_shortcuts('c')])
+        info = self.database.select_cache_info()
+        self.assertEqual((1, 10, 4), (info['hits'], info['misses'], info['size']))
+        self.database.remove_phrase(phrase='cold')
+        self.assertEqual(0, self.database.select_cache_info()['size'])
+        self.assertEqual(
+            ['colour'],
+            [candidate.phrase for candidate in self.database.select_words('co')])
+
+    def test_read_training_data_in_chunks(self) -> None:
+        training_file = os.path.join(
+            os.path.dirname(__file__), 'the_road_not_taken.txt')
+        progress = []
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        self.assertTrue(self.database.read_training_data_from_file(
+            training_file,
+            progress_callback=lambda done, total: progress.append(
+                (done, total))))
+        rows = self.database.database.execute(
+            'SELECT input_phrase, phrase, p_phrase, pp_phrase, user_freq '
+            'FROM user_db.phrases ORDER BY id;').fetchall()
+        self.assertEqual(148, len(rows))
+        self.assertEqual(os.path.getsize(training_file), progress[-1][0])
+        self.assertEqual(os.path.getsize(training_file), progress[-1][1])
+        # Reading the same file in small chunks gives the same result:
+        chunk_ngrams = tabsqlitedb.TRAINING_CHUNK_NGRAMS
+        try:
+            tabsqlitedb.TRAINING_CHUNK_NGRAMS = 10
+            self.init_database(user_db_file=':memory:', dictionary_names=[])
+            self.assertTrue(
+                self.database.read_training_data_from_file(training_file))
+        finally:
+            tabsqlitedb.TRAINING_CHUNK_NGRAMS = chunk_ngrams
+        self.assertEqual(
+            sorted(rows),
+            sorted(self.database.database.execute(
+                'SELECT input_phrase, phrase, p_phrase, pp_phrase, user_freq '
+                'FROM user_db.phrases;').fetchall()))
+        # Reading it again doubles the frequencies:
+        self.assertTrue(
+            self.database.read_training_data_from_file(training_file))
+        self.assertEqual(
+            sorted(row[:4] + (2 * row[4],) for row in rows),
+            sorted(self.database.database.execute(
+                'SELECT input_phrase, phrase, p_phrase, pp_phrase, user_freq '
+                'FROM user_db.phrases;').fetchall()))
+
+    def test_read_training_data_from_files(self) -> None:
+        training_files = [
+            os.path.join(os.path.dirname(__file__), name)
+            for name in ('the_road_not_taken.txt', 'chant_d_automne.txt')]
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        for training_file in training_files:
+            self.assertTrue(
+                self.database.read_training_data_from_file(training_file))
+        rows = sorted(self.database.database.execute(
+            'SELECT input_phrase, phrase, p_phrase, pp_phrase, user_freq '
+            'FROM user_db.phrases;').fetchall())
+        # Counting in parallel in small chunks gives the same result:
+        for processes in (1, 2):
+            progress = []
+            self.init_database(user_db_file=':memory:', dictionary_names=[])
+            self.assertTrue(self.database.read_training_data_from_files(
+                training_files, processes=processes, chunk_bytes=100,
+                progress_callback=lambda done, total: progress.append(
+                    (done, total))))
+            self.assertEqual(
+                rows,
+                sorted(self.database.database.execute(
+                    'SELECT input_phrase, phrase, p_phrase, pp_phrase, '
+                    'user_freq FROM user_db.phrases;').fetchall()))
+            total_bytes = sum(os.path.getsize(name) for name in training_files)
+            self.assertEqual((total_bytes, total_bytes), progress[-1])
+        self.assertFalse(self.database.read_training_data_from_files(
+            [os.path.join(os.path.dirname(__file__), 'does_not_exist.txt')]))
+
+    def test_read_training_data_only_new(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            training_file = os.path.join(tempdir, 'sent.txt')
+            with open(training_file, 'w', encoding='UTF-8') as text_file:
+                text_file.write('Hello world\n')
+            self.init_database(user_db_file=':memory:', dictionary_names=[])
+            for _ in range(2):
+                self.assertTrue(self.database.read_training_data_from_files(
+                    [tempdir], processes=1, only_new=True))
+            self.assertEqual(
+                [('Hello', 1), ('world', 1)],
+                self.database.database.execute(
+                    'SELECT phrase, user_freq FROM user_db.phrases '
+                    'ORDER BY phrase;').fetchall())
+            # A changed file is read again:
+            with open(training_file, 'a', encoding='UTF-8') as text_file:
+                text_file.write('Hello\n')
+            self.assertTrue(self.database.read_training_data_from_files(
+                [tempdir], processes=1, only_new=True))
+            self.assertEqual(
+                [('Hello', 3), ('world', 2)],
+                self.database.database.execute(
+                    'SELECT phrase, sum(user_freq) FROM user_db.phrases '
+                    'GROUP BY phrase ORDER BY phrase;').fetchall())
+            # Deleting the learned data forgets the files as well:
+            self.assertTrue(self.database.remove_all_phrases())
+            self.assertTrue(self.database.read_training_data_from_files(
+                [tempdir], processes=1, only_new=True))
+            self.assertEqual(
+                3, self.database.database.execute(
+                    'SELECT sum(user_freq) FROM user_db.phrases;').fetchone()[0])
+
+    def test_cleanup_database(self) -> None:
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        rows = [(f'input{index}', f'phrase{index}', '', '', 1, 100.0 + index)
+                for index in range(15)]
+        rows.append(('old', 'old', '', '', 6, 1.0))
+        with self.database.transaction():
+            self.database.database.executemany(
+                'INSERT INTO user_db.phrases (input_phrase, phrase, '
+                'p_phrase, pp_phrase, user_freq, timestamp) '
+                'VALUES (?, ?, ?, ?, ?, ?);', rows)
+        self.database.define_user_shortcut(
+            input_phrase='shortcut', phrase='shortcut expansion')
+        max_rows = tabsqlitedb.CLEANUP_MAX_ROWS
+        try:
+            tabsqlitedb.CLEANUP_MAX_ROWS = 10
+            self.database.cleanup_database(thread=False)
+        finally:
+            tabsqlitedb.CLEANUP_MAX_ROWS = max_rows
+        result = {
+            row[0]: (row[1], row[2])
+            for row in self.database.database.execute(
+                'SELECT phrase, user_freq, timestamp '
+                'FROM user_db.phrases;').fetchall()}
+        # The rows with the lowest user_freq and the oldest timestamps
+        # are deleted:
+        self.assertEqual(
+            sorted([f'phrase{index}' for index in range(6, 15)] + ['old']),
+            sorted(result))
+        # The oldest row is decayed:
+        self.assertEqual(3, result['old'][0])
+        self.assertGreater(result['old'][1], 1.0)
+        # The shortcut is kept:
+        self.assertEqual(
+            [('shortcut', 'shortcut expansion')],
+            self.database.list_user_shortcuts())
+
+    def test_database_threads(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            self.init_database(
+                user_db_file=os.path.join(tempdir, 'user.db'),
+                dictionary_names=[], ngram_model=True)
+            results_ready = threading.Event()
+            self.database.set_results_ready_callback(results_ready.set)
+            self.database.set_use_threads(True)
+            for phrase in ('colour', 'cold', 'colour'):
+                self.database.check_phrase_and_update_frequency(
+                    input_phrase=phrase, phrase=phrase)
+            # Written in the writer thread, but already counted:
+            self.assertTrue(
+                self.database.flush_pending_phrases(background=True))
+            self.assertEqual(2, self.database.phrase_exists('colour'))
+            # Wait for the writer thread:
+            self.assertTrue(self.database.flush_pending_phrases())
+            # Changing the database with a different connection makes
+            # the n-gram model stale, it is reloaded in the reader
+            # thread and the database is used directly in the mean time:
+            self.database.cleanup_database(thread=True)
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='cold', phrase='cold')
+            candidates = self.database.select_words('co')
+            self.assertEqual(['cold', 'colour'],
+                             sorted(x.phrase for x in candidates))
+            self.assertTrue(results_ready.wait(timeout=10))
+            self.database.collect_background_results()
+            self.assertEqual(candidates, self.database.select_words('co'))
+            self.assertEqual(2, self.database.phrase_exists('cold'))
+            self.database.set_use_threads(False)
+            self.database.flush_pending_phrases()
+            self.assertEqual(
+                [('cold', 2), ('colour', 2)],
+                self.database.database.execute(
+                    'SELECT phrase, user_freq FROM user_db.phrases '
+                    'ORDER BY phrase;').fetchall())
+
+    def test_failed_writes_are_retried(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            self.init_database(
+                user_db_file=os.path.join(tempdir, 'user.db'),
+                dictionary_names=[], ngram_model=True)
+            failing_write = mock.patch.object(
+                tabsqlitedb.TabSqliteDb, '_write_pending_phrases',
+                side_effect=sqlite3.OperationalError('database is locked'))
+            # Writing in the main thread fails:
+            for phrase in ('colour', 'cold', 'colour'):
+                self.database.check_phrase_and_update_frequency(
+                    input_phrase=phrase, phrase=phrase)
+            with failing_write:
+                self.assertFalse(self.database.flush_pending_phrases())
+            self.assertTrue(self.database.has_pending_phrases())
+            self.assertEqual(2, self.database.phrase_exists('colour'))
+            # Writing in the writer thread fails:
+            self.database.set_use_threads(True)
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='cold', phrase='cold')
+            with failing_write:
+                self.assertTrue(
+                    self.database.flush_pending_phrases(background=True))
+                self.database._wait_for_writer()
+            self.assertEqual(2, self.database.phrase_exists('cold'))
+            # The next flush retries the increments:
+            self.assertTrue(self.database.flush_pending_phrases())
+            self.assertFalse(self.database.has_pending_phrases())
+            self.assertEqual(2, self.database.phrase_exists('cold'))
+            self.assertEqual(
+                [('cold', 2), ('colour', 2)],
+                self.database.database.execute(
+                    'SELECT phrase, user_freq FROM user_db.phrases '
+                    'ORDER BY phrase;').fetchall())
+            self.database.set_use_threads(False)
+
+    def test_changes_by_other_connections(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            user_db_file = os.path.join(tempdir, 'user.db')
+            self.init_database(
+                user_db_file=user_db_file,
+                dictionary_names=[], ngram_model=True)
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='colour', phrase='colour')
+            self.database.flush_pending_phrases()
+            self.assertEqual(
+                ['colour'],
+                [x.phrase for x in self.database.select_words('co')])
+            # For example “Delete learned data” in the setup tool:
+            other_database = tabsqlitedb.TabSqliteDb(user_db_file=user_db_file)
+            other_database.remove_all_phrases()
+            self.assertEqual([], self.database.select_words('col'))
+            other_database.check_phrase_and_update_frequency(
+                input_phrase='cold', phrase='cold')
+            other_database.flush_pending_phrases()
+            self.assertEqual(
+                ['cold'],
+                [x.phrase for x in self.database.select_words('cold')])
+            # Also noticed when the writer thread has committed as well:
+            results_ready = threading.Event()
+            self.database.set_results_ready_callback(results_ready.set)
+            self.database.set_use_threads(True)
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='colour', phrase='colour')
+            self.assertTrue(self.database.flush_pending_phrases())
+            other_database.remove_phrase(phrase='cold')
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='cool', phrase='cool')
+            self.assertTrue(
+                self.database.flush_pending_phrases(background=True))
+            self.assertTrue(self.database.flush_pending_phrases())
+            self.assertEqual(
+                ['colour', 'cool'],
+                sorted(x.phrase for x in self.database.select_words('c')))
+            self.assertTrue(results_ready.wait(timeout=10))
+            self.database.collect_background_results()
+            self.assertEqual(
+                ['colour', 'cool'],
+                sorted(x.phrase for x in self.database.select_words('co')))
+            self.database.set_use_threads(False)
+            other_database.database.close()
+            self.database.database.close()
+
+    def test_select_cache_changes_by_other_connections(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            user_db_file = os.path.join(tempdir, 'user.db')
+            self.init_database(user_db_file=user_db_file, dictionary_names=[])
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='colour', phrase='colour')
+            self.database.flush_pending_phrases()
+            self.assertEqual(
+                ['colour'],
+                [x.phrase for x in self.database.select_words('co')])
+            self.assertEqual([], self.database.select_shortcuts('x'))
+            other_database = tabsqlitedb.TabSqliteDb(user_db_file=user_db_file)
+            self.assertTrue(other_database.define_user_shortcut(
+                input_phrase='xmpl', phrase='example'))
+            self.assertEqual(
+                ['example'],
+                [x.phrase for x in self.database.select_shortcuts('x')])
+            self.assertTrue(other_database.remove_phrase(phrase='example'))
+            self.assertEqual([], self.database.select_shortcuts('x'))
+            other_database.remove_all_phrases()
+            self.assertEqual([], self.database.select_words('co'))
+            other_database.database.close()
+            self.database.database.close()
+
+    def test_migrate_database(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            user_db_file = os.path.join(tempdir, 'user.db')
+            database = sqlite3.connect(user_db_file)
+            database.executescript('''
+            CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT,
+            phrase TEXT, p_phrase TEXT, pp_phrase TEXT, user_freq INTEGER,
+            timestamp REAL);
+            CREATE TABLE desc (name PRIMARY KEY, value);
+            INSERT INTO desc VALUES ('version', '0.65');
+            INSERT INTO phrases VALUES (1, 'co', 'cold', '', '', 1, 1.0);
+            INSERT INTO phrases VALUES (2, 'co', 'colour', 'green', '', 2, 2.0);
+            INSERT INTO phrases VALUES (3, 'co', 'cold', '', '', 3, 3.0);
+            ''')
+            database.commit()
+            database.close()
+            self.init_database(user_db_file=user_db_file, dictionary_names=[])
+            self.assertEqual(
+                tabsqlitedb.USER_DATABASE_VERSION,
+                (self.database.get_database_desc(user_db_file)
+                 or {}).get('version'))
+            self.assertEqual(
+                [(1, 'co', 'cold', '', '', 4, 3.0),
+                 (2, 'co', 'colour', 'green', '', 2, 2.0)],
+                self.database.database.execute(
+                    'SELECT * FROM user_db.phrases ORDER BY id;').fetchall())
+            # Learning updates the existing row:
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='co', phrase='cold')
+            self.assertTrue(self.database.flush_pending_phrases())
+            self.assertEqual(2, self.database.number_of_rows_in_database())
+            self.assertEqual(5, self.database.phrase_exists('cold'))
+            self.database.database.close()
+
+    def test_vocab(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            user_db_file = os.path.join(tempdir, 'user.db')
+            database = sqlite3.connect(user_db_file)
+            database.executescript('''
+            CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT,
+            phrase TEXT, p_phrase TEXT, pp_phrase TEXT, user_freq INTEGER,
+            timestamp REAL);
+            CREATE UNIQUE INDEX phrases_index_ngram ON phrases
+            (input_phrase, phrase, p_phrase, pp_phrase);
+            CREATE TABLE desc (name PRIMARY KEY, value);
+            INSERT INTO desc VALUES ('version', '0.66');
+            INSERT INTO phrases VALUES (1, 'co', 'colour', 'green', 'nice', 1, 1.0);
+            INSERT INTO phrases VALUES (2, 'col', 'colour', 'green', '', 2, 2.0);
+            INSERT INTO phrases VALUES (3, 'gr', 'green', 'nice', '', 3, 3.0);
+            ''')
+            database.commit()
+            database.close()
+            self.init_database(user_db_file=user_db_file, dictionary_names=[])
+            # Each text is stored only once:
+            self.assertEqual(
+                ['', 'colour', 'green', 'nice'],
+                [row[0] for row in self.database.database.execute(
+                    'SELECT text FROM user_db.vocab ORDER BY text;')])
+            self.assertEqual(
+                [(1, 'co', 'colour', 'green', 'nice', 1, 1.0),
+                 (2, 'col', 'colour', 'green', '', 2, 2.0),
+                 (3, 'gr', 'green', 'nice', '', 3, 3.0)],
+                self.database.database.execute(
+                    'SELECT * FROM user_db.phrases ORDER BY id;').fetchall())
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='colo', phrase='colour', p_phrase='green')
+            self.assertTrue(self.database.flush_pending_phrases())
+            self.assertEqual(4, self.database.phrase_exists('colour'))
+            self.assertEqual(
+                ['colour'],
+                [candidate.phrase for candidate in self.database.select_words(
+                    'co', p_phrase='green')])
+            self.assertTrue(self.database.remove_phrase(phrase='colour'))
+            self.database.cleanup_database(thread=False)
+            # Texts not used anymore are removed by the cleanup:
+            self.assertEqual(
+                ['', 'green', 'nice'],
+                [row[0] for row in self.database.database.execute(
+                    'SELECT text FROM user_db.vocab ORDER BY text;')])
+            # Writes to the view store a NULL context as an empty text:
+            self.database.database.execute(
+                'UPDATE user_db.phrases SET p_phrase = NULL WHERE id = 3;')
+            self.database.database.commit()
+            self.assertEqual(
+                [(3, 'gr', 'green', '', '', 3, 3.0)],
+                self.database.database.execute(
+                    'SELECT * FROM user_db.phrases ORDER BY id;').fetchall())
+            # A NULL id in the n-grams does not keep the cleanup from
+            # removing the texts not used anymore:
+            self.database.database.execute(
+                'INSERT INTO user_db.ngrams (input_phrase, phrase_id, '
+                'p_phrase_id, pp_phrase_id, user_freq, timestamp) '
+                "VALUES ('gre', (SELECT id FROM user_db.vocab "
+                "WHERE text = 'green'), NULL, NULL, 1, 4.0);")
+            self.database.database.commit()
+            self.database.cleanup_database(thread=False)
+            self.assertEqual(
+                ['', 'green'],
+                [row[0] for row in self.database.database.execute(
+                    'SELECT text FROM user_db.vocab ORDER BY text;')])
+            self.database.database.close()
+
+    def test_shortcuts(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            user_db_file = os.path.join(tempdir, 'user.db')
+            database = sqlite3.connect(user_db_file)
+            database.executescript(f'''
+            CREATE TABLE phrases (id INTEGER PRIMARY KEY, input_phrase TEXT,
+            phrase TEXT, p_phrase TEXT, pp_phrase TEXT, user_freq INTEGER,
+            timestamp REAL);
+            CREATE TABLE desc (name PRIMARY KEY, value);
+            INSERT INTO desc VALUES ('version', '0.66');
+            INSERT INTO phrases VALUES (1, 'co', 'cold', '', '', 1, 1.0);
+            INSERT INTO phrases VALUES (2, 'btw', 'by the way', '', '',
+            {itb_util_core.SHORTCUT_USER_FREQ}, 2.0);
+            ''')
+            database.commit()
+            database.close()
+            self.init_database(user_db_file=user_db_file, dictionary_names=[])
+            # The shortcut has been moved out of the n-grams:
+            self.assertEqual(
+                [('co', 'cold')],
+                self.database.database.execute(
+                    'SELECT input_phrase, phrase '
+                    'FROM user_db.phrases;').fetchall())
+            self.assertEqual(
+                [('btw', 'by the way')], self.database.list_user_shortcuts())
+            self.assertTrue(self.database.define_user_shortcut(
+                input_phrase='BTC', phrase='bitcoin'))
+            self.assertEqual(
+                ['by the way'],
+                [candidate.phrase for candidate
+                 in self.database.select_shortcuts('bt')])
+            self.assertEqual(
+                ['bitcoin'],
+                [candidate.phrase for candidate
+                 in self.database.select_shortcuts('B')])
+            self.assertEqual([], self.database.select_shortcuts('c'))
+            # “%” and “_” are not wildcards:
+            self.assertEqual([], self.database.select_shortcuts('b%'))
+            self.assertEqual([], self.database.select_shortcuts('b_'))
+            self.assertTrue(self.database.define_user_shortcut(
+                input_phrase='b_w', phrase='b underscore w'))
+            self.assertEqual(
+                ['b underscore w'],
+                [candidate.phrase for candidate
+                 in self.database.select_shortcuts('b_')])
+            self.assertTrue(self.database.remove_phrase(phrase='b underscore w'))
+            self.assertTrue(self.database.check_shortcut_and_update_frequency(
+                input_phrase='btw', phrase='by the way'))
+            self.assertEqual(
+                itb_util_core.SHORTCUT_USER_FREQ + 1,
+                self.database.phrase_exists('by the way'))
+            self.assertTrue(self.database.remove_phrase(phrase='by the way'))
+            self.assertEqual(
+                [('BTC', 'bitcoin')], self.database.list_user_shortcuts())
+            self.database.database.close()
+
+    def test_query_stats(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            query_stats_file = os.path.join(tempdir, 'query-stats.json')
+            self.init_database(
+                user_db_file=os.path.join(tempdir, 'user.db'),
+                dictionary_names=[])
+            self.database.set_query_stats_file(query_stats_file)
+            for _ in range(3):
+                self.database.check_phrase_and_update_frequency(
+                    input_phrase='co', phrase='cold')
+            self.assertEqual(
+                ['cold'],
+                [candidate.phrase
+                 for candidate in self.database.select_words('co')])
+            self.database.sync_usrdb()
+            query_stats = tabsqlitedb.QueryStats()
+            self.assertTrue(query_stats.load(query_stats_file))
+            operations = list(query_stats.get().values())[0]
+            self.assertEqual(
+                3, operations['check_phrase_and_update_frequency']['count'])
+            self.assertEqual(1, operations['select_words']['count'])
+            self.assertEqual(1, operations['select_words']['rows'])
+            self.assertEqual(1, operations['flush_pending_phrases']['count'])
+            self.assertEqual(1, operations['flush_pending_phrases']['rows'])
+            self.assertTrue(operations['wal_checkpoint']['count'] > 0)
+            self.assertTrue(
+                tabsqlitedb.QueryStats.percentile(
+                    operations['select_words'], 99)
+                <= operations['select_words']['max_seconds'])
+            # Disabling saves the statistics, nothing is recorded after that:
+            self.database.select_words('c')
+            self.database.set_query_stats_file('')
+            self.database.select_words('co')
+            query_stats = tabsqlitedb.QueryStats()
+            self.assertTrue(query_stats.load(query_stats_file))
+            operations = list(query_stats.get().values())[0]
+            self.assertEqual(2, operations['select_words']['count'])
+            self.database.database.close()
+
+    def test_mmap_size_and_prewarm(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            self.init_database(
+                user_db_file=os.path.join(tempdir, 'user.db'),
+                dictionary_names=[])
+            self.assertEqual(
+                tabsqlitedb.MMAP_SIZE,
+                self.database.database.execute(
+                    'PRAGMA user_db.mmap_size;').fetchone()[0])
+            self.database.check_phrase_and_update_frequency(
+                input_phrase='co', phrase='cold')
+            self.database.define_user_shortcut(
+                input_phrase='btw', phrase='by the way')
+            self.database.set_mmap_size(0)
+            self.assertEqual(
+                0,
+                self.database.database.execute(
+                    'PRAGMA user_db.mmap_size;').fetchone()[0])
+            self.assertTrue(self.database.prewarm_database(background=False))
+            self.database.set_use_threads(True)
+            self.assertTrue(self.database.prewarm_database())
+            self.database.set_use_threads(False)
+            self.assertEqual(
+                ['cold'],
+                [candidate.phrase
+                 for candidate in self.database.select_words('co')])
+            self.database.database.close()
+
+    def test_select_words_ngrams(self) -> None:
+        self.init_database(user_db_file=':memory:', dictionary_names=[])
+        for (input_phrase, phrase, p_phrase, pp_phrase, user_freq) in (
+                ('colou', 'colour', 'green', 'nice', 1),
+                ('col', 'colour', 'yellow', 'ugly', 2),
+                ('co', 'colour', 'green', 'awesome', 1),
+                ('co', 'cold', '', '', 1),
+                ('conspirac', 'conspiracy', '', '', 5),
+                ('conspi', 'conspiracy', '', '', 1),
+                ('c', 'conspiracy', '', '', 1)):
+            self.database.add_phrase(
+                input_phrase=input_phrase, phrase=phrase,
+                p_phrase=p_phrase, pp_phrase=pp_phrase, user_freq=user_freq)
+        unigram = {'colour': 4/11, 'cold': 1/11, 'conspiracy': 6/11}
+        bigram = dict(unigram, colour=0.5*2/2 + 0.5*unigram['colour'])
+        trigram = dict(bigram, colour=0.5*1/1 + 0.5*bigram['colour'])
+        for (p_phrase, pp_phrase, expected) in (
+                ('', '', unigram),
+                ('green', '', bigram),
+                ('green', 'ugly', bigram),
+                ('green', 'nice', trigram),
+                ('blue', 'nice', unigram)):
+            candidates = self.database.select_words(
+                'co', p_phrase=p_phrase, pp_phrase=pp_phrase)
+            self.assertEqual(
+                [candidate.phrase for candidate in candidates],
+                sorted(expected, key=lambda phrase: -expected[phrase]))
+            for candidate in candidates:
+                self.assertAlmostEqual(
+                    candidate.user_freq, expected[candidate.phrase])
+
     @unittest.skipUnless(
         itb_util_core.get_hunspell_dictionary_wordlist('en_US')[0],
         'Skipping because no en_US hunspell dictionary could be found.')